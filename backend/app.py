@@ -20,6 +20,9 @@ from flask_bcrypt import Bcrypt
 from routes.users import users_bp
 from datetime import timedelta
 from flask_mail import Mail
+from query_stats import init_query_stats
+from outbox import init_outbox_dispatcher
+from reminders import init_reminder_dispatcher
 
 
 app = Flask(__name__)
@@ -39,7 +42,9 @@ login_manager.login_view = 'auth.login'
 def load_user(user_id):
     return Actor.query.get(int(user_id))
 # Setup CORS properly - this is critical to fix the error
-CORS(app, supports_credentials=True, origins=["http://localhost:3000"], methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"])
+CORS(app, supports_credentials=True, origins=["http://localhost:3000"], methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"],
+     # Read by the frontend: change feed watermark and conditional GET tag
+     expose_headers=["X-Task-Watermark", "ETag"])
  
 # Remove or comment out this section as it's redundant
 # CORS(app, resources={
@@ -72,6 +77,13 @@ app.register_blueprint(users_bp, url_prefix='/users')
 # Initialize the email thread
 init_app(app)
 
+# Deliver queued notifications and due task reminders in the background
+init_outbox_dispatcher(app)
+init_reminder_dispatcher(app)
+
+# Query count / DB time headers in debug mode
+init_query_stats(app)
+
 # Mail settings
 app.config['MAIL_SERVER'] = 'smtp.gmail.com'  # Or your mail server
 app.config['MAIL_PORT'] = 587
@@ -0,0 +1,47 @@
+"""
+Microbenchmark for rendering email bodies through the template registry.
+
+Renders the reminder body for many recipients three ways:
+- compiling the template source for every email (what rendering without a
+  registry costs),
+- the registry, one render_email call per recipient,
+- the registry, one render_email_batch call for all recipients.
+
+Run it directly: python bench_email_templates.py [recipient_count]
+"""
+
+import sys
+import os
+import time
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from email_templates import registry, render_email, render_email_batch, EMAIL_TEMPLATE_DIR
+
+TEMPLATE = 'task_reminder.txt'
+
+
+def run(recipient_count):
+    contexts = [{'task': f'Task {i} for Customer {i % 50}', 'due_today': i % 2 == 0} for i in range(recipient_count)]
+    with open(os.path.join(EMAIL_TEMPLATE_DIR, TEMPLATE)) as f:
+        source = f.read()
+
+    runs = (
+        ('compile per email', lambda: [registry.environment.from_string(source).render(context) for context in contexts]),
+        ('render_email()', lambda: [render_email(TEMPLATE, **context) for context in contexts]),
+        ('render_email_batch()', lambda: render_email_batch(TEMPLATE, contexts)),
+    )
+    print(f"Rendering {TEMPLATE} for {recipient_count} recipients")
+    results = []
+    for label, fn in runs:
+        started = time.perf_counter()
+        bodies = fn()
+        elapsed = time.perf_counter() - started
+        results.append(bodies)
+        print(f"{label:<22} {elapsed * 1000:>9.1f}ms")
+    assert all(bodies == results[0] for bodies in results), "renderings differ"
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
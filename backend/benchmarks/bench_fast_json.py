@@ -0,0 +1,110 @@
+"""
+Microbenchmark for the fast JSON response path of GET /tasks.
+
+Serializes the same task rows two ways:
+- baseline: one dictionary per row built by key lookups and isoformat calls,
+  encoded with jsonify (the previous implementation),
+- fast: the compiled row serializer from fast_json encoded with orjson (or the
+  standard library when orjson is not installed), with and without gzip.
+
+The rows are fetched once up front, so only serialization is timed.
+
+Run it directly: python bench_fast_json.py [task_count]
+"""
+
+import sys
+import os
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask, jsonify
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import fast_json
+from models import db, Actor, Task
+from routes.tasks import task_list_columns, serialize_task_rows, TASK_LIST_FIELDS
+
+REPEAT = 5
+
+
+def build_app(task_count):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(Actor(actor_id=1000, actor_name='Admin', mobile1='0', email_id='admin@example.com', role_id=11))
+        start = datetime(2024, 1, 1)
+        db.session.bulk_insert_mappings(Task, [{
+            'task_id': i,
+            'task_name': f'Task {i}',
+            'criticality': 'High',
+            'customer_name': f'Customer {i % 300}',
+            'customer_id': i % 300,
+            'duedate': (start + timedelta(days=i % 365)).date(),
+            'actor_id': 1000,
+            'assigned_to': 'Admin',
+            'reviewer': 'Reviewer',
+            'reviewer_id': 1000,
+            'status': 'WIP',
+            'reviewer_status': 'under_review',
+            'link': f'https://example.com/tasks/{i}',
+            'initiator': 'System',
+            'duration': 2.5,
+            'remarks': 'Follow-up with the client',
+            'assigned_timestamp': start + timedelta(minutes=i),
+        } for i in range(1, task_count + 1)])
+        db.session.commit()
+    return app
+
+
+def baseline_serialize(rows, fields):
+    """Previous implementation: mapping lookups and formatter calls per value"""
+    getters = [(name, TASK_LIST_FIELDS[name][0].key, TASK_LIST_FIELDS[name][1]) for name in fields]
+    response = []
+    for row in rows:
+        mapping = row._mapping
+        item = {}
+        for name, key, formatter in getters:
+            value = mapping[key]
+            item[name] = formatter(value) if formatter else value
+        response.append(item)
+    return response
+
+
+def best_of(fn):
+    timings = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def run(task_count):
+    app = build_app(task_count)
+    fields = list(TASK_LIST_FIELDS)
+    encoder = 'orjson' if fast_json.orjson is not None else 'json (orjson not installed)'
+
+    with app.app_context():
+        rows = Task.query.with_entities(*task_list_columns(fields)).all()
+
+    print(f"Serializing {task_count} tasks, all fields, encoder: {encoder}")
+    print(f"{'path':<22} {'time':>10} {'body':>14}")
+    with app.test_request_context('/tasks'):
+        elapsed, response = best_of(lambda: jsonify(baseline_serialize(rows, fields)))
+        print(f"{'jsonify(list of dict)':<22} {elapsed * 1000:>8.1f}ms {len(response.get_data()):>12,} B")
+
+        elapsed, response = best_of(lambda: fast_json.json_response(serialize_task_rows(rows, fields)))
+        print(f"{'fast':<22} {elapsed * 1000:>8.1f}ms {len(response.get_data()):>12,} B")
+
+    with app.test_request_context('/tasks', headers={'Accept-Encoding': 'gzip'}):
+        elapsed, response = best_of(lambda: fast_json.json_response(serialize_task_rows(rows, fields)))
+        print(f"{'fast + gzip':<22} {elapsed * 1000:>8.1f}ms {len(response.get_data()):>12,} B")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
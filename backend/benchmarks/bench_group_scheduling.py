@@ -0,0 +1,120 @@
+"""
+Benchmark for scheduling and sending a message to a large customer group.
+
+Fills a SQLite customers table with one group and queues a message for it:
+- row by row, an ORM object and a commit per recipient (how
+  send_custom_messages_to_group used to work),
+- with schedule_messages: chunked multi-row INSERTs in one transaction,
+  then the same again as a retried request would (all duplicates),
+- as a single group message (queue_group_message) that
+  expand_due_group_messages fans out when it is due, reading the members
+  from a streaming cursor. Scheduling and fan-out are timed separately, and
+  the peak Python memory of a fan-out is reported.
+
+Run it directly: python bench_group_scheduling.py [recipients]
+"""
+
+import sys
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, time as dtime
+
+from flask import Flask
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models import db, Customer, MessageQueue
+from routes.messages import (expand_due_group_messages, queue_group_message, schedule_messages,
+                             stream_group_recipients, MESSAGE_QUEUE_INSERT_CHUNK)
+
+GROUP_ID = 1
+SEND_DATE = date(2024, 1, 31)
+SEND_TIME = dtime(9, 0)
+MESSAGE = '<p>Monthly update</p>'
+
+
+def build_app(database_path, recipients):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.bulk_insert_mappings(Customer, [{
+            'customer_name': f'Customer {i}',
+            'email_id': f'customer{i}@example.com',
+            'mobile1': '0000000000',
+            'group_id': GROUP_ID,
+            'status': 'A',
+        } for i in range(recipients)])
+        db.session.commit()
+    return app
+
+
+def schedule_row_by_row():
+    recipients = [email_id for (email_id,) in db.session.query(Customer.email_id).filter_by(group_id=GROUP_ID)]
+    for email_id in recipients:
+        db.session.add(MessageQueue(message_des=MESSAGE, date=SEND_DATE, time=SEND_TIME, email_id=email_id,
+                                    status='Scheduled', priority=MessageQueue.PRIORITY_BULK))
+        db.session.commit()
+
+
+def schedule_in_bulk():
+    for recipients in stream_group_recipients(GROUP_ID):
+        schedule_messages(MESSAGE, [SEND_DATE], SEND_TIME, recipients)
+    db.session.commit()
+
+
+def schedule_group_message(message=MESSAGE):
+    queue_group_message(message, SEND_DATE, SEND_TIME, GROUP_ID)
+    db.session.commit()
+
+
+def fan_out():
+    expand_due_group_messages(datetime.combine(SEND_DATE, SEND_TIME), MessageQueue.PRIORITY_BULK)
+
+
+def measure(label, step):
+    started = time.perf_counter()
+    step()
+    elapsed = time.perf_counter() - started
+    rows = MessageQueue.query.filter(MessageQueue.email_id.isnot(None)).count()
+    print(f"{label:<28} {rows:>8} {elapsed:>9.2f}s")
+
+
+def run(recipients):
+    database = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+    database.close()
+    try:
+        app = build_app(database.name, recipients)
+        print(f"Queueing a message for a group of {recipients} customers, "
+              f"{MESSAGE_QUEUE_INSERT_CHUNK} rows per INSERT")
+        print(f"{'':<28} {'rows':>8} {'time':>10}")
+        with app.app_context():
+            for label, step in (('row by row', schedule_row_by_row), ('bulk insert', schedule_in_bulk)):
+                MessageQueue.query.delete()
+                db.session.commit()
+                measure(label, step)
+            # A retried request: every row is already queued and skipped
+            measure('bulk insert (resubmitted)', schedule_in_bulk)
+
+            MessageQueue.query.delete()
+            db.session.commit()
+            measure('group message: schedule', schedule_group_message)
+            measure('group message: fan-out', fan_out)
+
+            # Again under tracemalloc, which slows it down too much to time it
+            schedule_group_message('<p>Another update</p>')
+            tracemalloc.start()
+            fan_out()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"Peak memory during fan-out: {peak / 1024 / 1024:.1f} MiB")
+    finally:
+        os.unlink(database.name)
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
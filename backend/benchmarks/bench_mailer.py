@@ -0,0 +1,97 @@
+"""
+Benchmark for the pooled mailer against a local SMTP server.
+
+Starts an aiosmtpd server on localhost and sends the same messages three ways:
+- one connection per message (what every send function used to do),
+- the pooled mailer, one send() call per message,
+- the pooled mailer, a single send_batch() call,
+- the same batch through a mailer limited to RATE_LIMIT messages per second.
+
+Also checks that the mailer reconnects when the server drops its connection.
+
+Requires aiosmtpd (pip install aiosmtpd).
+
+Run it directly: python bench_mailer.py [message_count]
+"""
+
+import sys
+import os
+import smtplib
+import time
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    sys.exit("aiosmtpd is required: pip install aiosmtpd")
+
+from mailer import Mailer
+
+HOST = '127.0.0.1'
+PORT = 8025
+RATE_LIMIT = 200
+
+
+class CountingHandler:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return '250 Message accepted for delivery'
+
+
+def connection_per_message(mailer, messages):
+    for message in messages:
+        with smtplib.SMTP(HOST, PORT) as server:
+            server.send_message(message)
+
+
+def run(message_count):
+    handler = CountingHandler()
+    controller = Controller(handler, hostname=HOST, port=PORT)
+    controller.start()
+    try:
+        mailer = Mailer(HOST, PORT, None, None, 'prosync@example.com', use_tls=False)
+        messages = [
+            mailer.build_message(f'user{i}@example.com', f'Message {i}', 'Hello from the benchmark')
+            for i in range(message_count)
+        ]
+
+        print(f"Sending {message_count} messages to a local SMTP server")
+        runs = (
+            ('connection per message', lambda: connection_per_message(mailer, messages)),
+            ('pooled send()', lambda: [mailer.send(message) for message in messages]),
+            ('pooled send_batch()', lambda: mailer.send_batch(messages)),
+        )
+        for label, fn in runs:
+            before = handler.received
+            started = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - started
+            print(f"{label:<24} {elapsed * 1000:>8.1f}ms  ({handler.received - before} received)")
+
+        limited = Mailer(HOST, PORT, None, None, 'prosync@example.com', use_tls=False,
+                         rate_limit=RATE_LIMIT, burst=RATE_LIMIT // 10)
+        started = time.perf_counter()
+        limited.send_batch(messages)
+        elapsed = time.perf_counter() - started
+        print(f"{'rate limited send_batch()':<24} {elapsed * 1000:>8.1f}ms  "
+              f"({len(messages) / elapsed:.0f} msg/s, limit {RATE_LIMIT}/s)")
+        limited.close()
+
+        # Close the pooled connections behind the mailer's back, it must reconnect
+        with mailer._lock:
+            for connection, _ in mailer._idle:
+                connection.close()
+        results = mailer.send_batch(messages[:3])
+        print(f"after dropped connection: {sum(error is None for error in results)}/3 sent")
+        mailer.close()
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,126 @@
+"""
+Benchmark for message queue priority lanes.
+
+Starts an aiosmtpd sink on localhost that answers each message after a
+simulated remote-server delay, fills a SQLite message_queue with a group
+campaign that is already due and starts the email worker threads. While the
+campaign is being delivered, one message to a single recipient is scheduled:
+- in the high priority lane, where it has its own worker and connections,
+- in the bulk lane, behind the campaign (how every message used to be queued),
+and the time until the sink receives it is reported.
+
+Requires aiosmtpd (pip install aiosmtpd).
+
+Run it directly: python bench_message_lanes.py [campaign_size] [delay_ms]
+"""
+
+import sys
+import os
+import asyncio
+import tempfile
+import threading
+import time
+from datetime import date, datetime, time as dtime
+
+# The worker lanes build their mailers from the EMAIL_* settings at import
+HOST = '127.0.0.1'
+PORT = 8027
+os.environ.update(EMAIL_HOST=HOST, EMAIL_PORT=str(PORT), EMAIL_USE_TLS='false', EMAIL_HOST_USER='',
+                  EMAIL_FROM='prosync@example.com')
+
+from flask import Flask
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    sys.exit("aiosmtpd is required: pip install aiosmtpd")
+
+from models import db, MessageQueue
+from routes import messages
+
+
+class SlowSink:
+    """Accepts every message after a delay and records when each recipient got one"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.received_at = {}
+        self.arrived = threading.Event()
+        self.watch = None
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.delay)
+        for recipient in envelope.rcpt_tos:
+            self.received_at[recipient] = time.perf_counter()
+            if recipient == self.watch:
+                self.arrived.set()
+        return '250 Message accepted for delivery'
+
+
+def fill_campaign(campaign_size):
+    db.session.bulk_insert_mappings(MessageQueue, [{
+        'message_des': f'<p>Campaign message {i}</p>',
+        'date': date(2024, 1, 1),
+        'time': dtime(9, 0),
+        'email_id': f'customer{i}@example.com',
+        'status': 'Scheduled',
+        'priority': MessageQueue.PRIORITY_BULK,
+    } for i in range(campaign_size)])
+    db.session.commit()
+
+
+def measure(app, handler, recipient, priority, campaign_size):
+    with app.app_context():
+        fill_campaign(campaign_size)
+        # Bulk inserts skip the session hooks, wake the bulk worker by hand
+        messages.LANES_BY_PRIORITY[MessageQueue.PRIORITY_BULK].wakeup.set()
+        time.sleep(0.2)  # Let the campaign get going
+
+        handler.watch = recipient
+        handler.arrived.clear()
+        now = datetime.now()
+        started = time.perf_counter()
+        messages.schedule_messages('<p>Your one-off message</p>', [now.date()],
+                                   now.time().replace(microsecond=0), [recipient], priority=priority)
+        db.session.commit()
+        handler.arrived.wait(120)
+        latency = handler.received_at[recipient] - started
+
+        # Wait for the campaign to drain before the next run
+        while MessageQueue.query.filter(MessageQueue.status == 'Scheduled').count():
+            time.sleep(0.1)
+            db.session.remove()
+    return latency
+
+
+def run(campaign_size, delay_ms):
+    handler = SlowSink(delay_ms / 1000)
+    controller = Controller(handler, hostname=HOST, port=PORT)
+    controller.start()
+    database = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+    database.close()
+    try:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database.name}'
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+        db.init_app(app)
+        with app.app_context():
+            db.create_all()
+        messages.start_email_thread(app)
+
+        print(f"Campaign of {campaign_size} messages, {delay_ms}ms server delay per message")
+        for label, priority in (('high priority lane', MessageQueue.PRIORITY_HIGH),
+                                ('bulk lane', MessageQueue.PRIORITY_BULK)):
+            latency = measure(app, handler, f'{label.split()[0]}@example.com', priority, campaign_size)
+            print(f"{label:<20} one-off message delivered after {latency * 1000:>8.1f}ms")
+    finally:
+        controller.stop()
+        os.unlink(database.name)
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 20)
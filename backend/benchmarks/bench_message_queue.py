@@ -0,0 +1,107 @@
+"""
+Benchmark for message queue delivery throughput as concurrency grows.
+
+Starts an aiosmtpd sink on localhost that answers each message after a
+simulated remote-server delay, fills a SQLite message_queue with due
+messages and drains it with deliver_queued_messages at several concurrency
+levels, including the bulk status commits.
+
+Requires aiosmtpd (pip install aiosmtpd).
+
+Run it directly: python bench_message_queue.py [message_count] [delay_ms]
+"""
+
+import sys
+import os
+import asyncio
+import tempfile
+import time
+from datetime import date, datetime, time as dtime
+
+from flask import Flask
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    sys.exit("aiosmtpd is required: pip install aiosmtpd")
+
+from mailer import Mailer
+from models import db, MessageQueue
+from routes.messages import claim_due_messages, deliver_queued_messages, MESSAGE_QUEUE_BATCH_SIZE
+
+HOST = '127.0.0.1'
+PORT = 8026
+CONCURRENCY_LEVELS = (1, 2, 4, 8, 16)
+
+
+class SlowSink:
+    """Accepts every message after a delay, like a remote mail server"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.delay)
+        self.received += 1
+        return '250 Message accepted for delivery'
+
+
+def build_app(database_path, message_count):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.bulk_insert_mappings(MessageQueue, [{
+            'message_des': f'<p>Campaign message {i}</p>',
+            'date': date(2024, 1, 1),
+            'time': dtime(9, 0),
+            'email_id': f'customer{i}@example.com',
+            'status': 'Scheduled',
+        } for i in range(message_count)])
+        db.session.commit()
+    return app
+
+
+def drain(mailer, concurrency):
+    while True:
+        due = claim_due_messages(datetime.now(), MessageQueue.PRIORITY_BULK, MESSAGE_QUEUE_BATCH_SIZE)
+        if not due:
+            return
+        deliver_queued_messages(due, mailer=mailer, concurrency=concurrency)
+
+
+def run(message_count, delay_ms):
+    handler = SlowSink(delay_ms / 1000)
+    controller = Controller(handler, hostname=HOST, port=PORT)
+    controller.start()
+    database = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+    database.close()
+    try:
+        app = build_app(database.name, message_count)
+        print(f"Draining {message_count} messages, {delay_ms}ms server delay per message")
+        print(f"{'concurrency':>11} {'time':>10} {'msg/s':>10}")
+        with app.app_context():
+            for concurrency in CONCURRENCY_LEVELS:
+                MessageQueue.query.update({'status': 'Scheduled', 'claimed_by': None, 'lease_until': None})
+                db.session.commit()
+                mailer = Mailer(HOST, PORT, None, None, 'prosync@example.com',
+                                use_tls=False, pool_size=concurrency)
+                started = time.perf_counter()
+                drain(mailer, concurrency)
+                elapsed = time.perf_counter() - started
+                mailer.close()
+                sent = MessageQueue.query.filter_by(status='Sent').count()
+                print(f"{concurrency:>11} {elapsed:>9.2f}s {sent / elapsed:>10.1f}")
+    finally:
+        controller.stop()
+        os.unlink(database.name)
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 20)
@@ -0,0 +1,49 @@
+"""
+Microbenchmark for computing occurrence dates with the recurrence module.
+
+Computes one occurrence date for each of many (anchor, frequency, index)
+triples with every supported frequency mixed in, two ways:
+- occurrence_date() in a Python loop, one date at a time,
+- occurrence_dates(), one vectorized call over the whole arrays,
+and checks that both give the same dates.
+
+Run it directly: python bench_recurrence.py [date_count]
+"""
+
+import sys
+import os
+import time
+
+import numpy as np
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from recurrence import occurrence_date, occurrence_dates, FREQUENCY_DAYS, FREQUENCY_MONTHS
+
+FREQUENCIES = sorted(FREQUENCY_MONTHS) + sorted(FREQUENCY_DAYS)
+
+
+def run(date_count):
+    rng = np.random.default_rng(0)
+    anchors = np.datetime64('2024-01-01') + rng.integers(0, 3650, date_count)
+    frequencies = rng.choice(FREQUENCIES, date_count)
+    indexes = rng.integers(0, 12, date_count)
+    anchor_dates = anchors.tolist()
+
+    print(f"Computing {date_count} occurrence dates")
+    started = time.perf_counter()
+    looped = [occurrence_date(anchor, int(frequency), int(index))
+              for anchor, frequency, index in zip(anchor_dates, frequencies, indexes)]
+    elapsed = time.perf_counter() - started
+    print(f"{'occurrence_date() loop':<24} {elapsed * 1000:>9.1f}ms")
+
+    started = time.perf_counter()
+    vectorized = occurrence_dates(anchors, frequencies, indexes)
+    elapsed = time.perf_counter() - started
+    print(f"{'occurrence_dates()':<24} {elapsed * 1000:>9.1f}ms")
+    assert vectorized.tolist() == looped, "dates differ"
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
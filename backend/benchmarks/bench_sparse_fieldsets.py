@@ -0,0 +1,83 @@
+"""
+Benchmark for sparse fieldsets on GET /tasks.
+
+Builds an in-memory SQLite task table with wide remarks and compares the full
+task board response against a narrow fields= projection: bytes fetched from
+the database, bytes serialized into the response and request time.
+
+Run it directly: python bench_sparse_fieldsets.py [task_count]
+"""
+
+import sys
+import os
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models import db, Actor, Task
+from routes.tasks import tasks_bp, task_list_columns, TASK_LIST_FIELDS
+
+NARROW_FIELDS = ['id', 'title', 'status', 'due_date', 'assignee']
+REMARKS = "Follow-up notes from the client meeting. " * 50
+
+
+def build_app(task_count):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    app.register_blueprint(tasks_bp)
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(Actor(actor_id=1000, actor_name='Admin', mobile1='0', email_id='admin@example.com', role_id=11))
+        start = datetime(2024, 1, 1)
+        db.session.bulk_insert_mappings(Task, [{
+            'task_id': i,
+            'task_name': f'Task {i}',
+            'criticality': 'High',
+            'customer_name': f'Customer {i % 300}',
+            'duedate': (start + timedelta(days=i % 365)).date(),
+            'actor_id': 1000,
+            'assigned_to': 'Admin',
+            'reviewer': 'Reviewer',
+            'status': 'WIP',
+            'reviewer_status': 'under_review',
+            'link': f'https://example.com/tasks/{i}',
+            'initiator': 'System',
+            'duration': 2.5,
+            'remarks': REMARKS,
+            'assigned_timestamp': start + timedelta(minutes=i),
+        } for i in range(1, task_count + 1)])
+        db.session.commit()
+    return app
+
+
+def fetched_bytes(fields):
+    """Approximate payload read from the database for a projection"""
+    rows = Task.query.with_entities(*task_list_columns(fields)).all()
+    return sum(len(str(value)) for row in rows for value in row if value is not None)
+
+
+def run(task_count):
+    app = build_app(task_count)
+    client = app.test_client()
+    url = '/tasks?user_id=1000&role_id=11'
+
+    print(f"GET /tasks on {task_count} wide tasks")
+    print(f"{'fields':<10} {'fetched':>14} {'serialized':>14} {'time':>10}")
+    for label, fields in (('all', list(TASK_LIST_FIELDS)), ('narrow', NARROW_FIELDS)):
+        with app.app_context():
+            fetched = fetched_bytes(fields)
+        query = url if label == 'all' else f"{url}&fields={','.join(fields)}"
+        started = time.perf_counter()
+        response = client.get(query)
+        elapsed = time.perf_counter() - started
+        print(f"{label:<10} {fetched:>12,} B {len(response.data):>12,} B {elapsed * 1000:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
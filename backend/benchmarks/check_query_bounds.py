@@ -0,0 +1,90 @@
+"""
+Query bounds for the hot task endpoints.
+
+Runs GET /tasks (full board, a cursor page, review mode) and GET /tasks/changes
+against in-memory SQLite databases of two sizes inside ``max_queries`` (see
+query_stats.py). The limits do not depend on the number of tasks, so an N+1
+query added to one of these endpoints fails the check at the larger size.
+
+Run it directly: python check_query_bounds.py
+Exits with status 1 when an endpoint goes over its limit.
+"""
+
+import sys
+import os
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models import db, Actor, Task
+from query_stats import max_queries
+from routes.tasks import tasks_bp
+
+ADMIN_ID = 1000
+ASSIGNEES = 20
+# Endpoint, URL and most statements allowed: the ETag's table versions (board
+# only), actor lookup, tasks version and task query, and for the feed of a
+# single user the two removed-task lookups
+CHECKS = (
+    ('GET /tasks', f'/tasks?user_id={ADMIN_ID}&role_id=11', 4),
+    ('GET /tasks page', f'/tasks?user_id={ADMIN_ID}&role_id=11&limit=100', 4),
+    ('GET /tasks assignee', '/tasks?user_id=1&role_id=2', 4),
+    ('GET /tasks review', '/tasks?user_id=2&role_id=2&review_mode=true', 4),
+    ('GET /tasks/changes', f'/tasks/changes?user_id={ADMIN_ID}&role_id=11&since=0', 3),
+    ('GET /tasks/changes assignee', '/tasks/changes?user_id=1&role_id=2&since=0', 5),
+)
+
+
+def build_app(task_count):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    app.register_blueprint(tasks_bp)
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(Actor(actor_id=ADMIN_ID, actor_name='Admin', mobile1='0', email_id='admin@example.com', role_id=11))
+        for actor_id in range(1, ASSIGNEES + 1):
+            db.session.add(Actor(actor_id=actor_id, actor_name=f'Actor {actor_id}', mobile1='0',
+                                 email_id=f'actor{actor_id}@example.com', role_id=2))
+        db.session.commit()
+        start = datetime(2024, 1, 1)
+        for task_id in range(1, task_count + 1):
+            db.session.add(Task(task_id=task_id, task_name=f'Task {task_id}', status='WIP',
+                                actor_id=task_id % ASSIGNEES + 1, reviewer_id=(task_id + 1) % ASSIGNEES + 1,
+                                assigned_timestamp=start + timedelta(minutes=task_id)))
+        db.session.commit()
+        # Hand a few tasks over so the change feed has removals to report
+        for task in Task.query.filter(Task.actor_id == 1).limit(5):
+            task.actor_id = 3
+        db.session.commit()
+    return app
+
+
+def run():
+    failures = 0
+    for task_count in (100, 2000):
+        app = build_app(task_count)
+        client = app.test_client()
+        print(f"{task_count} tasks")
+        for label, url, limit in CHECKS:
+            with app.app_context():
+                try:
+                    with max_queries(limit) as stats:
+                        response = client.get(url)
+                except AssertionError as e:
+                    failures += 1
+                    print(f"  FAIL {label}: {e}")
+                    continue
+            status = 'ok' if response.status_code == 200 else f'HTTP {response.status_code}'
+            if response.status_code != 200:
+                failures += 1
+            print(f"  {status:<4} {label:<28} {stats.count} of at most {limit} queries")
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if run() else 0)
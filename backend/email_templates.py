@@ -0,0 +1,61 @@
+"""
+Registry of the email templates in templates/email.
+
+Every template is compiled once, when this module is imported at startup,
+instead of building the HTML with f-strings for each email. ``.html``
+templates are autoescaped; ``.txt`` templates are plain text. Templates whose
+name starts with an underscore are layouts that the others extend.
+
+``render_email`` renders one email. ``render_email_batch`` renders one
+template for many recipients, looking the compiled template up once and
+merging the values shared by every recipient into each context, for the
+reminder dispatcher and other bulk senders.
+"""
+
+import os
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+EMAIL_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'email')
+
+
+class TemplateRegistry:
+    def __init__(self, directory):
+        self.environment = Environment(
+            loader=FileSystemLoader(directory),
+            autoescape=select_autoescape(['html']),
+            # Block tags on their own line leave no blank line in plain text
+            trim_blocks=True,
+            lstrip_blocks=True,
+            # Templates are deployed with the code, never edited in place
+            auto_reload=False
+        )
+        self.templates = {
+            name: self.environment.get_template(name)
+            for name in self.environment.list_templates()
+        }
+
+    def get(self, name):
+        try:
+            return self.templates[name]
+        except KeyError:
+            raise ValueError(f"Unknown email template: {name}") from None
+
+    def render(self, name, **context):
+        return self.get(name).render(context)
+
+    def render_batch(self, name, contexts, **shared):
+        """Render name once per context; shared values are used for every context"""
+        template = self.get(name)
+        return [template.render(shared, **context) for context in contexts]
+
+
+registry = TemplateRegistry(EMAIL_TEMPLATE_DIR)
+
+
+def render_email(name, **context):
+    return registry.render(name, **context)
+
+
+def render_email_batch(name, contexts, **shared):
+    return registry.render_batch(name, contexts, **shared)
@@ -0,0 +1,177 @@
+"""
+Per-table change counters and conditional GET support.
+
+Every ORM write to a tracked table bumps that table's row in
+``table_versions``. List endpoints decorated with ``etag_cached`` derive a
+strong ETag from the versions of the tables they read and answer
+``If-None-Match`` with 304 Not Modified before running their query.
+
+Tables with a ``change_seq`` column (tasks) are bumped inside the writing
+transaction and their rows are stamped with the new version, which gives
+them the commit-ordered change sequence GET /tasks/changes relies on. The
+price is that the version row stays locked until the writer commits, so
+writes to that table are serialized, a long bulk PATCH included: a later
+writer must not get a lower number and commit first, or clients holding a
+newer watermark would never see its change.
+
+Other tracked tables only need a new ETag, so their counters are bumped
+after the commit in a short transaction of their own. A request served
+between the commit and the bump may still get a 304, and a bump lost to a
+crash leaves the old ETag until the next write to that table.
+
+Writes that bypass ORM flushes and ORM-enabled statements (raw SQL text,
+Core insert/update/delete on the table) are not versioned and must bump
+the counter themselves.
+"""
+
+import hashlib
+from functools import wraps
+
+from flask import request, make_response
+from sqlalchemy import event, update, insert, select
+from sqlalchemy.orm import Session
+
+from models import db, TableVersion
+
+# Tables whose changes invalidate cached list responses
+TRACKED_TABLES = {'actors', 'customers', 'activities', 'tasks'}
+
+_version_table = TableVersion.__table__
+
+
+def _bump_versions(connection, table_names):
+    """Increment the version of each table and return the new versions"""
+    versions = {}
+    for table_name in sorted(table_names):
+        result = connection.execute(
+            update(_version_table)
+            .where(_version_table.c.table_name == table_name)
+            .values(version=_version_table.c.version + 1)
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(_version_table).values(table_name=table_name, version=1))
+        versions[table_name] = connection.execute(
+            select(_version_table.c.version).where(_version_table.c.table_name == table_name)
+        ).scalar_one()
+    return versions
+
+
+def _is_sequenced(table):
+    """Tables with a change_seq column get their rows stamped with the table version"""
+    return 'change_seq' in table.c
+
+
+def _bump_after_commit(session, table_names):
+    """Note tables whose versions are bumped once the session commits"""
+    if table_names:
+        session.info.setdefault('changed_tables', set()).update(table_names)
+
+
+@event.listens_for(Session, 'before_flush')
+def _bump_changed_tables(session, flush_context, instances):
+    changed = {}
+    for obj in list(session.new) + list(session.dirty):
+        if obj in session.new or session.is_modified(obj, include_collections=False):
+            changed.setdefault(obj.__table__, []).append(obj)
+    for obj in session.deleted:
+        changed.setdefault(obj.__table__, [])
+
+    tracked = [table for table in changed if table.name in TRACKED_TABLES]
+    _bump_after_commit(session, [table.name for table in tracked if not _is_sequenced(table)])
+    sequenced = [table for table in tracked if _is_sequenced(table)]
+    if not sequenced:
+        return
+
+    versions = _bump_versions(session.connection(), [table.name for table in sequenced])
+    for table in sequenced:
+        for obj in changed[table]:
+            obj.change_seq = versions[table.name]
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _bump_bulk_writes(orm_execute_state):
+    """Track Query.update() / Query.delete() and ORM-enabled bulk statements"""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.local_table.name not in TRACKED_TABLES:
+        return
+
+    table_name = mapper.local_table.name
+    if not _is_sequenced(mapper.local_table):
+        _bump_after_commit(orm_execute_state.session, [table_name])
+        return
+    versions = _bump_versions(orm_execute_state.session.connection(), {table_name})
+    if orm_execute_state.is_update:
+        orm_execute_state.statement = orm_execute_state.statement.values(change_seq=versions[table_name])
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_committed_tables(session):
+    table_names = session.info.pop('changed_tables', None)
+    if not table_names:
+        return
+    try:
+        with session.get_bind().begin() as connection:
+            _bump_versions(connection, table_names)
+    except Exception as e:
+        # The data is committed; only cached responses stay valid until the next write
+        print(f"Error bumping table versions: {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_tables(session):
+    session.info.pop('changed_tables', None)
+
+
+def get_table_versions(table_names):
+    """Current version of each table, 0 for tables that were never written"""
+    rows = db.session.execute(
+        select(_version_table.c.table_name, _version_table.c.version)
+        .where(_version_table.c.table_name.in_(table_names))
+    ).all()
+    versions = dict.fromkeys(table_names, 0)
+    versions.update({row.table_name: row.version for row in rows})
+    return versions
+
+
+def compute_etag(table_names):
+    """Strong ETag for the current request given the tables it reads"""
+    versions = get_table_versions(table_names)
+    key = request.full_path + '|' + ','.join(f"{name}={versions[name]}" for name in sorted(versions))
+    # Gzipped and identity bodies are different representations
+    if request.accept_encodings['gzip'] > 0:
+        key += '|gzip'
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def etag_cached(*table_names):
+    """Serve a GET endpoint with an ETag derived from the given tables.
+
+    Returns 304 without calling the view when the client's If-None-Match
+    still matches; otherwise calls the view and tags successful responses.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                etag = compute_etag(table_names)
+            except Exception as e:
+                # Never fail the request because the version table is unavailable
+                print(f"Error computing ETag: {e}")
+                db.session.rollback()
+                return view(*args, **kwargs)
+
+            if request.if_none_match.contains(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            # Browsers must revalidate, which is cheap now
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,102 @@
+"""
+Fast JSON responses for large list endpoints.
+
+``jsonify`` goes through the standard library encoder and the list endpoints
+build one dictionary per row with a key lookup and a formatter call per
+column. For task boards with tens of thousands of rows that dominates the
+request time, so the hot list endpoints instead:
+
+- compile a row serializer once per request (``compile_row_serializer``) that
+  maps selected row tuples straight to response dictionaries by position and
+  only calls the formatters that are actually needed,
+- encode with orjson when it is installed (falling back to the standard
+  library encoder), which serializes dates and datetimes natively in ISO 8601,
+- gzip large bodies when the client accepts it.
+"""
+
+import gzip
+import json
+from datetime import date, datetime, time
+from operator import itemgetter
+
+from flask import Response, request
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Bodies smaller than this are sent uncompressed
+GZIP_MIN_SIZE = 1024
+# Favour speed over ratio, JSON compresses well even at low levels
+GZIP_LEVEL = 5
+
+
+def isoformat(value):
+    """ISO 8601 formatter for date/datetime columns.
+
+    Compiled serializers skip it and leave the value to ``dumps``, which
+    produces the same string.
+    """
+    return value.isoformat() if value else None
+
+
+def _default(value):
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(payload):
+    """Encode a payload to UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, default=_default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def compile_row_serializer(fields):
+    """Build a function converting result rows into response dictionaries.
+
+    ``fields`` is a list of (response key, row position, formatter or None).
+    Several keys may read the same position. The returned function takes an
+    iterable of rows (tuples or SQLAlchemy Row objects) and returns a list of
+    dictionaries; its output must be encoded with ``dumps``.
+    """
+    keys = tuple(key for key, _, _ in fields)
+    positions = [position for _, position, _ in fields]
+    if len(positions) == 1:
+        position = positions[0]
+        getter = lambda row: (row[position],)
+    else:
+        getter = itemgetter(*positions)
+    formatted = [
+        (index, formatter) for index, (_, _, formatter) in enumerate(fields)
+        if formatter is not None and formatter is not isoformat
+    ]
+
+    if not formatted:
+        def serialize(rows):
+            return [dict(zip(keys, getter(row))) for row in rows]
+        return serialize
+
+    def serialize(rows):
+        result = []
+        append = result.append
+        for row in rows:
+            values = list(getter(row))
+            for index, formatter in formatted:
+                values[index] = formatter(values[index])
+            append(dict(zip(keys, values)))
+        return result
+    return serialize
+
+
+def json_response(payload, status=200):
+    """JSON response encoded with ``dumps`` and gzipped when worthwhile"""
+    body = dumps(payload)
+    response = Response(body, status=status, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    if len(body) >= GZIP_MIN_SIZE and request.accept_encodings['gzip'] > 0:
+        response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
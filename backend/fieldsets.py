@@ -0,0 +1,65 @@
+"""
+Sparse fieldset support for list endpoints.
+
+List endpoints accept an optional ``fields`` query parameter
+(e.g. ``/customers?fields=customer_id,customer_name``). Only the requested
+columns are selected from the database and serialized, which keeps large
+columns such as task remarks or activity descriptions out of the response
+when the UI does not need them.
+"""
+
+from datetime import date, datetime
+
+from sqlalchemy import Date, DateTime
+
+from fast_json import compile_row_serializer
+
+
+def parse_fields(raw, allowed):
+    """Parse a comma-separated fields parameter.
+
+    Returns None when no fields were requested (caller returns everything),
+    otherwise the requested names in request order. Raises ValueError for
+    names that are not in ``allowed``.
+    """
+    if raw is None or not raw.strip():
+        return None
+
+    fields = []
+    for name in raw.split(','):
+        name = name.strip()
+        if name and name not in fields:
+            fields.append(name)
+
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def format_column_value(value):
+    """Format a column value the same way the models' to_dict() methods do"""
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    return value
+
+
+def model_field_names(model, exclude=()):
+    """Column names of a model that may be requested as fields"""
+    return [column.key for column in model.__table__.columns if column.key not in exclude]
+
+
+def project_query(query, model, fields):
+    """Select only the given model columns and return the rows as dictionaries.
+
+    The result must be sent with fast_json.json_response.
+    """
+    columns = [getattr(model, name) for name in fields]
+    rows = query.with_entities(*columns).all()
+    serializer = compile_row_serializer([
+        (name, position, format_column_value if isinstance(column.type, (Date, DateTime)) else None)
+        for position, (name, column) in enumerate(zip(fields, columns))
+    ])
+    return serializer(rows)
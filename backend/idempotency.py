@@ -0,0 +1,44 @@
+"""
+Idempotency keys for queued emails and saved messages.
+
+messages, message_queue, message_schedules and reminder_mails rows carry a
+SHA-256 key of what is sent to whom and when, under a unique index. They are
+written with ``insert_ignoring_duplicates``, an INSERT that skips rows whose
+key is already there, so a retried request or a double click costs one index
+probe per row instead of a second copy of every email.
+
+Only a clash on the idempotency key is skipped: the statement is an
+INSERT ... ON DUPLICATE KEY UPDATE idempotency_key = idempotency_key on MySQL
+and INSERT ... ON CONFLICT (idempotency_key) DO NOTHING on SQLite. Any other
+error (a value too long for its column, a NOT NULL or foreign key violation)
+still fails the statement, unlike INSERT IGNORE, which turns them into
+warnings and stores truncated or default values.
+
+The statement's rowcount is the number of rows added on SQLite. MySQL drivers
+report found rows, so there a skipped duplicate counts as well.
+"""
+
+import hashlib
+from datetime import date, time
+
+from sqlalchemy.dialects import mysql, sqlite
+
+from models import db
+
+
+def idempotency_key(*parts):
+    """Hex SHA-256 of the parts; dates and times are keyed by their ISO format"""
+    text = "\x1f".join(
+        part.isoformat() if isinstance(part, (date, time)) else '' if part is None else str(part)
+        for part in parts
+    )
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def insert_ignoring_duplicates(model):
+    """INSERT for a model's table that skips rows whose idempotency_key already exists"""
+    table = model.__table__
+    if db.session.get_bind().dialect.name == 'mysql':
+        # A no-op update: the existing row is left as it is
+        return mysql.insert(table).on_duplicate_key_update(idempotency_key=table.c.idempotency_key)
+    return sqlite.insert(table).on_conflict_do_nothing(index_elements=[table.c.idempotency_key])
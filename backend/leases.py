@@ -0,0 +1,86 @@
+"""
+Leases for rows that background senders take from a shared table.
+
+Every process runs its own dispatcher threads (outbox, reminders, message
+queue), so a row must be claimed before it is sent. A claim sets
+``claimed_by`` to the process and ``lease_until`` to when the claim runs out,
+with an UPDATE that repeats the "nobody holds it" condition, and is committed
+before anything is sent. A process that dies leaves rows whose lease runs out
+and are taken by another one.
+
+Status changes after sending are made with ``lease_held`` in their WHERE
+clause, so a sender whose lease ran out cannot overwrite the work of the one
+that holds the rows now. Senders keep their leases from running out with
+``renew_lease`` and by taking no more rows than they can send within a lease
+(``lease_batch_size``).
+"""
+
+import os
+import socket
+from datetime import timedelta
+
+from sqlalchemy import and_, or_
+
+from models import db
+
+# Share of a lease a batch may take to send at the mail rate limit, the rest
+# is headroom for slow servers and retries
+LEASE_SEND_SHARE = 0.5
+
+
+def worker_id():
+    """Identifies this process in claimed_by columns"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def lease_available(model, now):
+    """Rows nobody is sending: never claimed, or the lease ran out"""
+    return or_(model.claimed_by.is_(None), model.lease_until < now)
+
+
+def lease_held(model, now, claimer=None):
+    """Rows this process has claimed and whose lease has not run out"""
+    return and_(model.claimed_by == (claimer or worker_id()), model.lease_until >= now)
+
+
+def lease_batch_size(batch_size, rate, lease_seconds):
+    """Most rows to claim at once so they are sent well within the lease.
+
+    rate is the mail rate limit in messages per second, 0 for none.
+    """
+    if not rate:
+        return batch_size
+    return max(1, min(batch_size, int(rate * lease_seconds * LEASE_SEND_SHARE)))
+
+
+def claim_rows(model, key, candidate_ids, now, lease_seconds, *criteria):
+    """Lease the candidate rows still available to this process and commit.
+
+    key is the primary key column, criteria further conditions the rows must
+    still meet (e.g. their status). Returns the number of rows claimed.
+    """
+    if not candidate_ids:
+        db.session.commit()  # Release the locks taken while finding candidates
+        return 0
+    claimed = model.query.filter(
+        key.in_(candidate_ids), lease_available(model, now), *criteria
+    ).update({
+        'claimed_by': worker_id(),
+        'lease_until': now + timedelta(seconds=lease_seconds)
+    }, synchronize_session=False)
+    db.session.commit()
+    return claimed
+
+
+def renew_lease(model, key, ids, now, lease_seconds):
+    """Extend this process's lease on rows it still holds and commit.
+
+    Returns the number of rows renewed, fewer than ids when some leases ran
+    out and may have been taken by another process.
+    """
+    if not ids:
+        return 0
+    renewed = model.query.filter(key.in_(ids), lease_held(model, now)).update(
+        {'lease_until': now + timedelta(seconds=lease_seconds)}, synchronize_session=False)
+    db.session.commit()
+    return renewed
@@ -0,0 +1,294 @@
+"""
+Shared SMTP mailer with a small pool of authenticated connections.
+
+Every module sends mail through the module-level ``mailer`` instead of doing
+connect / STARTTLS / login / send / quit for each message. Connections are
+kept open between sends (up to ``MAIL_POOL_SIZE``, each dropped after
+``MAIL_MAX_IDLE`` seconds unused) and re-established transparently when the
+server has closed them.
+
+``send_batch`` delivers many messages over one pooled connection and reports
+a result per message; ``send_concurrently`` spreads a large batch over
+several pooled connections in parallel. A mailer can be given a rate limit,
+enforced with a token bucket shared by all of its connections, so bursts stay
+under the provider's sending limits. ``retry_state`` decides what happens to
+a queued message that failed: another attempt after an exponential backoff
+with jitter, or the Failed (dead-letter) status. The SMTP server and account come
+from the EMAIL_* environment variables, so the mailer can be pointed at a
+local stand-in such as aiosmtpd (``EMAIL_HOST=localhost EMAIL_PORT=8025 EMAIL_USE_TLS=false``,
+empty ``EMAIL_HOST_USER`` to skip login). There are no built-in credentials:
+while EMAIL_HOST_USER or EMAIL_HOST_PASSWORD is unset, mail is disabled and
+every send fails with ``MailNotConfigured``, so queued mail is retried and
+eventually marked Failed instead of being reported as sent.
+"""
+
+import os
+import random
+import smtplib
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'smtp.gmail.com')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 587))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'true').lower() == 'true'
+# Sender address, the SMTP account unless set; providers such as Gmail
+# rewrite or reject mail from an address the login does not own
+EMAIL_FROM = os.environ.get('EMAIL_FROM') or EMAIL_HOST_USER or ''
+# An empty EMAIL_HOST_USER sends without logging in, an unset one disables mail
+MAIL_ENABLED = EMAIL_HOST_USER == '' or bool(EMAIL_HOST_USER and EMAIL_HOST_PASSWORD)
+if not MAIL_ENABLED:
+    print("⚠️ EMAIL_HOST_USER / EMAIL_HOST_PASSWORD are not set, mail is disabled")
+
+# Open connections kept for reuse
+MAIL_POOL_SIZE = 3
+# Seconds an idle connection is kept before it is closed instead of reused
+MAIL_MAX_IDLE = 60
+MAIL_TIMEOUT = 30
+# Most messages handed to one connection at a time by send_concurrently
+MAIL_CHUNK_SIZE = 50
+# Messages per second allowed per mailer and the burst size. No limit by
+# default; set MAIL_RATE_LIMIT to the provider's sending rate
+MAIL_RATE_LIMIT = float(os.environ.get('MAIL_RATE_LIMIT', 0))
+MAIL_RATE_BURST = int(os.environ.get('MAIL_RATE_BURST', 20))
+
+# Attempts after which a queued message is given up (status Failed)
+MAIL_MAX_ATTEMPTS = 5
+# Backoff before the first retry, doubled for every further attempt
+MAIL_RETRY_BASE_DELAY = 60
+MAIL_RETRY_MAX_DELAY = 3600
+
+# Errors for one message after which the connection is still usable
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+class MailNotConfigured(RuntimeError):
+    """Raised for every message while the SMTP account is not configured"""
+
+
+def is_permanent_failure(error):
+    """True when the server rejected the message itself with a 5xx reply"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return bool(error.recipients) and all(code >= 500 for code, _ in error.recipients.values())
+    # Authentication and connection problems are temporary for the message
+    return isinstance(error, MESSAGE_ERRORS) and error.smtp_code >= 500
+
+
+def retry_delay(attempts):
+    """Seconds to wait after the given number of failed attempts (half of it is jitter)"""
+    delay = min(MAIL_RETRY_MAX_DELAY, MAIL_RETRY_BASE_DELAY * 2 ** (attempts - 1))
+    return random.uniform(delay / 2, delay)
+
+
+def retry_state(attempts, error, now):
+    """Column values for a queued message whose delivery failed.
+
+    attempts is the number of attempts before this one. The message goes to
+    status Retry with next_attempt_at set, or to Failed when the error is
+    permanent or MAIL_MAX_ATTEMPTS is reached.
+    """
+    attempts = (attempts or 0) + 1
+    state = {'attempts': attempts, 'last_error': str(error)[:255]}
+    if attempts >= MAIL_MAX_ATTEMPTS or is_permanent_failure(error):
+        state.update(status='Failed', next_attempt_at=None)
+    else:
+        state.update(status='Retry', next_attempt_at=now + timedelta(seconds=retry_delay(attempts)))
+    return state
+
+
+class TokenBucket:
+    """Allows rate operations per second on average, in bursts of up to capacity"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, waiting until one is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class Mailer:
+    def __init__(self, host, port, username, password, sender, use_tls=True,
+                 pool_size=MAIL_POOL_SIZE, max_idle=MAIL_MAX_IDLE, timeout=MAIL_TIMEOUT,
+                 rate_limit=None, burst=None, bucket=None, enabled=True):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender
+        self.use_tls = use_tls
+        self.enabled = enabled
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._idle = deque()
+        self._lock = threading.Lock()
+        # Bounds the number of connections open at the same time
+        self._slots = threading.BoundedSemaphore(pool_size)
+        # Paces sends over all connections, the limit applies per process.
+        # Mailers for the same account can share one bucket
+        self._bucket = bucket or (TokenBucket(rate_limit, burst) if rate_limit else None)
+
+    def build_message(self, recipient, subject, body, content_type='plain', html_body=None):
+        """Create a message; with html_body the body is sent as the text alternative"""
+        msg = MIMEMultipart('alternative' if html_body else 'mixed')
+        msg['Subject'] = subject
+        msg['From'] = self.sender
+        msg['To'] = recipient
+        msg.attach(MIMEText(body or '', content_type))
+        if html_body:
+            msg.attach(MIMEText(html_body, 'html'))
+        return msg
+
+    def _connect(self):
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                connection.starttls()
+            if self.username:
+                connection.login(self.username, self.password)
+        except Exception:
+            self._close(connection)
+            raise
+        return connection
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.quit()
+        except Exception:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def _acquire(self):
+        self._slots.acquire()
+        try:
+            now = time.monotonic()
+            while True:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    connection, last_used = self._idle.popleft()
+                if now - last_used <= self.max_idle:
+                    return connection
+                self._close(connection)
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, connection):
+        try:
+            if connection is not None:
+                with self._lock:
+                    self._idle.append((connection, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def send_batch(self, messages):
+        """Send messages over one pooled connection.
+
+        Returns a list with, for each message, None when it was accepted or
+        the exception that made it fail. A dropped connection is re-opened
+        once per message before giving up on the rest of the batch.
+        """
+        results = [None] * len(messages)
+        if not messages:
+            return results
+        if not self.enabled:
+            error = MailNotConfigured("EMAIL_HOST_USER / EMAIL_HOST_PASSWORD are not set")
+            print(f"❌ Mail is disabled, {len(messages)} messages not sent")
+            return [error] * len(messages)
+
+        try:
+            connection = self._acquire()
+        except Exception as e:
+            print(f"❌ Could not connect to mail server: {e}")
+            return [e] * len(messages)
+
+        try:
+            for index, message in enumerate(messages):
+                if self._bucket is not None:
+                    self._bucket.acquire()
+                try:
+                    connection.send_message(message)
+                except MESSAGE_ERRORS as e:
+                    print(f"❌ Failed to send email to {message['To']}: {e}")
+                    results[index] = e
+                except (smtplib.SMTPException, OSError):
+                    # Stale or dropped connection: reconnect and retry this message
+                    self._close(connection)
+                    connection = None
+                    try:
+                        connection = self._connect()
+                        connection.send_message(message)
+                    except MESSAGE_ERRORS as e:
+                        print(f"❌ Failed to send email to {message['To']}: {e}")
+                        results[index] = e
+                    except Exception as e:
+                        print(f"❌ Mail server unavailable: {e}")
+                        if connection is not None:
+                            self._close(connection)
+                            connection = None
+                        results[index:] = [e] * (len(messages) - index)
+                        break
+        finally:
+            self._release(connection)
+        return results
+
+    def send_concurrently(self, messages, concurrency=None, chunk_size=MAIL_CHUNK_SIZE):
+        """Like send_batch, but spread over up to concurrency pooled connections.
+
+        concurrency defaults to (and is capped at) the pool size. Results are
+        returned in the order of the messages.
+        """
+        concurrency = min(concurrency or self.pool_size, self.pool_size)
+        if concurrency <= 1 or len(messages) <= 1:
+            return self.send_batch(messages)
+
+        # Small batches are still split so every connection gets work
+        chunk_size = max(1, min(chunk_size, -(-len(messages) // concurrency)))
+
+        chunks = [messages[start:start + chunk_size] for start in range(0, len(messages), chunk_size)]
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='mailer') as executor:
+            chunk_results = list(executor.map(self.send_batch, chunks))
+        return [result for results in chunk_results for result in results]
+
+    def send(self, message):
+        """Send one message, returns True when it was accepted"""
+        return self.send_batch([message])[0] is None
+
+    def send_email(self, recipient, subject, body, content_type='plain', html_body=None):
+        return self.send(self.build_message(recipient, subject, body, content_type, html_body))
+
+    def close(self):
+        """Close all idle connections"""
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for connection, _ in idle:
+            self._close(connection)
+
+
+mailer = Mailer(EMAIL_HOST, EMAIL_PORT, EMAIL_HOST_USER, EMAIL_HOST_PASSWORD, EMAIL_FROM, use_tls=EMAIL_USE_TLS,
+                rate_limit=MAIL_RATE_LIMIT, burst=MAIL_RATE_BURST, enabled=MAIL_ENABLED)
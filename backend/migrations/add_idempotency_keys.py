@@ -0,0 +1,41 @@
+"""
+Migration script for idempotency keys: adds idempotency_key and a unique
+index on it to messages, message_queue, message_schedules and reminder_mails.
+
+Saving a custom message and scheduling write these rows with an INSERT that
+skips a row whose key already exists (see idempotency.py), so a retried or
+double-clicked request does not save the message or queue every email again. Existing rows keep an empty key: they may
+already contain duplicates, which a unique index would reject.
+
+To run this migration:
+1. Make sure your Flask app is not running
+2. Run this script directly: python add_idempotency_keys.py
+"""
+
+import sys
+import os
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Import the db and app from your main application
+from app import app, db
+from models import Message, MessageQueue, MessageSchedule, ReminderMail
+from schema_helpers import add_column_if_missing, create_indexes_if_missing
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting migration for idempotency keys...")
+            for table in (Message.__table__, MessageQueue.__table__, MessageSchedule.__table__, ReminderMail.__table__):
+                add_column_if_missing(db.engine, table.c.idempotency_key)
+                create_indexes_if_missing(db.engine, table, columns=['idempotency_key'])
+            print("Migration completed successfully!")
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            import traceback
+            traceback.print_exc()
+
+if __name__ == "__main__":
+    run_migration()
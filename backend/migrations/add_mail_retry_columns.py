@@ -0,0 +1,43 @@
+"""
+Migration script for retrying failed emails: adds attempts, next_attempt_at
+and last_error to message_queue and reminder_mails, plus a
+(status, next_attempt_at) index on each.
+
+A failed message is set to status Retry with next_attempt_at after an
+exponential backoff, and to Failed once it has used up its attempts or the
+server rejected it permanently (see mailer.retry_state). Existing rows start
+with no attempts.
+
+To run this migration:
+1. Make sure your Flask app is not running
+2. Run this script directly: python add_mail_retry_columns.py
+"""
+
+import sys
+import os
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Import the db and app from your main application
+from app import app, db
+from models import MessageQueue, ReminderMail
+from schema_helpers import add_column_if_missing, create_indexes_if_missing
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting migration for mail retries...")
+            for table in (MessageQueue.__table__, ReminderMail.__table__):
+                for column in ('attempts', 'next_attempt_at', 'last_error'):
+                    add_column_if_missing(db.engine, table.c[column])
+                create_indexes_if_missing(db.engine, table)
+            print("Migration completed successfully!")
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            import traceback
+            traceback.print_exc()
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,40 @@
+"""
+Migration script for group messages fanned out at send time: adds
+message_queue.group_id and a (group_id, status) index on customers.
+
+A message scheduled for a group is queued as a single row with group_id set.
+When it falls due the email worker reads the group's active customers and
+queues one message per customer (see routes/messages.py), so membership
+changes made before then apply. Existing rows all have an email_id.
+
+To run this migration:
+1. Make sure your Flask app is not running
+2. Run this script directly: python add_message_queue_group_id.py
+"""
+
+import sys
+import os
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Import the db and app from your main application
+from app import app, db
+from models import Customer, MessageQueue
+from schema_helpers import add_column_if_missing, create_indexes_if_missing
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting migration for group messages...")
+            add_column_if_missing(db.engine, MessageQueue.__table__.c.group_id)
+            create_indexes_if_missing(db.engine, Customer.__table__)
+            print("Migration completed successfully!")
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            import traceback
+            traceback.print_exc()
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,41 @@
+"""
+Migration script for lease-based claiming of the message queue: adds the
+message_queue.claimed_by and message_queue.lease_until columns and the
+(status, lease_until) index.
+
+Each process's email worker leases the messages it is about to send, so
+several gunicorn workers or hosts can drain the queue without sending a
+message twice. Existing rows start unclaimed.
+
+To run this migration:
+1. Make sure your Flask app is not running
+2. Run this script directly: python add_message_queue_leases.py
+"""
+
+import sys
+import os
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Import the db and app from your main application
+from app import app, db
+from models import MessageQueue
+from schema_helpers import add_column_if_missing, create_indexes_if_missing
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting migration for message_queue leases...")
+            add_column_if_missing(db.engine, MessageQueue.__table__.c.claimed_by)
+            add_column_if_missing(db.engine, MessageQueue.__table__.c.lease_until)
+            create_indexes_if_missing(db.engine, MessageQueue.__table__)
+            print("Migration completed successfully!")
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            import traceback
+            traceback.print_exc()
+
+if __name__ == "__main__":
+    run_migration()
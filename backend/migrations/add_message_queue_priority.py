@@ -0,0 +1,62 @@
+"""
+Migration script for the message queue priority lanes: adds
+message_queue.priority and the (status, priority, ...) indexes each lane's
+worker reads, and drops the indexes they replace.
+
+Existing rows are put in the bulk lane (priority 1). New messages to a
+single recipient go to the high priority lane (0), group campaigns to bulk.
+
+To run this migration:
+1. Make sure your Flask app is not running
+2. Run this script directly: python add_message_queue_priority.py
+"""
+
+import sys
+import os
+
+from sqlalchemy import inspect, text
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Import the db and app from your main application
+from app import app, db
+from models import MessageQueue
+from schema_helpers import add_column_if_missing, create_indexes_if_missing
+
+# Indexes without the priority column that the lane indexes replace
+SUPERSEDED_INDEXES = [
+    'ix_message_queue_status_date_time',
+    'ix_message_queue_status_next_attempt_at',
+]
+
+
+def drop_superseded_indexes(engine):
+    existing = {index['name'] for index in inspect(engine).get_indexes('message_queue')}
+    with engine.begin() as connection:
+        for name in SUPERSEDED_INDEXES:
+            if name not in existing:
+                continue
+            print(f"Dropping index {name}...")
+            if engine.dialect.name == 'mysql':
+                connection.execute(text(f"DROP INDEX {name} ON message_queue"))
+            else:
+                connection.execute(text(f"DROP INDEX {name}"))
+
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting migration for message_queue priority lanes...")
+            add_column_if_missing(db.engine, MessageQueue.__table__.c.priority)
+            create_indexes_if_missing(db.engine, MessageQueue.__table__)
+            drop_superseded_indexes(db.engine)
+            print("Migration completed successfully!")
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            import traceback
+            traceback.print_exc()
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,38 @@
+"""
+Migration script for notification digests: adds digest_text to
+notification_outbox.
+
+When NOTIFICATION_DIGEST_WINDOW is set, pending notifications that have a
+digest_text are combined into one email per recipient (see outbox.py).
+Existing rows have none and are sent on their own.
+
+To run this migration:
+1. Make sure your Flask app is not running
+2. Run this script directly: python add_outbox_digest_text.py
+"""
+
+import sys
+import os
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Import the db and app from your main application
+from app import app, db
+from models import NotificationOutbox
+from schema_helpers import add_column_if_missing
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting migration for notification digests...")
+            add_column_if_missing(db.engine, NotificationOutbox.__table__.c.digest_text)
+            print("Migration completed successfully!")
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            import traceback
+            traceback.print_exc()
+
+if __name__ == "__main__":
+    run_migration()
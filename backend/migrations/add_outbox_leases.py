@@ -0,0 +1,40 @@
+"""
+Migration script for lease-based claiming of the notification outbox: adds
+the notification_outbox.claimed_by and notification_outbox.lease_until
+columns.
+
+Every process runs an outbox dispatcher; each leases the notifications it is
+about to send, so several gunicorn workers or hosts never send the same
+notification twice (see leases.py). Existing rows start unclaimed.
+
+To run this migration:
+1. Make sure your Flask app is not running
+2. Run this script directly: python add_outbox_leases.py
+"""
+
+import sys
+import os
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Import the db and app from your main application
+from app import app, db
+from models import NotificationOutbox
+from schema_helpers import add_column_if_missing
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting migration for notification_outbox leases...")
+            add_column_if_missing(db.engine, NotificationOutbox.__table__.c.claimed_by)
+            add_column_if_missing(db.engine, NotificationOutbox.__table__.c.lease_until)
+            print("Migration completed successfully!")
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            import traceback
+            traceback.print_exc()
+
+if __name__ == "__main__":
+    run_migration()
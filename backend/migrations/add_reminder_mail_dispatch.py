@@ -0,0 +1,37 @@
+"""
+Migration script for the reminder dispatcher (reminders.py): adds the
+reminder_mails.subject and reminder_mails.email_type columns and the
+(status, date, time) index used to find due reminders.
+
+To run this migration:
+1. Make sure your Flask app is not running
+2. Run this script directly: python add_reminder_mail_dispatch.py
+"""
+
+import sys
+import os
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Import the db and app from your main application
+from app import app, db
+from models import ReminderMail
+from schema_helpers import add_column_if_missing, create_indexes_if_missing
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting migration for reminder_mails dispatch...")
+            add_column_if_missing(db.engine, ReminderMail.__table__.c.subject)
+            add_column_if_missing(db.engine, ReminderMail.__table__.c.email_type)
+            create_indexes_if_missing(db.engine, ReminderMail.__table__)
+            print("Migration completed successfully!")
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            import traceback
+            traceback.print_exc()
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,39 @@
+"""
+Migration script for lease-based claiming of task reminders: adds the
+reminder_mails.claimed_by and reminder_mails.lease_until columns.
+
+Every process runs the reminder dispatcher (reminders.py); each leases the
+reminders it is about to send, so several gunicorn workers or hosts never
+send the same reminder twice. Existing rows start unclaimed.
+
+To run this migration:
+1. Make sure your Flask app is not running
+2. Run this script directly: python add_reminder_mail_leases.py
+"""
+
+import sys
+import os
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Import the db and app from your main application
+from app import app, db
+from models import ReminderMail
+from schema_helpers import add_column_if_missing
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting migration for reminder_mails leases...")
+            add_column_if_missing(db.engine, ReminderMail.__table__.c.claimed_by)
+            add_column_if_missing(db.engine, ReminderMail.__table__.c.lease_until)
+            print("Migration completed successfully!")
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            import traceback
+            traceback.print_exc()
+
+if __name__ == "__main__":
+    run_migration()
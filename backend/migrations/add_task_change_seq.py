@@ -0,0 +1,38 @@
+"""
+Migration script to add the tasks.change_seq column used by the incremental
+task change feed (GET /tasks/changes).
+
+Existing tasks start at 0; every later write stamps them with the current
+tasks version from table_versions. Run create_table_versions.py first.
+
+To run this migration:
+1. Make sure your Flask app is not running
+2. Run this script directly: python add_task_change_seq.py
+"""
+
+import sys
+import os
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Import the db and app from your main application
+from app import app, db
+from models import Task
+from schema_helpers import add_column_if_missing, create_indexes_if_missing
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting migration for tasks.change_seq...")
+            add_column_if_missing(db.engine, Task.__table__.c.change_seq)
+            create_indexes_if_missing(db.engine, Task.__table__, columns={'change_seq'})
+            print("Migration completed successfully!")
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            import traceback
+            traceback.print_exc()
+
+if __name__ == "__main__":
+    run_migration()
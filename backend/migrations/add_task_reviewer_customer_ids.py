@@ -0,0 +1,120 @@
+"""
+Migration script to add integer tasks.reviewer_id and tasks.customer_id keys.
+
+Task filters used to join on the reviewer and customer name strings. This
+migration adds the two foreign key columns with their indexes, backfills them
+from the existing names, and drops the name-based indexes they replace. The
+name columns are kept (and still written) for display and older clients.
+
+The backfill runs in batches of task ids so it does not hold long locks on
+large tables. Names that match no actor/customer are left NULL; when a name
+matches several rows the lowest id is used.
+
+To run this migration:
+1. Make sure your Flask app is not running
+2. Run this script directly: python add_task_reviewer_customer_ids.py
+"""
+
+import sys
+import os
+
+from sqlalchemy import inspect, text
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Import the db and app from your main application
+from app import app, db
+from models import Task
+from schema_helpers import add_column_if_missing, create_indexes_if_missing
+
+BACKFILL_BATCH_SIZE = 5000
+
+# Indexes on the name columns that the new id indexes replace
+SUPERSEDED_INDEXES = [
+    'ix_tasks_reviewer_assigned_timestamp',
+    'ix_tasks_customer_name_assigned_timestamp',
+]
+
+FOREIGN_KEYS = {
+    'fk_tasks_reviewer_id': ('reviewer_id', 'actors', 'actor_id'),
+    'fk_tasks_customer_id': ('customer_id', 'customers', 'customer_id'),
+}
+
+
+def add_foreign_keys(engine):
+    # SQLite cannot add constraints to an existing table
+    if engine.dialect.name != 'mysql':
+        print("Skipping foreign key constraints (not supported by this database)")
+        return
+    existing = {fk['name'] for fk in inspect(engine).get_foreign_keys('tasks')}
+    with engine.begin() as connection:
+        for name, (column, ref_table, ref_column) in FOREIGN_KEYS.items():
+            if name in existing:
+                print(f"Foreign key {name} already exists, skipping")
+                continue
+            print(f"Adding foreign key {name}...")
+            connection.execute(text(
+                f"ALTER TABLE tasks ADD CONSTRAINT {name} "
+                f"FOREIGN KEY ({column}) REFERENCES {ref_table} ({ref_column})"
+            ))
+
+
+def drop_superseded_indexes(engine):
+    existing = {index['name'] for index in inspect(engine).get_indexes('tasks')}
+    with engine.begin() as connection:
+        for name in SUPERSEDED_INDEXES:
+            if name not in existing:
+                continue
+            print(f"Dropping index {name}...")
+            if engine.dialect.name == 'mysql':
+                connection.execute(text(f"DROP INDEX {name} ON tasks"))
+            else:
+                connection.execute(text(f"DROP INDEX {name}"))
+
+
+def backfill_ids(engine):
+    with engine.connect() as connection:
+        max_task_id = connection.execute(text("SELECT MAX(task_id) FROM tasks")).scalar() or 0
+
+    updated = 0
+    for start in range(0, max_task_id + 1, BACKFILL_BATCH_SIZE):
+        end = start + BACKFILL_BATCH_SIZE
+        with engine.begin() as connection:
+            result = connection.execute(text("""
+                UPDATE tasks SET
+                    customer_id = (SELECT MIN(c.customer_id) FROM customers c
+                                   WHERE c.customer_name = tasks.customer_name),
+                    reviewer_id = (SELECT MIN(a.actor_id) FROM actors a
+                                   WHERE a.actor_name = tasks.reviewer)
+                WHERE task_id >= :start AND task_id < :end
+                  AND ((customer_id IS NULL AND customer_name IS NOT NULL)
+                       OR (reviewer_id IS NULL AND reviewer IS NOT NULL))
+            """), {'start': start, 'end': end})
+            updated += result.rowcount
+        print(f"Backfilled tasks {start}-{end - 1}")
+    return updated
+
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting migration for tasks.reviewer_id / tasks.customer_id...")
+            add_column_if_missing(db.engine, Task.__table__.c.reviewer_id)
+            add_column_if_missing(db.engine, Task.__table__.c.customer_id)
+            add_foreign_keys(db.engine)
+
+            updated = backfill_ids(db.engine)
+            print(f"Backfilled {updated} tasks")
+
+            create_indexes_if_missing(db.engine, Task.__table__, columns={'reviewer_id', 'customer_id'})
+            drop_superseded_indexes(db.engine)
+            print("Migration completed successfully!")
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            import traceback
+            traceback.print_exc()
+
+if __name__ == "__main__":
+    run_migration()
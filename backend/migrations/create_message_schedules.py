@@ -0,0 +1,39 @@
+"""
+Migration script for recurring messages: creates the message_schedules table
+and its (status, priority, next_date, time) index.
+
+A recurring message used to be written to message_queue as 12 rows per
+recipient up front. It is now stored once as a schedule, and the email worker
+queues only the next occurrence when it falls due (see routes/messages.py).
+Messages already in message_queue are sent as before.
+
+To run this migration:
+1. Make sure your Flask app is not running
+2. Run this script directly: python create_message_schedules.py
+"""
+
+import sys
+import os
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Import the db and app from your main application
+from app import app, db
+from models import MessageSchedule
+from schema_helpers import create_table_if_missing
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting migration for message schedules...")
+            create_table_if_missing(db.engine, MessageSchedule.__table__)
+            print("Migration completed successfully!")
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            import traceback
+            traceback.print_exc()
+
+if __name__ == "__main__":
+    run_migration()
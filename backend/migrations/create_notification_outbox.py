@@ -0,0 +1,35 @@
+"""
+Migration script to create the notification_outbox table. Request handlers
+write notification emails to it in the same transaction as the change they
+describe, and the outbox dispatcher (outbox.py) delivers them.
+
+To run this migration:
+1. Make sure your Flask app is not running
+2. Run this script directly: python create_notification_outbox.py
+"""
+
+import sys
+import os
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Import the db and app from your main application
+from app import app, db
+from models import NotificationOutbox
+from schema_helpers import create_table_if_missing
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting migration for notification_outbox...")
+            create_table_if_missing(db.engine, NotificationOutbox.__table__)
+            print("Migration completed successfully!")
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            import traceback
+            traceback.print_exc()
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,42 @@
+"""
+Migration script to create the table_versions table used for ETag-based
+conditional GETs on the list endpoints.
+
+To run this migration:
+1. Make sure your Flask app is not running
+2. Run this script directly: python create_table_versions.py
+"""
+
+import sys
+import os
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Import the db and app from your main application
+from app import app, db
+from models import TableVersion
+from etags import TRACKED_TABLES
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting migration for table_versions...")
+            TableVersion.__table__.create(bind=db.engine, checkfirst=True)
+
+            # Seed one row per tracked table so writers only ever UPDATE
+            for table_name in sorted(TRACKED_TABLES):
+                if not db.session.get(TableVersion, table_name):
+                    db.session.add(TableVersion(table_name=table_name, version=0))
+
+            db.session.commit()
+            print("Migration completed successfully!")
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error during migration: {str(e)}")
+            import traceback
+            traceback.print_exc()
+
+if __name__ == "__main__":
+    run_migration()
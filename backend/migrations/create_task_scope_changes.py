@@ -0,0 +1,39 @@
+"""
+Migration script for the task change feed: creates the task_scope_changes
+table and its change_seq index.
+
+Every change of a task's assignee, reviewer or customer records the previous
+values there, so GET /tasks/changes can list the tasks a user no longer sees
+under "removed" (see task_events.py). Changes made before the migration are
+not recorded; clients that synced before it should reload GET /tasks once.
+
+To run this migration:
+1. Make sure your Flask app is not running
+2. Run this script directly: python create_task_scope_changes.py
+"""
+
+import sys
+import os
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Import the db and app from your main application
+from app import app, db
+from models import TaskScopeChange
+from schema_helpers import create_table_if_missing
+
+def run_migration():
+    with app.app_context():
+        try:
+            print("Starting migration for task scope changes...")
+            create_table_if_missing(db.engine, TaskScopeChange.__table__)
+            print("Migration completed successfully!")
+
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            import traceback
+            traceback.print_exc()
+
+if __name__ == "__main__":
+    run_migration()
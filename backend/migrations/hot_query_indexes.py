@@ -0,0 +1,198 @@
+"""
+Migration script to add composite indexes for the hot task, message queue and
+diary filters, and to verify that those queries no longer scan whole tables.
+
+Indexes created (declared in models.py):
+- tasks(assigned_timestamp, task_id)           task board listing for admins
+- tasks(actor_id, assigned_timestamp, task_id) task board listing per assignee
+- tasks(reviewer_id, assigned_timestamp)       review mode
+- tasks(customer_id, assigned_timestamp)       client filter and customer reports
+- tasks(activity_id, status)                   activity reports
+- message_queue(status, priority, date, time)  due-message scan and next-due lookup per lane in the email worker
+- message_queue(status, lease_until)           earliest lease expiry in the email worker
+- diary1(task)                                 time taken when a task is completed
+- reminder_mails(status, date, time)           due-reminder scan in the reminder dispatcher
+- message_queue(status, priority, next_attempt_at) retries due per lane in the email worker
+- reminder_mails(status, next_attempt_at)      retries due in the reminder dispatcher
+- message_schedules(status, priority, next_date, time) recurring messages due per lane in the email worker
+- customers(group_id, status)                 group members read when a group message is fanned out
+
+Works on MySQL and SQLite.
+
+To run this migration:
+1. Make sure your Flask app is not running
+2. Run this script directly: python hot_query_indexes.py
+3. To only verify the query plans: python hot_query_indexes.py --check
+
+The check runs EXPLAIN on each hot query and exits with status 1 if any of
+them does a full table scan. MySQL may still choose a full scan on tables with
+only a handful of rows, so run the check against a database with real data.
+"""
+
+import re
+import sys
+import os
+
+from sqlalchemy import inspect, text
+
+# Add the parent directory to sys.path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from models import db, Task, MessageQueue, MessageSchedule, Customer, Diary1, ReminderMail
+
+INDEXED_TABLES = [Task.__table__, MessageQueue.__table__, MessageSchedule.__table__, Customer.__table__,
+                  Diary1.__table__, ReminderMail.__table__]
+
+# Hot queries taken from the request handlers, with representative parameters
+HOT_QUERIES = {
+    'tasks.get_tasks (admin)': (
+        "SELECT * FROM tasks ORDER BY assigned_timestamp DESC, task_id DESC LIMIT 100",
+        {}
+    ),
+    'tasks.get_tasks (assignee)': (
+        "SELECT * FROM tasks WHERE actor_id = :actor_id "
+        "ORDER BY assigned_timestamp DESC, task_id DESC LIMIT 100",
+        {'actor_id': 1000}
+    ),
+    'tasks.get_tasks (review mode)': (
+        "SELECT * FROM tasks WHERE reviewer_id = :reviewer_id ORDER BY assigned_timestamp DESC",
+        {'reviewer_id': 1000}
+    ),
+    'tasks.get_tasks / get_client_tasks (customer)': (
+        "SELECT * FROM tasks WHERE customer_id = :customer_id ORDER BY assigned_timestamp DESC",
+        {'customer_id': 1000}
+    ),
+    'reports.generate_activity_report': (
+        "SELECT * FROM tasks WHERE activity_id = :activity_id AND status = :status",
+        {'activity_id': 1, 'status': 'completed'}
+    ),
+    'messages.process_message_queue': (
+        "SELECT s_no FROM message_queue WHERE status = :status AND priority = :priority AND date <= :date "
+        "AND (date < :date OR time <= :time) AND group_id IS NULL AND (claimed_by IS NULL OR lease_until < :now) "
+        "ORDER BY date, time LIMIT 500",
+        {'status': 'Scheduled', 'priority': 0, 'date': '2000-01-01', 'time': '09:00:00', 'now': '2000-01-01 09:00:00'}
+    ),
+    'messages.expand_due_group_messages': (
+        "SELECT s_no, group_id FROM message_queue WHERE status = :status AND priority = :priority "
+        "AND date <= :date AND (date < :date OR time <= :time) AND group_id IS NOT NULL "
+        "ORDER BY date, time LIMIT 100",
+        {'status': 'Scheduled', 'priority': 1, 'date': '2000-01-01', 'time': '09:00:00'}
+    ),
+    'messages.next_message_due': (
+        "SELECT date, time FROM message_queue WHERE status = :status AND priority = :priority "
+        "AND date IS NOT NULL AND time IS NOT NULL "
+        "AND (claimed_by IS NULL OR lease_until < :now) ORDER BY date, time LIMIT 1",
+        {'status': 'Scheduled', 'priority': 0, 'now': '2000-01-01 09:00:00'}
+    ),
+    'messages.next_message_due (lease expiry)': (
+        "SELECT MIN(lease_until) FROM message_queue WHERE status = :status AND lease_until >= :now "
+        "AND priority = :priority",
+        {'status': 'Scheduled', 'priority': 0, 'now': '2000-01-01 09:00:00'}
+    ),
+    'messages.claim_due_messages (retries)': (
+        "SELECT s_no FROM message_queue WHERE status = :status AND priority = :priority AND next_attempt_at <= :now "
+        "AND (claimed_by IS NULL OR lease_until < :now) ORDER BY next_attempt_at LIMIT 500",
+        {'status': 'Retry', 'priority': 0, 'now': '2000-01-01 09:00:00'}
+    ),
+    'messages.expand_due_schedules': (
+        "SELECT * FROM message_schedules WHERE status = :status AND priority = :priority AND next_date <= :date "
+        "AND (next_date < :date OR time <= :time) ORDER BY next_date, time LIMIT 100",
+        {'status': 'Active', 'priority': 1, 'date': '2000-01-01', 'time': '09:00:00'}
+    ),
+    'messages.stream_group_recipients': (
+        "SELECT email_id FROM customers WHERE group_id = :group_id AND status = :status",
+        {'group_id': 1, 'status': 'A'}
+    ),
+    'messages.next_message_due (schedules)': (
+        "SELECT next_date, time FROM message_schedules WHERE status = :status AND priority = :priority "
+        "AND next_date IS NOT NULL ORDER BY next_date, time LIMIT 1",
+        {'status': 'Active', 'priority': 1}
+    ),
+    'reminders.dispatch_due_reminders (retries)': (
+        "SELECT * FROM reminder_mails WHERE status = :status AND next_attempt_at <= :now "
+        "ORDER BY next_attempt_at LIMIT 500",
+        {'status': 'Retry', 'now': '2000-01-01 09:00:00'}
+    ),
+    'reminders.dispatch_due_reminders': (
+        "SELECT * FROM reminder_mails WHERE status = :status AND date <= :date "
+        "AND (date < :date OR time <= :time) ORDER BY date, time LIMIT 500",
+        {'status': 'Pending', 'date': '2000-01-01', 'time': '09:00:00'}
+    ),
+    'tasks.calculate_time_taken': (
+        "SELECT * FROM diary1 WHERE task = :task",
+        {'task': '1'}
+    ),
+}
+
+
+def create_indexes(engine):
+    """Create every model-declared index that does not exist yet"""
+    inspector = inspect(engine)
+    created = []
+    for table in INDEXED_TABLES:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                print(f"Index {index.name} already exists, skipping")
+                continue
+            print(f"Creating index {index.name} on {table.name}...")
+            index.create(bind=engine)
+            created.append(index.name)
+    return created
+
+
+def full_scans(connection, sql, params):
+    """Return the tables a query reads with a full scan according to EXPLAIN"""
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        plan = connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params).fetchall()
+        # Index usage shows up as "SCAN t USING INDEX ..." or "SEARCH t USING ..."
+        return [m.group(1) for row in plan for m in [re.match(r'^SCAN (\w+)$', row[-1])] if m]
+    if dialect == 'mysql':
+        result = connection.execute(text(f"EXPLAIN {sql}"), params)
+        return [row['table'] for row in result.mappings() if row['type'] == 'ALL']
+    raise ValueError(f"Unsupported database dialect: {dialect}")
+
+
+def check_hot_query_plans(engine):
+    """EXPLAIN every hot query and return a list of (query name, tables scanned)"""
+    failures = []
+    with engine.connect() as connection:
+        for name, (sql, params) in HOT_QUERIES.items():
+            scanned = full_scans(connection, sql, params)
+            if scanned:
+                print(f"FULL SCAN  {name}: {', '.join(scanned)}")
+                failures.append((name, scanned))
+            else:
+                print(f"OK         {name}")
+    return failures
+
+
+def run_migration():
+    # Import the app lazily so the check helpers can be used without it
+    from app import app
+
+    with app.app_context():
+        try:
+            print("Starting migration for hot query indexes...")
+            created = create_indexes(db.engine)
+            print(f"Migration completed successfully! Created {len(created)} indexes.")
+        except Exception as e:
+            print(f"Error during migration: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+        return not check_hot_query_plans(db.engine)
+
+
+def run_check():
+    from app import app
+
+    with app.app_context():
+        return not check_hot_query_plans(db.engine)
+
+
+if __name__ == "__main__":
+    ok = run_check() if '--check' in sys.argv else run_migration()
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,57 @@
+"""
+Small helpers shared by the migration scripts in this directory.
+
+They add tables, columns and indexes declared in models.py to an existing
+MySQL or SQLite database, skipping anything that is already there so every
+migration can be re-run safely.
+"""
+
+from sqlalchemy import inspect, text
+
+
+def create_table_if_missing(engine, table):
+    if inspect(engine).has_table(table.name):
+        print(f"Table {table.name} already exists, skipping")
+        return False
+    print(f"Creating table {table.name}...")
+    table.create(bind=engine)
+    return True
+
+
+def add_column_if_missing(engine, column):
+    """Add a model column to its table with ALTER TABLE ... ADD COLUMN"""
+    table_name = column.table.name
+    existing = {c['name'] for c in inspect(engine).get_columns(table_name)}
+    if column.name in existing:
+        print(f"Column {table_name}.{column.name} already exists, skipping")
+        return False
+
+    preparer = engine.dialect.identifier_preparer
+    ddl = f"ALTER TABLE {preparer.quote(table_name)} ADD COLUMN {preparer.quote(column.name)} " \
+          f"{column.type.compile(dialect=engine.dialect)}"
+    default = column.default.arg if column.default is not None and column.default.is_scalar else None
+    if default is not None:
+        ddl += f" DEFAULT {default!r}" if isinstance(default, str) else f" DEFAULT {default}"
+    if not column.nullable and default is not None:
+        ddl += " NOT NULL"
+
+    print(f"Adding column {table_name}.{column.name}...")
+    with engine.begin() as connection:
+        connection.execute(text(ddl))
+    return True
+
+
+def create_indexes_if_missing(engine, table, columns=None):
+    """Create the table's model-declared indexes, optionally only those covering the given columns"""
+    existing = {index['name'] for index in inspect(engine).get_indexes(table.name)}
+    created = []
+    for index in table.indexes:
+        if columns and not any(column.name in columns for column in index.columns):
+            continue
+        if index.name in existing:
+            print(f"Index {index.name} already exists, skipping")
+            continue
+        print(f"Creating index {index.name} on {table.name}...")
+        index.create(bind=engine)
+        created.append(index.name)
+    return created
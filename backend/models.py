@@ -19,7 +19,7 @@ class Actor(db.Model):
     status = db.Column(db.String(10))
     
     # Define the relationship without backref to avoid circular reference
-    tasks = db.relationship('Task', backref='actor', lazy=True)
+    tasks = db.relationship('Task', backref='actor', lazy=True, foreign_keys='Task.actor_id')
     
     def to_dict(self):
         return {
@@ -54,6 +54,10 @@ class Group(db.Model):
 
 class Customer(db.Model):
     __tablename__ = 'customers'
+    __table_args__ = (
+        # Members of a group read when a group message is fanned out
+        db.Index('ix_customers_group_id_status', 'group_id', 'status'),
+    )
     
     customer_id = db.Column(db.Integer, primary_key=True)
     customer_name = db.Column(db.String(255), nullable=False)
@@ -128,15 +132,29 @@ class Activity(db.Model):
 
 class Task(db.Model):
     __tablename__ = 'tasks'
+    __table_args__ = (
+        # Task board listing (admin and per-assignee) in assigned order
+        db.Index('ix_tasks_assigned_timestamp_task_id', 'assigned_timestamp', 'task_id'),
+        db.Index('ix_tasks_actor_id_assigned_timestamp', 'actor_id', 'assigned_timestamp', 'task_id'),
+        # Review mode and customer filters
+        db.Index('ix_tasks_reviewer_id_assigned_timestamp', 'reviewer_id', 'assigned_timestamp'),
+        db.Index('ix_tasks_customer_id_assigned_timestamp', 'customer_id', 'assigned_timestamp'),
+        # Activity reports
+        db.Index('ix_tasks_activity_id_status', 'activity_id', 'status'),
+        # Incremental change feed
+        db.Index('ix_tasks_change_seq', 'change_seq'),
+    )
     
     task_id = db.Column(db.Integer, primary_key=True)
     task_name = db.Column(db.String(255))
     criticality = db.Column(db.String(50))
     customer_name = db.Column(db.String(255))
+    customer_id = db.Column(db.Integer, db.ForeignKey('customers.customer_id'))
     duedate = db.Column(db.Date)
     actor_id = db.Column(db.Integer, db.ForeignKey('actors.actor_id'))
     assigned_to = db.Column(db.String(255))
     reviewer = db.Column(db.String(255))
+    reviewer_id = db.Column(db.Integer, db.ForeignKey('actors.actor_id'))
     status = db.Column(db.String(50))
     reviewer_status = db.Column(db.String(50))
     link = db.Column(db.String(255))
@@ -149,6 +167,8 @@ class Task(db.Model):
     activity_type = db.Column(db.String(10))
     remarks = db.Column(db.Text)
     assigned_timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    # Commit-ordered change sequence, stamped on every write (see etags.py)
+    change_seq = db.Column(db.BigInteger, nullable=False, default=0)
 
     def to_dict(self):
         return {
@@ -156,10 +176,12 @@ class Task(db.Model):
             'task_name': self.task_name,
             'criticality': self.criticality,
             'customer_name': self.customer_name,
+            'customer_id': self.customer_id,
             'duedate': self.duedate.strftime('%Y-%m-%d') if self.duedate else None,
             'actor_id': self.actor_id,
             'assigned_to': self.assigned_to,
             'reviewer': self.reviewer,
+            'reviewer_id': self.reviewer_id,
             'status': self.status,
             'reviewer_status': self.reviewer_status,
             'link': self.link,
@@ -175,6 +197,26 @@ class Task(db.Model):
         }
 
 
+class TaskScopeChange(db.Model):
+    """Assignee, reviewer and customer a task had before one of them changed.
+
+    Lets GET /tasks/changes tell users who no longer see a task to drop it.
+    """
+    __tablename__ = 'task_scope_changes'
+    __table_args__ = (
+        # Removals since a change feed watermark
+        db.Index('ix_task_scope_changes_change_seq', 'change_seq'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.Integer, nullable=False)
+    # change_seq the task was stamped with by the change
+    change_seq = db.Column(db.BigInteger, nullable=False)
+    actor_id = db.Column(db.Integer)
+    reviewer_id = db.Column(db.Integer)
+    customer_id = db.Column(db.Integer)
+
+
 class ActivityAssignment(db.Model):
     __tablename__ = 'activity_assignments'
     
@@ -198,6 +240,10 @@ class ActivityAssignment(db.Model):
 
 class Message(db.Model):
     __tablename__ = 'messages'
+    __table_args__ = (
+        # A custom message is only saved once, see idempotency.py
+        db.Index('uq_messages_idempotency_key', 'idempotency_key', unique=True),
+    )
     
     message_id = db.Column(db.Integer, primary_key=True)
     message_description = db.Column(db.Text)
@@ -207,6 +253,8 @@ class Message(db.Model):
     email_id = db.Column(db.String(255))
     time = db.Column(db.String(50))
     status = db.Column(db.String(10), default='A')
+    # Hash of text, audience, frequency, date and time of a custom message
+    idempotency_key = db.Column(db.String(64))
     
     def to_dict(self):
         return {
@@ -257,6 +305,14 @@ class CustomerActivity(db.Model):
 
 class ReminderMail(db.Model):
     __tablename__ = 'reminder_mails'
+    __table_args__ = (
+        # Due-reminder scan in the reminder dispatcher
+        db.Index('ix_reminder_mails_status_date_time', 'status', 'date', 'time'),
+        # Failed reminders waiting for their next attempt
+        db.Index('ix_reminder_mails_status_next_attempt_at', 'status', 'next_attempt_at'),
+        # A reminder is only scheduled once, see idempotency.py
+        db.Index('uq_reminder_mails_idempotency_key', 'idempotency_key', unique=True),
+    )
     task_id = db.Column(db.String(50))
     message_des = db.Column(db.String(255))
     date = db.Column(db.Date)
@@ -264,6 +320,18 @@ class ReminderMail(db.Model):
     email_id = db.Column(db.String(45))
     status = db.Column(db.String(45))
     sno=db.Column(db.Integer,primary_key=True)
+    subject = db.Column(db.String(255))
+    # 'reminder' or 'due_today'
+    email_type = db.Column(db.String(20))
+    # Delivery retries, see mailer.retry_state
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime)
+    last_error = db.Column(db.String(255))
+    # Hash of task, reminder type, recipient, date and time
+    idempotency_key = db.Column(db.String(64))
+    # Process sending the reminder and until when, see leases.py
+    claimed_by = db.Column(db.String(100))
+    lease_until = db.Column(db.DateTime)
 
 class HolidayMaster(db.Model):
     __tablename__ = 'holiday_master'
@@ -273,16 +341,81 @@ class HolidayMaster(db.Model):
 
 class MessageQueue(db.Model):
     __tablename__ = 'message_queue'
+    __table_args__ = (
+        # Due-message scan in the email worker, one lane at a time
+        db.Index('ix_message_queue_status_priority_date_time', 'status', 'priority', 'date', 'time'),
+        # Earliest lease that runs out while messages are being sent
+        db.Index('ix_message_queue_status_lease_until', 'status', 'lease_until'),
+        # Failed messages waiting for their next attempt
+        db.Index('ix_message_queue_status_priority_next_attempt_at', 'status', 'priority', 'next_attempt_at'),
+        # A message is only queued once, see idempotency.py
+        db.Index('uq_message_queue_idempotency_key', 'idempotency_key', unique=True),
+    )
+    # Delivery lanes (see routes/messages.py): messages to a single recipient
+    # are sent ahead of group campaigns
+    PRIORITY_HIGH = 0
+    PRIORITY_BULK = 1
+
     s_no = db.Column(db.Integer, primary_key=True)
     message_des = db.Column(db.String(255))
 
     date = db.Column(db.Date)
     email_id = db.Column(db.String(255))
+    # A message to every active customer of the group instead of email_id. It
+    # is fanned out into one row per customer when it falls due (Expanded)
+    group_id = db.Column(db.Integer)
     time = db.Column(db.Time)
+    # Scheduled, Retry (waiting for next_attempt_at), Sent, Failed or Expanded
     status = db.Column(db.String(10))
+    # Worker (host:pid) currently sending the message and until when it holds it
+    claimed_by = db.Column(db.String(100))
+    lease_until = db.Column(db.DateTime)
+    # Delivery retries, see mailer.retry_state
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime)
+    last_error = db.Column(db.String(255))
+    priority = db.Column(db.SmallInteger, nullable=False, default=PRIORITY_BULK)
+    # Hash of message, recipient (email or group), date and time
+    idempotency_key = db.Column(db.String(64))
+
+class MessageSchedule(db.Model):
+    """A recurring message, queued in message_queue one occurrence at a time when it falls due"""
+    __tablename__ = 'message_schedules'
+    __table_args__ = (
+        # Next occurrence lookup per lane in the email worker
+        db.Index('ix_message_schedules_status_priority_next_date_time', 'status', 'priority', 'next_date', 'time'),
+        # A recurring message is only scheduled once, see idempotency.py
+        db.Index('uq_message_schedules_idempotency_key', 'idempotency_key', unique=True),
+    )
+
+    schedule_id = db.Column(db.Integer, primary_key=True)
+    message_des = db.Column(db.String(255))
+    # Audience: the active customers of a group, or a single recipient
+    group_id = db.Column(db.Integer)
+    email_id = db.Column(db.String(255))
+    # Occurrences per year, see recurrence.py (12 monthly, 52 weekly, ...)
+    frequency = db.Column(db.Integer, nullable=False)
+    anchor_date = db.Column(db.Date, nullable=False)
+    time = db.Column(db.Time, nullable=False)
+    # Last date to send on and most occurrences to send, either may be empty
+    end_date = db.Column(db.Date)
+    max_occurrences = db.Column(db.Integer)
+    # Occurrences queued so far and the date of the next one
+    occurrences = db.Column(db.Integer, nullable=False, default=0)
+    next_date = db.Column(db.Date)
+    priority = db.Column(db.SmallInteger, nullable=False, default=MessageQueue.PRIORITY_BULK)
+    # Active, Completed or Cancelled
+    status = db.Column(db.String(10), nullable=False, default='Active')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Hash of message, audience, frequency, anchor date and time
+    idempotency_key = db.Column(db.String(64))
     
 class Diary1(db.Model):
     __tablename__ = 'diary1'
+    __table_args__ = (
+        # Time-taken lookup by task when a task is completed
+        db.Index('ix_diary1_task', 'task'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     actor_id = db.Column(db.Integer, nullable=False)
     date = db.Column(db.Date, nullable=True)
@@ -363,4 +496,37 @@ class Role(db.Model):
         }
 
 
-    
\ No newline at end of file
+    
+class TableVersion(db.Model):
+    __tablename__ = 'table_versions'
+
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class NotificationOutbox(db.Model):
+    __tablename__ = 'notification_outbox'
+    __table_args__ = (
+        # Pending-notification scan in the outbox dispatcher
+        db.Index('ix_notification_outbox_status_outbox_id', 'status', 'outbox_id'),
+    )
+
+    outbox_id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text)
+    content_type = db.Column(db.String(10), nullable=False, default='html')
+    # Pending, Sent or Failed
+    status = db.Column(db.String(10), nullable=False, default='Pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    # Body is cleared once delivered (e.g. welcome emails with a password)
+    sensitive = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    # How the notification reads inside a digest email; NULL means it is
+    # always sent on its own
+    digest_text = db.Column(db.Text)
+    # Process sending the notification and until when, see leases.py
+    claimed_by = db.Column(db.String(100))
+    lease_until = db.Column(db.DateTime)
@@ -0,0 +1,272 @@
+"""
+Transactional outbox for email notifications.
+
+Request handlers call ``queue_notification`` instead of talking to the mail
+server. The notification row is added to the current session, so it is
+committed (or rolled back) together with the change it describes. A
+background dispatcher thread delivers pending rows in batches through the
+shared mailer (mailer.py); it is woken right after a commit that queued
+something and otherwise polls every ``OUTBOX_POLL_INTERVAL`` seconds.
+
+Every process runs a dispatcher, so notifications are leased to one of them
+before they are sent (claimed_by / lease_until, see leases.py) and only the
+holder of the lease records the result.
+
+Delivery is at-least-once: a notification is marked Sent after the server
+accepted it, so a crash between the two (or a lease that runs out while
+sending) can resend it. Failed deliveries stay Pending and are retried until
+``MAX_OUTBOX_ATTEMPTS``, then marked Failed.
+
+Notifications queued with ``sensitive=True`` (e.g. the welcome email, which
+holds the new user's password) lose their body once they are Sent or Failed,
+so it is kept only while it may still be delivered.
+
+The dispatcher also prunes the task change feed's old scope changes every
+``SCOPE_CHANGE_PRUNE_INTERVAL`` seconds (see task_events.py).
+
+Digest mode (``NOTIFICATION_DIGEST_WINDOW`` seconds, off when 0): notifications
+queued with a ``digest_text`` are held until the oldest one for the recipient
+has waited the window, then everything pending for that recipient goes out as
+one email.
+"""
+
+import os
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, bindparam, case, event, func, update
+from sqlalchemy.orm import Session
+
+from email_templates import render_email_batch
+from leases import claim_rows, lease_available, lease_batch_size, lease_held
+from mailer import mailer, MAIL_RATE_LIMIT
+from models import db, NotificationOutbox
+from task_events import prune_scope_changes
+
+# Seconds between polls when nothing wakes the dispatcher
+OUTBOX_POLL_INTERVAL = 30
+OUTBOX_BATCH_SIZE = 100
+MAX_OUTBOX_ATTEMPTS = 5
+# Seconds a dispatcher holds the notifications it is sending; if its process
+# dies they are sent by another one once the lease has run out
+OUTBOX_LEASE_SECONDS = 300
+# Seconds notifications for one recipient are collected into a single email
+NOTIFICATION_DIGEST_WINDOW = int(os.environ.get('NOTIFICATION_DIGEST_WINDOW', 0))
+DIGEST_SUBJECT = "ProSync - {} updates"
+# Seconds between deletions of task scope changes the change feed no longer needs
+SCOPE_CHANGE_PRUNE_INTERVAL = 3600
+
+_wakeup = threading.Event()
+_dispatcher_lock = threading.Lock()
+_dispatcher_thread = None
+
+
+def queue_notification(recipient, subject, body, content_type='html', sensitive=False, digest_text=None):
+    """Add an email to the current transaction; it is sent after commit.
+
+    With digest_text (plain text) the notification may be combined with
+    others for the same recipient when digest mode is on.
+    """
+    notification = NotificationOutbox(
+        recipient=recipient,
+        subject=subject,
+        body=body,
+        content_type=content_type,
+        sensitive=sensitive,
+        status='Pending',
+        attempts=0,
+        digest_text=None if sensitive else digest_text
+    )
+    db.session.add(notification)
+    db.session.info['outbox_queued'] = True
+    return notification
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_dispatcher(session):
+    if session.info.pop('outbox_queued', False):
+        _wakeup.set()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_queued(session):
+    session.info.pop('outbox_queued', None)
+
+
+def outbox_batch_size(batch_size):
+    """batch_size, capped so a batch is sent within its lease at the mail rate limit"""
+    return lease_batch_size(batch_size, MAIL_RATE_LIMIT, OUTBOX_LEASE_SECONDS)
+
+
+def build_message(notification):
+    return mailer.build_message(notification.recipient, notification.subject,
+                                notification.body, notification.content_type)
+
+
+def claim_notifications(criteria, limit=None):
+    """Lease pending notifications matching criteria to this process.
+
+    Candidates are locked with SELECT ... FOR UPDATE SKIP LOCKED on MySQL and
+    claimed with a conditional UPDATE (see leases.py), so each notification
+    is sent by one process even when every gunicorn worker runs a
+    dispatcher. Returns the claimed rows in outbox order.
+    """
+    now = datetime.utcnow()
+    candidates = NotificationOutbox.query.with_entities(NotificationOutbox.outbox_id).filter(
+        NotificationOutbox.status == 'Pending', lease_available(NotificationOutbox, now), *criteria
+    ).order_by(NotificationOutbox.outbox_id)
+    if limit is not None:
+        candidates = candidates.limit(limit)
+    candidate_ids = [row.outbox_id for row in candidates.with_for_update(skip_locked=True).all()]
+    if not claim_rows(NotificationOutbox, NotificationOutbox.outbox_id, candidate_ids, now, OUTBOX_LEASE_SECONDS,
+                      NotificationOutbox.status == 'Pending'):
+        return []
+    return NotificationOutbox.query.filter(
+        NotificationOutbox.outbox_id.in_(candidate_ids), lease_held(NotificationOutbox, now)
+    ).order_by(NotificationOutbox.outbox_id).all()
+
+
+def record_results(notifications, errors):
+    """Mark notifications sent or count a failed attempt, releasing their lease.
+
+    Only rows this process still holds are changed: when a lease ran out
+    during sending, the process that took the rows over records them.
+    """
+    now = datetime.utcnow()
+    sent_ids = [notification.outbox_id for notification, error in zip(notifications, errors) if error is None]
+    failures = [{
+        'failed_id': notification.outbox_id,
+        'attempts': notification.attempts + 1,
+        'last_error': str(error),
+        'new_status': 'Failed' if notification.attempts + 1 >= MAX_OUTBOX_ATTEMPTS else 'Pending'
+    } for notification, error in zip(notifications, errors) if error is not None]
+
+    recorded = 0
+    if sent_ids:
+        recorded += NotificationOutbox.query.filter(
+            NotificationOutbox.outbox_id.in_(sent_ids), lease_held(NotificationOutbox, now)
+        ).update({
+            'status': 'Sent',
+            'sent_at': now,
+            'attempts': NotificationOutbox.attempts + 1,
+            'last_error': None,
+            # Sensitive bodies (e.g. passwords) are not kept once delivered
+            'body': case((NotificationOutbox.sensitive, None), else_=NotificationOutbox.body),
+            'claimed_by': None,
+            'lease_until': None
+        }, synchronize_session=False)
+    if failures:
+        table = NotificationOutbox.__table__
+        recorded += db.session.execute(
+            update(table).where(table.c.outbox_id == bindparam('failed_id'), lease_held(NotificationOutbox, now))
+            .values(
+                status=bindparam('new_status'),
+                # Nor once they are given up on
+                body=case((and_(table.c.sensitive, bindparam('new_status') == 'Failed'), None), else_=table.c.body),
+                claimed_by=None,
+                lease_until=None
+            ),
+            failures
+        ).rowcount
+    db.session.commit()
+    if recorded < len(notifications):
+        print(f"⚠️ Lease on {len(notifications) - recorded} notifications ran out while sending, left to their new owner")
+    return len(sent_ids)
+
+
+def dispatch_pending(batch_size=OUTBOX_BATCH_SIZE):
+    """Deliver one batch of pending notifications and return how many were claimed"""
+    criteria = []
+    if NOTIFICATION_DIGEST_WINDOW:
+        # Those are left to dispatch_digests
+        criteria.append(NotificationOutbox.digest_text.is_(None))
+    notifications = claim_notifications(criteria, outbox_batch_size(batch_size))
+    if not notifications:
+        return 0
+
+    results = mailer.send_batch([build_message(notification) for notification in notifications])
+    for notification, error in zip(notifications, results):
+        if error is None:
+            print(f"✅ Notification {notification.outbox_id} sent to {notification.recipient}")
+    record_results(notifications, results)
+    return len(notifications)
+
+
+def dispatch_digests(now=None, window=None, batch_size=OUTBOX_BATCH_SIZE):
+    """Send one email per recipient whose oldest digest notification has waited the window.
+
+    Returns the number of recipients handled, at most batch_size.
+    """
+    window = NOTIFICATION_DIGEST_WINDOW if window is None else window
+    cutoff = (now or datetime.utcnow()) - timedelta(seconds=window)
+    pending = (NotificationOutbox.status == 'Pending', NotificationOutbox.digest_text.isnot(None))
+    recipients = [row.recipient for row in db.session.query(NotificationOutbox.recipient).filter(
+        *pending, lease_available(NotificationOutbox, datetime.utcnow())
+    ).group_by(NotificationOutbox.recipient).having(
+        func.min(NotificationOutbox.created_at) <= cutoff
+    ).limit(outbox_batch_size(batch_size)).all()]
+    if not recipients:
+        return 0
+
+    groups = {}
+    for notification in claim_notifications(
+        (NotificationOutbox.digest_text.isnot(None), NotificationOutbox.recipient.in_(recipients))
+    ):
+        groups.setdefault(notification.recipient, []).append(notification)
+
+    # A single notification is sent as it is, several as one digest
+    digests = [group for group in groups.values() if len(group) > 1]
+    digest_bodies = iter(render_email_batch('digest.html', [{'notifications': group} for group in digests]))
+    messages = [
+        build_message(group[0]) if len(group) == 1 else
+        mailer.build_message(recipient, DIGEST_SUBJECT.format(len(group)), next(digest_bodies), 'html')
+        for recipient, group in groups.items()
+    ]
+
+    results = mailer.send_batch(messages)
+    notifications, errors = [], []
+    for (recipient, group), error in zip(groups.items(), results):
+        notifications += group
+        errors += [error] * len(group)
+        if error is None and len(group) > 1:
+            print(f"✅ Digest of {len(group)} notifications sent to {recipient}")
+    record_results(notifications, errors)
+    return len(recipients)
+
+
+def _run_dispatcher(app):
+    with app.app_context():
+        print("Notification outbox dispatcher started")
+        next_prune = time.monotonic()
+        while True:
+            _wakeup.clear()
+            try:
+                db.session.remove()
+                # Keep going while full batches are delivered
+                while dispatch_pending() == outbox_batch_size(OUTBOX_BATCH_SIZE):
+                    pass
+                if NOTIFICATION_DIGEST_WINDOW:
+                    while dispatch_digests() == outbox_batch_size(OUTBOX_BATCH_SIZE):
+                        pass
+                if time.monotonic() >= next_prune:
+                    next_prune = time.monotonic() + SCOPE_CHANGE_PRUNE_INTERVAL
+                    pruned = prune_scope_changes()
+                    if pruned:
+                        print(f"Pruned {pruned} task scope changes")
+            except Exception as e:
+                print(f"Error in notification outbox dispatcher: {e}")
+                traceback.print_exc()
+                db.session.rollback()
+            _wakeup.wait(OUTBOX_POLL_INTERVAL)
+
+
+def init_outbox_dispatcher(app):
+    """Start the background dispatcher thread once per process"""
+    global _dispatcher_thread
+    with _dispatcher_lock:
+        if _dispatcher_thread is not None and _dispatcher_thread.is_alive():
+            return
+        _dispatcher_thread = threading.Thread(target=_run_dispatcher, args=(app,), daemon=True)
+        _dispatcher_thread.start()
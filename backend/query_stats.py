@@ -0,0 +1,128 @@
+"""
+Per-request SQL statement counting and N+1 detection.
+
+Every statement executed through SQLAlchemy is counted (with its time) by each
+active ``QueryStats`` collector in the current context. Collectors come from
+two places:
+
+- ``init_query_stats(app)``: when the app runs in debug mode (or
+  ``SQL_QUERY_STATS`` is set in the config) every request is measured and the
+  response gets ``X-Query-Count`` and ``X-Query-Time-Ms`` headers. Statements
+  repeated at least ``N_PLUS_ONE_THRESHOLD`` times in one request are logged
+  as likely N+1 queries through ``app.logger``.
+- ``max_queries(limit)``: a context manager for tests and benchmarks that
+  fails when the wrapped code (e.g. one test client request) issues more than
+  ``limit`` statements::
+
+      with max_queries(5):
+          client.get('/tasks?user_id=1&role_id=11')
+
+  benchmarks/check_query_bounds.py uses it to pin the statement counts of
+  GET /tasks and GET /tasks/changes.
+"""
+
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# A statement executed this many times in one request is reported as N+1
+N_PLUS_ONE_THRESHOLD = 10
+
+_active_collectors = ContextVar('query_stats_collectors', default=())
+
+
+class QueryStats:
+    """Statements seen while the collector is active"""
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.statements = Counter()
+
+    def record(self, statement, elapsed):
+        self.count += 1
+        self.total_time += elapsed
+        self.statements[_normalize(statement)] += 1
+
+    def repeated(self, threshold=N_PLUS_ONE_THRESHOLD):
+        """Statements executed at least threshold times, most frequent first"""
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+
+def _normalize(statement):
+    # IN lists of different lengths are the same query shape
+    return re.sub(r'\(\s*(?:\?|%s|:\w+)(?:\s*,\s*(?:\?|%s|:\w+))*\s*\)', '(...)', ' '.join(statement.split()))
+
+
+@contextmanager
+def collect_queries():
+    """Collect the statements executed inside the block"""
+    stats = QueryStats()
+    token = _active_collectors.set(_active_collectors.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _active_collectors.reset(token)
+
+
+@contextmanager
+def max_queries(limit):
+    """Fail with AssertionError if the block executes more than limit statements"""
+    with collect_queries() as stats:
+        yield stats
+    if stats.count > limit:
+        details = '\n'.join(f"  {count}x {statement}" for statement, count in stats.statements.most_common())
+        raise AssertionError(f"Expected at most {limit} queries, got {stats.count}:\n{details}")
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    if _active_collectors.get():
+        conn.info.setdefault('query_stats_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    collectors = _active_collectors.get()
+    if not collectors:
+        return
+    started = conn.info.get('query_stats_started')
+    elapsed = time.perf_counter() - started.pop() if started else 0.0
+    for stats in collectors:
+        stats.record(statement, elapsed)
+
+
+def init_query_stats(app):
+    """Measure every request when the app is in debug mode or SQL_QUERY_STATS is set"""
+
+    def enabled():
+        return app.debug or app.config.get('SQL_QUERY_STATS', False)
+
+    @app.before_request
+    def _start_query_stats():
+        if enabled():
+            g.query_stats = QueryStats()
+            g.query_stats_token = _active_collectors.set(_active_collectors.get() + (g.query_stats,))
+
+    @app.after_request
+    def _add_query_stats_headers(response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+        response.headers['X-Query-Count'] = str(stats.count)
+        response.headers['X-Query-Time-Ms'] = f"{stats.total_time * 1000:.1f}"
+        for statement, count in stats.repeated():
+            app.logger.warning("Possible N+1 in %s %s: %dx %s", request.method, request.path, count, statement[:200])
+        return response
+
+    @app.teardown_request
+    def _stop_query_stats(exc):
+        token = g.pop('query_stats_token', None)
+        if token is not None:
+            _active_collectors.reset(token)
@@ -0,0 +1,81 @@
+"""
+Occurrence dates for the frequency codes of activities, tasks and messages.
+
+A frequency is the number of occurrences per year:
+
+    0 one-time        1 yearly          3 every 4 months   4 quarterly
+    6 every 2 months  12 monthly        26 fortnightly     52 weekly
+    365 daily
+
+Frequencies of a year or a number of months move by calendar months and keep
+the day of the month, falling back to the last day of shorter months
+(31 January, 29 February, 31 March, ...; 29 February is 28 February in other
+years). Fortnightly, weekly and daily move by 14, 7 and 1 days. Any other
+frequency up to 365 repeats every 365 // frequency days, as tasks always
+have. A one-time frequency has a single occurrence, the anchor date.
+
+``occurrence_dates`` works on whole arrays with NumPy datetime64 arithmetic:
+anchors, frequencies and occurrence indexes are broadcast against each other
+and every date is computed in one vectorized call, so schedules for large
+groups or many recurring schedules cost no Python loop; the email worker
+computes the next dates of a whole batch of due schedules in one call.
+``occurrence_date`` is the scalar form used by the request handlers.
+"""
+
+import numpy as np
+
+MAX_FREQUENCY = 365
+
+# Months between occurrences for yearly, every 4 months, quarterly, every 2 months and monthly
+FREQUENCY_MONTHS = {1: 12, 3: 4, 4: 3, 6: 2, 12: 1}
+# Days between occurrences for fortnightly, weekly and daily
+FREQUENCY_DAYS = {26: 14, 52: 7, 365: 1}
+
+
+def _step_tables():
+    """Months and days between occurrences, indexed by frequency"""
+    months = np.zeros(MAX_FREQUENCY + 1, dtype=np.int64)
+    days = np.zeros(MAX_FREQUENCY + 1, dtype=np.int64)
+    for frequency in range(1, MAX_FREQUENCY + 1):
+        if frequency in FREQUENCY_MONTHS:
+            months[frequency] = FREQUENCY_MONTHS[frequency]
+        else:
+            days[frequency] = FREQUENCY_DAYS.get(frequency, MAX_FREQUENCY // frequency)
+    return months, days
+
+
+MONTH_STEPS, DAY_STEPS = _step_tables()
+
+
+def occurrence_dates(anchors, frequencies, indexes):
+    """Date of occurrence indexes (0 is the anchor) for each anchor and frequency.
+
+    anchors are dates (or datetime64 / ISO strings), frequencies and indexes
+    integers; all three may be scalars or arrays of any broadcastable shape.
+    Returns a datetime64[D] array of the broadcast shape. Raises ValueError
+    for a frequency outside 0 to 365.
+    """
+    anchors = np.asarray(anchors, dtype='datetime64[D]')
+    frequencies = np.asarray(frequencies, dtype=np.int64)
+    indexes = np.asarray(indexes, dtype=np.int64)
+    if frequencies.size and (frequencies.min() < 0 or frequencies.max() > MAX_FREQUENCY):
+        raise ValueError(f"Unsupported frequency, expected 0 to {MAX_FREQUENCY}")
+
+    # Day-based frequencies
+    by_days = anchors + DAY_STEPS[frequencies] * indexes
+
+    # Month-based frequencies: move the first of the month, then put the day
+    # of the month back, capped at the length of the target month
+    anchor_months = anchors.astype('datetime64[M]')
+    day_of_month = (anchors - anchor_months.astype('datetime64[D]')).astype(np.int64)
+    target_months = anchor_months + MONTH_STEPS[frequencies] * indexes
+    month_starts = target_months.astype('datetime64[D]')
+    month_lengths = ((target_months + 1).astype('datetime64[D]') - month_starts).astype(np.int64)
+    by_months = month_starts + np.minimum(day_of_month, month_lengths - 1)
+
+    return np.where(MONTH_STEPS[frequencies] > 0, by_months, by_days)
+
+
+def occurrence_date(anchor, frequency, index):
+    """Date of one occurrence (0 is anchor) as a datetime.date"""
+    return occurrence_dates(anchor, frequency, index).item()
@@ -0,0 +1,170 @@
+"""
+Dispatcher for task reminder emails stored in reminder_mails.
+
+schedule_email_reminder (tasks and activities) inserts Pending rows with the
+date and time a reminder is due. A background thread picks up due rows with a
+range query on the (status, date, time) index, sends them in batches through
+the shared pooled mailer and marks the sent rows of each batch with one
+UPDATE. Every process runs the dispatcher, so each batch is first leased to
+one process (claimed_by / lease_until, see leases.py) and only the holder of
+the lease records the result. Failed reminders are retried after an exponential backoff (status
+Retry, see mailer.retry_state) until they are given up as Failed. Only rows
+that are due are ever read, so a morning with tens of thousands of reminders
+does not scan the table.
+"""
+
+import threading
+import time
+import traceback
+from datetime import datetime
+
+from sqlalchemy import and_, bindparam, or_, update
+
+from email_templates import render_email_batch
+from leases import claim_rows, lease_available, lease_batch_size, lease_held
+from mailer import mailer, retry_state, MAIL_RATE_LIMIT
+from models import db, ReminderMail
+
+# Seconds between checks for due reminders
+REMINDER_POLL_INTERVAL = 60
+REMINDER_BATCH_SIZE = 500
+# Seconds a dispatcher holds the reminders it is sending; if its process dies
+# they are sent by another one once the lease has run out
+REMINDER_LEASE_SECONDS = 300
+
+DEFAULT_SUBJECTS = {
+    'reminder': "ProSync - Reminder: {}",
+    'due_today': "ProSync - Due Today: {}",
+}
+
+REMINDER_FIELDS = (
+    ReminderMail.sno, ReminderMail.email_id, ReminderMail.message_des,
+    ReminderMail.subject, ReminderMail.email_type, ReminderMail.attempts
+)
+
+_dispatcher_lock = threading.Lock()
+_dispatcher_thread = None
+
+
+def due_reminders_query(now):
+    """Pending reminders due at or before now, oldest first"""
+    today = now.date()
+    return ReminderMail.query.with_entities(*REMINDER_FIELDS).filter(
+        ReminderMail.status == 'Pending',
+        # Range on the (status, date) index prefix, time only matters today
+        ReminderMail.date <= today,
+        or_(ReminderMail.date < today, and_(ReminderMail.date == today, ReminderMail.time <= now.time()))
+    ).order_by(ReminderMail.date, ReminderMail.time)
+
+
+def due_retries_query(now):
+    """Failed reminders whose next attempt is due, oldest first"""
+    return ReminderMail.query.with_entities(*REMINDER_FIELDS).filter(
+        ReminderMail.status == 'Retry',
+        ReminderMail.next_attempt_at <= now
+    ).order_by(ReminderMail.next_attempt_at)
+
+
+def claim_due_reminders(now, limit):
+    """Lease up to limit reminders to send now to this process, first-time reminders before retries.
+
+    Candidates are locked with SELECT ... FOR UPDATE SKIP LOCKED on MySQL and
+    claimed with a conditional UPDATE, so concurrent dispatchers take
+    different rows. Returns the claimed reminders.
+    """
+    # Leases run on the clock, whatever moment the due reminders are picked for
+    leased_at = datetime.now()
+    candidate_ids = [row.sno for row in due_reminders_query(now).filter(
+        lease_available(ReminderMail, leased_at)
+    ).limit(limit).with_for_update(skip_locked=True).all()]
+    if len(candidate_ids) < limit:
+        candidate_ids += [row.sno for row in due_retries_query(now).filter(
+            lease_available(ReminderMail, leased_at)
+        ).limit(limit - len(candidate_ids)).with_for_update(skip_locked=True).all()]
+    if not claim_rows(ReminderMail, ReminderMail.sno, candidate_ids, leased_at, REMINDER_LEASE_SECONDS,
+                      ReminderMail.status.in_(('Pending', 'Retry'))):
+        return []
+    return ReminderMail.query.with_entities(*REMINDER_FIELDS).filter(
+        ReminderMail.sno.in_(candidate_ids), lease_held(ReminderMail, leased_at)
+    ).order_by(ReminderMail.sno).all()
+
+
+def build_reminders(reminders):
+    """Email messages for a batch of reminders, bodies rendered in one batch"""
+    bodies = render_email_batch('task_reminder.txt', [
+        {'task': reminder.message_des, 'due_today': reminder.email_type == 'due_today'}
+        for reminder in reminders
+    ])
+    messages = []
+    for reminder, body in zip(reminders, bodies):
+        email_type = reminder.email_type or 'reminder'
+        subject = reminder.subject or DEFAULT_SUBJECTS.get(email_type, DEFAULT_SUBJECTS['reminder']).format(reminder.message_des)
+        messages.append(mailer.build_message(reminder.email_id, subject, body))
+    return messages
+
+
+def dispatch_due_reminders(now=None, batch_size=REMINDER_BATCH_SIZE):
+    """Send every due reminder in batches and return (sent, failed attempts)"""
+    now = now or datetime.now()
+    # Small enough to be sent within the lease at the mail rate limit
+    batch_size = lease_batch_size(batch_size, MAIL_RATE_LIMIT, REMINDER_LEASE_SECONDS)
+    sent_total = failed_total = 0
+    while True:
+        reminders = claim_due_reminders(now, batch_size)
+        if not reminders:
+            break
+
+        results = mailer.send_concurrently(build_reminders(reminders))
+        sent_ids = [reminder.sno for reminder, error in zip(reminders, results) if error is None]
+        failures = [
+            dict(retry_state(reminder.attempts, error, now), failed_sno=reminder.sno)
+            for reminder, error in zip(reminders, results) if error is not None
+        ]
+        # Only rows whose lease this process still holds are changed
+        recorded_at = datetime.now()
+        recorded = 0
+        if sent_ids:
+            recorded += ReminderMail.query.filter(
+                ReminderMail.sno.in_(sent_ids), lease_held(ReminderMail, recorded_at)
+            ).update({'status': 'Sent', 'claimed_by': None, 'lease_until': None}, synchronize_session=False)
+        if failures:
+            table = ReminderMail.__table__
+            recorded += db.session.execute(
+                update(table).where(table.c.sno == bindparam('failed_sno'), lease_held(ReminderMail, recorded_at))
+                .values(claimed_by=None, lease_until=None),
+                failures
+            ).rowcount
+        db.session.commit()
+
+        sent_total += len(sent_ids)
+        failed_total += len(failures)
+        print(f"📧 Reminder batch delivered: {len(sent_ids)} sent, {len(failures)} failed")
+        if recorded < len(reminders):
+            print(f"⚠️ Lease on {len(reminders) - recorded} reminders ran out while sending, left to their new owner")
+        if len(reminders) < batch_size:
+            break
+    return sent_total, failed_total
+
+
+def _run_dispatcher(app):
+    with app.app_context():
+        print("Reminder dispatcher started")
+        while True:
+            try:
+                db.session.remove()
+                dispatch_due_reminders()
+            except Exception as e:
+                print(f"Error in reminder dispatcher: {e}")
+                traceback.print_exc()
+                db.session.rollback()
+            time.sleep(REMINDER_POLL_INTERVAL)
+
+
+def init_reminder_dispatcher(app):
+    """Start the background reminder thread once per process"""
+    global _dispatcher_thread
+    with _dispatcher_lock:
+        if _dispatcher_thread is not None and _dispatcher_thread.is_alive():
+            return
+        _dispatcher_thread = threading.Thread(target=_run_dispatcher, args=(app,), daemon=True)
+        _dispatcher_thread.start()
@@ -2,10 +2,6 @@ from flask import Blueprint, jsonify, request,session
 from models import db, Activity, Customer, Actor, CustomerActivity, Task, SubTask
 from datetime import datetime, timedelta, time
 from sqlalchemy import text
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import smtplib
-import logging
 import threading
 import os
 from models import ReminderMail, HolidayMaster
@@ -14,6 +10,14 @@ from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
 import json
+from fieldsets import parse_fields, model_field_names, project_query
+from fast_json import json_response
+from outbox import queue_notification
+from email_templates import render_email
+from mailer import mailer
+from recurrence import occurrence_date, MAX_FREQUENCY
+from idempotency import idempotency_key, insert_ignoring_duplicates
+from etags import etag_cached
 
 
 
@@ -21,11 +25,23 @@ import json
 
 activities_bp = Blueprint('activities', __name__)
 
+ACTIVITY_FIELDS = model_field_names(Activity)
+
 @activities_bp.route('/activities', methods=['GET'])
+@etag_cached('activities')
 def get_activities():
     try:
+        try:
+            fields = parse_fields(request.args.get('fields'), ACTIVITY_FIELDS)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
         # Modified to only get active activities
-        activities = Activity.query.filter_by(status='A').all()
+        query = Activity.query.filter_by(status='A')
+        if fields:
+            return json_response(project_query(query, Activity, fields))
+        
+        activities = query.all()
         print(activities)
         return jsonify([activity.to_dict() for activity in activities])
     except Exception as e:
@@ -181,6 +197,7 @@ def get_activity_mappings(activity_id):
         return response, 500
 
 @activities_bp.route('/actors_assign', methods=['GET'])
+@etag_cached('actors')
 def get_actors_assign():
     try:
         actors = Actor.query.filter(Actor.role_id != 11, Actor.status != 'O').all()
@@ -199,6 +216,7 @@ def get_actors_assign():
         return response, 500
 
 @activities_bp.route('/customers_assign', methods=['GET'])
+@etag_cached('customers')
 def get_customers_assign():
     try:
         customers = Customer.query.all()
@@ -216,10 +234,6 @@ def get_customers_assign():
         response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 500
 
-def calculate_new_duedate(start_date, iteration, frequency):
-    """Calculate the new due date based on frequency."""
-    return start_date + timedelta(days=(365 // frequency) * iteration)
-
 def is_weekend_or_holiday(date):
     """Check if the date is a weekend or in the holidays list."""
     return date.weekday() >= 5  # Saturday (5) or Sunday (6)
@@ -231,7 +245,7 @@ def adjust_to_previous_working_day(date):
     return date
 
 
-def schedule_email_reminder(subject, content, email, task_name, due_date, customer_name, reminder_date, task_id):
+def schedule_email_reminder(subject, email, task_name, due_date, customer_name, reminder_date, task_id):
     """Schedule an email reminder by adding it to the database"""
     try:
         # Ensure reminder_date is a date object
@@ -242,16 +256,21 @@ def schedule_email_reminder(subject, content, email, task_name, due_date, custom
         reminder_time = time(9, 0)  # 9:00 AM
         
         # Create a new reminder record
-        new_reminder = ReminderMail(
-            task_id=task_id,
-            message_des=f"{task_name} for {customer_name}",
-            date=reminder_date,
-            time=reminder_time,
-            email_id=email,
-            status="Pending"
-        )
+        new_reminder = {
+            'task_id': task_id,
+            'message_des': f"{task_name} for {customer_name}",
+            'date': reminder_date,
+            'time': reminder_time,
+            'email_id': email,
+            'status': "Pending",
+            'subject': subject,
+            'email_type': 'due_today' if reminder_date == due_date else 'reminder'
+        }
+        new_reminder['idempotency_key'] = idempotency_key(
+            new_reminder['task_id'], new_reminder['email_type'], email, reminder_date, reminder_time)
         
-        db.session.add(new_reminder)
+        # A reminder that is already scheduled is skipped (see idempotency.py)
+        db.session.execute(insert_ignoring_duplicates(ReminderMail), [new_reminder])
         db.session.commit()
         
         print(f"✅ Reminder scheduled for {reminder_date} at {reminder_time} to {email}")
@@ -288,84 +307,11 @@ def calculate_reminder_date(due_date, duration):
         
     return reminder_date
 
-def send_email_task(subject, body, to_email,task_id):
-    from_email = 'loukyarao68@gmail.com'
-    password = 'vafx kqve dwmj mvjv'
-
-    msg = MIMEMultipart()
-    msg['From'] = from_email
-    msg['To'] = to_email  # Ensure this is a valid email address
-    msg['Subject'] = subject
-    msg.attach(MIMEText(body, 'plain'))
-
-    try:
-        # Establish connection to SMTP server
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(from_email, password)
-        text = msg.as_string()
-
-        # Send email
-        server.sendmail(from_email, to_email, text)
-        server.quit()
-
-        logging.info(f'Email sent to {to_email}')
-
-        # Logging success in the database
-        try:
-            with db.engine.connect() as connection:
-                db.session.query(ReminderMail).filter_by(
-                    message_des=body,
-                    email_id=to_email,
-                    date=datetime.now().date(),
-                    time=datetime.now().time(),
-                    task_id=task_id
-                ).update({'status': 'Sent'})
- 
-                db.session.commit()
-                logging.info(f"Reminder mails updated to 'Sent' for email to {to_email}")
-        except Exception as update_error:
-            logging.error(f"Error updating reminder mails status: {update_error}")
-
-    except Exception as e:
-        logging.error(f'Failed to send email to {to_email}: {e}')
-
-        # Logging failure in the database
-        try:
-            with db.engine.connect() as connection:
-                db.session.query(ReminderMail).filter_by(
-                    message_des=body,
-                    email_id=to_email,
-                    date=datetime.now().date(),
-                    time=datetime.now().time(),
-                    task_id=task_id
-                ).update({'status': f'Failed: {e}'})
- 
-                db.session.commit()
-                logging.info(f"Reminder mails updated to 'Failed' for email to {to_email}")
-        except Exception as update_error:
-            logging.error(f"Error updating reminder mails status after failure: {update_error}")
-
 def send_email(subject, recipient, body):
-    """Send an email using SMTP"""
+    """Send an email through the shared mailer (see mailer.py)"""
     try:
-        # Email configuration
-        sender_email = "loukyarao68@gmail.com"  # Replace with your email
-        password = "vafx kqve dwmj mvjv" # Replace with your app-specific password
-        
-        # Create message
-        message = MIMEMultipart()
-        message["From"] = sender_email
-        message["To"] = recipient
-        message["Subject"] = subject
-        
-        # Add body to email
-        message.attach(MIMEText(body, "plain"))
-        
-        # Connect to server and send email
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-            server.login(sender_email, password)
-            server.sendmail(sender_email, recipient, message.as_string())
+        if not mailer.send_email(recipient, subject, body):
+            raise RuntimeError("mail server did not accept the message")
             
         print(f"✅ Email sent successfully to {recipient}")
         return True
@@ -487,11 +433,13 @@ def assign_activity():
 
         # Check if Reviewer Exists (if provided)
         reviewer_email = None
+        reviewer_id = None
         if reviewer:
             reviewer_actor = Actor.query.filter_by(actor_name=reviewer).first()
             if not reviewer_actor:
                 return jsonify({'success': False, 'message': '❌ Invalid Reviewer'}), 400
             reviewer_email = reviewer_actor.email_id
+            reviewer_id = reviewer_actor.actor_id
 
         # Check if Customer Exists
         customer = Customer.query.filter_by(customer_id=customer_id).first()
@@ -525,35 +473,16 @@ def assign_activity():
             # Parse frequency to integer with fallback
             try:
                 frequency_int = int(frequency)
-                if frequency_int <= 0:
+                if not 0 < frequency_int <= MAX_FREQUENCY:
                     frequency_int = 1  # Default to 1 (Yearly) if invalid
             except ValueError:
                 frequency_int = 1  # Default to 1 (Yearly) if parse error
                 
             print(f"Using frequency value: {frequency_int} for due date calculation")
                 
-            # Calculate due date
-            if frequency_int == 1:  # Yearly
-                due_date = datetime.now() + timedelta(days=365)
-            elif frequency_int == 12:  # Monthly
-                due_date = datetime.now() + timedelta(days=30)
-            elif frequency_int == 4:  # Quarterly
-                due_date = datetime.now() + timedelta(days=90)
-            elif frequency_int == 52:  # Weekly
-                due_date = datetime.now() + timedelta(days=7)
-            elif frequency_int == 365:  # Daily
-                due_date = datetime.now() + timedelta(days=1)
-            elif frequency_int == 26:  # Fortnightly
-                due_date = datetime.now() + timedelta(days=14)
-            elif frequency_int == 3:  # Every 4 Months
-                due_date = datetime.now() + timedelta(days=120)
-            elif frequency_int == 6:  # Every 2 Months
-                due_date = datetime.now() + timedelta(days=60)
-            elif frequency_int == 0:  # Onetime
-                due_date = datetime.now() + timedelta(days=30)  # Default to 30 days for onetime
-            else:
-                # Default calculation based on frequency
-                due_date = datetime.now() + timedelta(days=365 // frequency_int if frequency_int > 0 else 365)
+            # Calculate due date: the next occurrence from today (see recurrence.py)
+            now = datetime.now()
+            due_date = now + (occurrence_date(now.date(), frequency_int, 1) - now.date())
                 
             print(f"Calculated due date: {due_date}")
             
@@ -572,10 +501,12 @@ def assign_activity():
                 status=status,
                 link=link,
                 customer_name=customer.customer_name,
+                customer_id=customer.customer_id,
                 duedate=due_date,
                 actor_id=assigned_actor_id,
                 assigned_to=assigned_to,
                 reviewer=reviewer,  # Add reviewer to the task
+                reviewer_id=reviewer_id,
                 activity_id=activity_id,
                 initiator=initiator,
                 activity_type=activity_type,
@@ -596,6 +527,29 @@ def assign_activity():
                         db.session.add(new_subtask)
                         print(f"✅ Added subtask: {subtask_item.get('name', '')} for task {task_id}")
             
+            # Queue the assignment emails in the same transaction as the task.
+            # The calendar event is only created after the commit, so the
+            # email no longer mentions it.
+            subject = f"AWE-New Task Assigned: {activity.activity_name}"
+            email_context = dict(
+                assigned_to=assigned_to,
+                reviewer=reviewer,
+                activity_name=activity.activity_name,
+                customer_name=customer.customer_name,
+                task_id=task_id,
+                criticality=criticality,
+                due_date=due_date.strftime('%Y-%m-%d'),
+                status=status
+            )
+            content = render_email('activity_assigned.txt', **email_context)
+            queue_notification(assigned_actor_email, subject, content, content_type='plain')
+            
+            # If reviewer is assigned, notify them too
+            if reviewer and reviewer_email:
+                reviewer_email_subject = f"AWE-Task Review Required: '{activity.activity_name}' for '{customer.customer_name}'"
+                reviewer_email_content = render_email('activity_review_assigned.txt', **email_context)
+                queue_notification(reviewer_email, reviewer_email_subject, reviewer_email_content, content_type='plain')
+            
             db.session.commit()
             
             # Add to Google Calendar
@@ -663,27 +617,12 @@ Reviewer: {reviewer}
                 # Calculate reminder date
                 reminder_date = calculate_reminder_date(due_date_for_reminder, duration)
                 
-                # Prepare reminder email content
+                # The reminder body is rendered when it is sent (reminders.py)
                 reminder_email_subject = f"AWE-Reminder for '{activity.activity_name}' for '{customer.customer_name}'"
-                reminder_email_content = f"""Hello {assigned_to},
-
-The task '{activity.activity_name}' for '{customer.customer_name}' is due on '{due_date_for_reminder.strftime('%Y-%m-%d')}'.
-
-- Task Name: {activity.activity_name}
-- Task ID: {task_id}
-- Criticality: {criticality}
-- Status: {status}
-{"- Reviewer: " + reviewer if reviewer else ""}
-
-Please review the task and complete it before the due date.
-
-Regards,
-AWE Team"""
 
                 # Schedule reminder email
                 schedule_email_reminder(
                     reminder_email_subject,
-                    reminder_email_content,
                     assigned_actor_email,
                     activity.activity_name,
                     due_date_for_reminder,
@@ -692,28 +631,11 @@ AWE Team"""
                     task_id
                 )
 
-                # Schedule due date email reminder
                 due_email_subject = f"AWE-Due of '{activity.activity_name}' for '{customer.customer_name}'"
-                due_email_content = f"""Hello {assigned_to},
-
-The task '{activity.activity_name}' for '{customer.customer_name}' is due today.
-
-- Task Name: {activity.activity_name}
-- Task ID: {task_id}
-- Criticality: {criticality}
-- Status: {status}
-{"- Reviewer: " + reviewer if reviewer else ""}
-
-Please review the task and complete it today.
-Ignore if completed.
-
-Regards,
-AWE Team"""
 
                 # Schedule due date reminder
                 schedule_email_reminder(
                     due_email_subject,
-                    due_email_content,
                     assigned_actor_email,
                     activity.activity_name,
                     due_date_for_reminder,
@@ -722,78 +644,19 @@ AWE Team"""
                     task_id
                 )
                 
-                # If reviewer is assigned, send them a notification too
-                if reviewer and reviewer_email:
-                    reviewer_email_subject = f"AWE-Task Review Required: '{activity.activity_name}' for '{customer.customer_name}'"
-                    reviewer_email_content = f"""Hello {reviewer},
-
-You have been assigned as a reviewer for the task '{activity.activity_name}' for customer '{customer.customer_name}'.
-
-- Task Name: {activity.activity_name}
-- Task ID: {task_id}
-- Criticality: {criticality}
-- Assigned To: {assigned_to}
-- Due Date: {due_date_for_reminder.strftime('%Y-%m-%d')}
-- Status: {status}
-
-The assignee will complete this task and you will need to review it.
-
-Regards,
-AWE Team"""
-
-                    # Send email to reviewer
-                    send_email(reviewer_email_subject, reviewer_email, reviewer_email_content)
-                
                 print(f"✅ Email reminders scheduled for task {task_id}")
                 
             except Exception as reminder_error:
                 print(f"❌ Error scheduling reminders: {reminder_error}")
                 print(f"Error details: {type(reminder_error).__name__}: {str(reminder_error)}")
             
-            # Send immediate email notification
-            try:
-                # Prepare email content
-                subject = f"AWE-New Task Assigned: {activity.activity_name}"
-                content = f"""Dear {assigned_to},
-
-A new task '{activity.activity_name}' has been assigned to you for customer '{customer.customer_name}'.
-
-- Task Name: {activity.activity_name}
-- Task ID: {task_id}
-- Criticality: {criticality}
-- Due Date: {due_date.strftime('%Y-%m-%d')}
-- Status: {status}
-{"- Reviewer: " + reviewer if reviewer else ""}
-
-{f"This task has been added to your Google Calendar." if calendar_event_id else ""}
-
-Best regards,
-AWE Team"""
-
-                # Send email
-                print(f"✉️ Email would be sent to {assigned_actor_email} with subject: {subject}")
-                print(f"✉️ Email content: {content}")
-                
-                send_email(subject, assigned_actor_email, content)
-                
-                return jsonify({
-                    'success': True, 
-                    'message': 'Activity assigned successfully and notification sent',
-                    'email_sent': True,
-                    'calendar_added': calendar_event_id is not None,
-                    'reminders_scheduled': True
-                })
-                
-            except Exception as email_error:
-                print(f"📧 Error sending email: {email_error}")
-                # Even if email fails, the assignment was successful
-                return jsonify({
-                    'success': True, 
-                    'message': 'Activity assigned successfully but notification failed',
-                    'email_sent': False,
-                    'calendar_added': calendar_event_id is not None,
-                    'reminders_scheduled': True
-                })
+            return jsonify({
+                'success': True, 
+                'message': 'Activity assigned successfully and notification queued',
+                'email_queued': True,
+                'calendar_added': calendar_event_id is not None,
+                'reminders_scheduled': True
+            })
                 
         except Exception as task_error:
             db.session.rollback()
@@ -950,7 +813,7 @@ def get_client_tasks(client_id):
             return jsonify({"error": "Customer not found"}), 404
 
         # Query to get all tasks for this customer
-        tasks = Task.query.filter_by(customer_name=customer.customer_name).all()
+        tasks = Task.query.with_entities(Task.activity_id).filter_by(customer_id=client_id).all()
         
         # Get customer activities directly from CustomerActivity table
         customer_activities = CustomerActivity.query.filter_by(customer_id=client_id).all()
@@ -980,6 +843,7 @@ def get_client_tasks(client_id):
         return jsonify({"error": str(e)}), 500
 
 @activities_bp.route('/reviewers', methods=['GET'])
+@etag_cached('actors')
 def get_reviewers():
     try:
         # Fetch all active actors to be reviewers
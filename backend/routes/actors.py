@@ -1,12 +1,14 @@
 from flask import Blueprint, jsonify, request, make_response
 from models import db, Actor, Task
+from fieldsets import parse_fields, model_field_names, project_query
+from fast_json import json_response
+from outbox import queue_notification
+from email_templates import render_email
+from etags import etag_cached
 from datetime import datetime
 import traceback
 from flask_bcrypt import Bcrypt
 from flask import current_app
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from reportlab.lib import colors
@@ -19,84 +21,34 @@ actors_bp = Blueprint('actors', __name__)
 # Initialize Bcrypt with your Flask app
 bcrypt = Bcrypt()
 
-# Email configuration
-SENDER_EMAIL = "loukyarao68@gmail.com"  # Use the email from your tasks.py
-EMAIL_PASSWORD = "vafx kqve dwmj mvjv"  # Use the password from your tasks.py
+WELCOME_EMAIL_SUBJECT = "Welcome to ProSync - Your Account Details"
 
-def send_welcome_email(recipient_email, actor_name, actor_id, password):
-    try:
-        # Create message container
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = "Welcome to ProSync - Your Account Details"
-        msg['From'] = SENDER_EMAIL
-        msg['To'] = recipient_email
-
-        # Create the HTML version of your message
-        html = f"""
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                .header {{ background-color: #3498db; color: white; padding: 15px; text-align: center; }}
-                .content {{ padding: 20px; background-color: #f9f9f9; }}
-                .footer {{ text-align: center; margin-top: 20px; font-size: 12px; color: #999; }}
-                .credentials {{ background-color: #f0f0f0; padding: 15px; margin: 15px 0; border-left: 4px solid #3498db; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>Welcome to ProSync!</h1>
-                </div>
-                <div class="content">
-                    <p>Hello {actor_name},</p>
-                    
-                    <p>Welcome to ProSync! Your account has been successfully created. We're excited to have you on board.</p>
-                    
-                    <div class="credentials">
-                        <p><strong>Your login credentials:</strong></p>
-                        <p>Actor ID: {actor_id}</p>
-                        <p>Password: {password}</p>
-                    </div>
-                    
-                    <p>Please keep this information secure. We recommend changing your password after your first login.</p>
-                    
-                    <p>If you have any questions or need assistance, please don't hesitate to contact our support team.</p>
-                    
-                    <p>Best regards,<br>The ProSync Team</p>
-                </div>
-                <div class="footer">
-                    <p>This is an automated message, please do not reply to this email.</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+def queue_welcome_email(recipient_email, actor_name, actor_id, password):
+    """Queue the welcome email in the current transaction (see outbox.py).
 
-        # Attach parts to the message
-        part = MIMEText(html, 'html')
-        msg.attach(part)
+    The body contains the initial password, so it is cleared once delivered.
+    """
+    return queue_notification(
+        recipient_email,
+        WELCOME_EMAIL_SUBJECT,
+        render_email('welcome.html', actor_name=actor_name, actor_id=actor_id, password=password),
+        sensitive=True
+    )
 
-        # Setup the server
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(SENDER_EMAIL, EMAIL_PASSWORD)
-        
-        # Send the message
-        server.sendmail(SENDER_EMAIL, recipient_email, msg.as_string())
-        server.quit()
-        
-        print(f"Welcome email sent successfully to {recipient_email}")
-        return True
-    except Exception as e:
-        print(f"Failed to send welcome email: {str(e)}")
-        traceback.print_exc()
-        return False
+# Password hashes are never selectable through the fields parameter
+ACTOR_FIELDS = model_field_names(Actor, exclude=('password',))
 
 @actors_bp.route('/actors', methods=['GET'])
 def get_actors():
     try:
+        try:
+            fields = parse_fields(request.args.get('fields'), ACTOR_FIELDS)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        if fields:
+            return json_response(project_query(Actor.query, Actor, fields))
+        
         actors = Actor.query.all()
         # Use explicit serialization to ensure it works properly
         actor_list = []
@@ -112,6 +64,7 @@ def get_actors():
         return jsonify([]), 500  # Return empty array on error with 500 status
 
 @actors_bp.route('/actors_assign', methods=['GET'])
+@etag_cached('actors')
 def get_actors_assign():
     try:
         # Fetch actors but exclude those with role_id = 11
@@ -168,22 +121,25 @@ def add_actor_endpoint():
         )
         
         db.session.add(new_actor)
-        db.session.commit()
         
-        # Send welcome email with account details
-        email_sent = False
+        # Queue the welcome email with account details in the same transaction
+        email_queued = False
         if data.get('email_id') and original_password:
-            email_sent = send_welcome_email(
+            db.session.flush()  # assigns actor_id
+            queue_welcome_email(
                 data.get('email_id'),
                 data.get('actor_name'),
                 new_actor.actor_id,
                 original_password
             )
+            email_queued = True
+        
+        db.session.commit()
         
         response = {
             "message": "Actor added successfully", 
             "actor_id": new_actor.actor_id,
-            "email_sent": email_sent
+            "email_queued": email_queued
         }
         
         return jsonify(response), 201
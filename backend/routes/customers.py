@@ -1,5 +1,8 @@
 from flask import Blueprint, jsonify, request, make_response
 from models import db, Customer, Task
+from fieldsets import parse_fields, model_field_names, project_query
+from fast_json import json_response
+from etags import etag_cached
 import traceback
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
@@ -11,15 +14,26 @@ from flask_cors import CORS, cross_origin
 
 customers_bp = Blueprint('customers', __name__)
 
+CUSTOMER_FIELDS = model_field_names(Customer)
+
 @customers_bp.route('/customers', methods=['GET'])
 def get_customers():
     try:
+        try:
+            fields = parse_fields(request.args.get('fields'), CUSTOMER_FIELDS)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        if fields:
+            return json_response(project_query(Customer.query, Customer, fields))
+        
         customers = Customer.query.all()
         return jsonify([customer.to_dict() for customer in customers])
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @customers_bp.route('/customers_assign', methods=['GET'])
+@etag_cached('customers')
 def get_customers_assign():
     try:
         customers = Customer.query.with_entities(Customer.customer_name).all()
@@ -84,7 +98,7 @@ def delete_customer(customer_id):
         
         # Check if there are any active tasks for this customer
         active_tasks = Task.query.filter(
-            Task.customer_name == customer.customer_name,
+            Task.customer_id == customer.customer_id,
             Task.status.in_(['Yet to Start', 'WIP', 'Pending'])
         ).all()
         
@@ -180,7 +194,7 @@ def get_customer_report(customer_id):
         customer = Customer.query.get_or_404(customer_id)
         
         # Get tasks for this customer
-        tasks = Task.query.filter_by(customer_name=customer.customer_name).all()
+        tasks = Task.query.filter_by(customer_id=customer.customer_id).all()
         
         # Create a BytesIO buffer to store the PDF
         buffer = BytesIO()
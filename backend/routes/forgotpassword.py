@@ -1,12 +1,11 @@
 from flask import Blueprint, jsonify, request
 from models import db, Actor
 import random
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import bcrypt
 from datetime import datetime, timedelta
 import hashlib
+from mailer import mailer
+from email_templates import render_email
  
 forgotpassword_bp = Blueprint('forgotpassword', __name__)
  
@@ -15,36 +14,12 @@ def generate_otp():
  
 def send_otp_via_email(email, otp):
     try:
-        smtp_server = "smtp.gmail.com"
-        smtp_port = 587
-        smtp_email = "loukyarao68@gmail.com"
-        smtp_password = "vafx kqve dwmj mvjv"
- 
-        msg = MIMEMultipart()
-        msg['From'] = smtp_email
-        msg['To'] = email
-        msg['Subject'] = "Password Reset OTP"
- 
-        body = f"""
-Dear User,
- 
-Your OTP for password reset is: {otp}
- 
-This OTP will expire in 10 minutes.
- 
-Please do not share this OTP with anyone.
- 
-Best regards,
-AWE Team
-"""
-        msg.attach(MIMEText(body, 'plain'))
- 
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(smtp_email, smtp_password)
-            server.send_message(msg)
-            print("OTP email sent successfully.")
-            return True
+        body = render_email('forgot_password_otp.txt', otp=otp)
+        if not mailer.send_email(email, "Password Reset OTP", body):
+            print("Failed to send OTP")
+            return False
+        print("OTP email sent successfully.")
+        return True
     except Exception as e:
         print(f"Failed to send OTP: {e}")
         return False
@@ -1,47 +1,102 @@
 from flask import Blueprint, jsonify, request, current_app,Flask
-from models import db, Message, Customer, Group, MessageQueue
+from models import db, Message, Customer, Group, MessageQueue, MessageSchedule
 from datetime import datetime, timedelta
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import re
 import threading
 import time
 import os
-from sqlalchemy import desc
+from itertools import islice
+from sqlalchemy import desc, and_, or_, event, func, select, update, bindparam
+from sqlalchemy.orm import Session
+from recurrence import occurrence_date, occurrence_dates
+from idempotency import idempotency_key, insert_ignoring_duplicates
+from leases import worker_id, lease_available, lease_held, lease_batch_size, renew_lease
+from mailer import (mailer, Mailer, retry_state, EMAIL_HOST, EMAIL_PORT, EMAIL_HOST_USER, EMAIL_HOST_PASSWORD,
+                    EMAIL_FROM, EMAIL_USE_TLS, MAIL_ENABLED, MAIL_RATE_LIMIT, MAIL_RATE_BURST)
 
 messages_bp = Blueprint('messages', __name__)
 
-# Email configuration - update with your SMTP settings
-EMAIL_HOST = os.environ.get('EMAIL_HOST', 'smtp.gmail.com')
-EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 587))
-EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', 'your-email@gmail.com')
-EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', 'your-password')
-EMAIL_USE_TLS = True
-EMAIL_FROM = os.environ.get('EMAIL_FROM', 'your-email@gmail.com')
-
-# Global flag to control the background thread
+# Global flag to control the background threads
 email_thread_running = False
-email_thread = None
+email_threads = []
 
 # Flag to track if the thread has been started
 thread_started = False
 
+# Parallel SMTP connections used to deliver group campaigns
+MESSAGE_QUEUE_CONCURRENCY = int(os.environ.get('MESSAGE_QUEUE_CONCURRENCY', 8))
+# Due messages loaded, sent and committed together
+MESSAGE_QUEUE_BATCH_SIZE = 500
+# The same for messages to a single recipient, kept small so they go out at once
+MESSAGE_PRIORITY_CONCURRENCY = int(os.environ.get('MESSAGE_PRIORITY_CONCURRENCY', 2))
+MESSAGE_PRIORITY_BATCH_SIZE = 50
+# Rows per multi-row INSERT when a message is scheduled for a whole group
+MESSAGE_QUEUE_INSERT_CHUNK = 1000
+# Occurrences of a recurring message when no end is given, as many as used to be queued up front
+MESSAGE_SCHEDULE_OCCURRENCES = 12
+# Due schedules expanded per transaction
+MESSAGE_SCHEDULE_BATCH_SIZE = 100
+# Group members read from the customer cursor at a time when a group message is fanned out
+MESSAGE_FANOUT_BATCH_SIZE = 1000
+SCHEDULED_MESSAGE_SUBJECT = "Scheduled Message"
+# Statuses of messages still to be sent
+QUEUED_STATUSES = ("Scheduled", "Retry")
+# Longest the worker sleeps without looking at the queue. Rows scheduled by
+# another process cannot wake this one, they are picked up within this time
+MESSAGE_QUEUE_MAX_SLEEP = 300
+# Pause after an error in the worker
+MESSAGE_QUEUE_RETRY_DELAY = 30
+# Seconds a worker holds claimed messages; if it dies they are sent by another
+# worker once the lease has run out
+MESSAGE_QUEUE_LEASE_SECONDS = 300
+# Messages sent between two renewals of the lease on the rest of a batch
+MESSAGE_QUEUE_RENEW_EVERY = 100
+# Share of the account's rate limit reserved for the high priority lane, the
+# bulk lane gets the rest. Kept between 5% and 95% so neither lane is left
+# without a rate limit
+MESSAGE_PRIORITY_RATE_SHARE = min(max(float(os.environ.get('MESSAGE_PRIORITY_RATE_SHARE', 0.2)), 0.05), 0.95)
+
+class MessageLane:
+    """One priority class of the message queue.
+
+    Every lane has its own worker thread, SMTP connections, batch size and
+    share of the account's rate limit (rate_share of MAIL_RATE_LIMIT, in its
+    own token bucket), so a campaign being delivered in the bulk lane never
+    holds up a message in the high priority lane, nor slows its sends until
+    their lease runs out.
+    """
+
+    def __init__(self, name, priority, batch_size, concurrency, rate_share):
+        self.name = name
+        self.priority = priority
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        # Messages per second this lane may send, 0 without a rate limit
+        self.rate = MAIL_RATE_LIMIT * rate_share
+        # Dedicated pool so the queue does not starve the connections used by requests
+        self.mailer = Mailer(EMAIL_HOST, EMAIL_PORT, EMAIL_HOST_USER, EMAIL_HOST_PASSWORD, EMAIL_FROM,
+                             use_tls=EMAIL_USE_TLS, pool_size=concurrency, rate_limit=self.rate,
+                             burst=max(1, round(MAIL_RATE_BURST * rate_share)), enabled=MAIL_ENABLED)
+        # Set after a commit that scheduled messages in this lane (and to stop
+        # the worker) so it recomputes the next due time instead of sleeping
+        # until the old one
+        self.wakeup = threading.Event()
+
+MESSAGE_LANES = (
+    MessageLane('high', MessageQueue.PRIORITY_HIGH, MESSAGE_PRIORITY_BATCH_SIZE, MESSAGE_PRIORITY_CONCURRENCY,
+                MESSAGE_PRIORITY_RATE_SHARE),
+    MessageLane('bulk', MessageQueue.PRIORITY_BULK, MESSAGE_QUEUE_BATCH_SIZE, MESSAGE_QUEUE_CONCURRENCY,
+                1 - MESSAGE_PRIORITY_RATE_SHARE),
+)
+LANES_BY_PRIORITY = {lane.priority: lane for lane in MESSAGE_LANES}
+queue_mailer = LANES_BY_PRIORITY[MessageQueue.PRIORITY_BULK].mailer
+
 def send_email(recipient, subject, message_body):
-    """Send an email using SMTP"""
+    """Send an email through the shared mailer (see mailer.py)"""
     try:
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_FROM
-        msg['To'] = recipient
-        msg['Subject'] = subject
-        
-        msg.attach(MIMEText(message_body, 'html'))
-        
-        with smtplib.SMTP(EMAIL_HOST, EMAIL_PORT) as server:
-            if EMAIL_USE_TLS:
-                server.starttls()
-            server.login(EMAIL_HOST_USER, EMAIL_HOST_PASSWORD)
-            server.send_message(msg)
+        if not mailer.send_email(recipient, subject, message_body, content_type='html'):
+            print(f"Failed to send email to {recipient}")
+            return False
         
         print(f"Email sent successfully to {recipient}")
         return True
@@ -49,69 +104,369 @@ def send_email(recipient, subject, message_body):
         print(f"Failed to send email to {recipient}: {e}")
         return False
 
-def process_message_queue(app):
-    """Process the message queue and send emails"""
+def record_deliveries(queued, results):
+    """Mark sent messages and schedule retries for failed ones in the current transaction.
+
+    Only rows this process still holds a lease on are changed, so a worker
+    whose lease ran out cannot overwrite what the new holder did. Returns
+    (sent, to retry, rows recorded).
+    """
+    now = datetime.now()
+    sent_ids = [message.s_no for message, error in zip(queued, results) if error is None]
+    failures = [
+        dict(retry_state(message.attempts, error, now), failed_s_no=message.s_no)
+        for message, error in zip(queued, results) if error is not None
+    ]
+    recorded = 0
+    if sent_ids:
+        recorded += MessageQueue.query.filter(
+            MessageQueue.s_no.in_(sent_ids), lease_held(MessageQueue, now)
+        ).update({'status': 'Sent'}, synchronize_session=False)
+    if failures:
+        table = MessageQueue.__table__
+        recorded += db.session.execute(
+            update(table).where(table.c.s_no == bindparam('failed_s_no'), lease_held(MessageQueue, now))
+            .values(claimed_by=None, lease_until=None),
+            failures
+        ).rowcount
+    retrying = sum(1 for failure in failures if failure['status'] == 'Retry')
+    return len(sent_ids), retrying, recorded
+
+def deliver_queued_messages(queued, mailer=None, concurrency=None, renew_every=MESSAGE_QUEUE_RENEW_EVERY):
+    """Send claimed MessageQueue rows in parallel and record their status in bulk.
+
+    queued holds rows with s_no, email_id, message_des and attempts, leased
+    by claim_due_messages. They are sent renew_every at a time; after each
+    chunk its results are recorded (see record_deliveries) and the lease on
+    the rest of the batch is renewed in one commit, so a batch slowed down by
+    the mail rate limit is never taken over while it is being sent. Rows
+    whose lease was lost anyway are left to the worker that holds them now.
+    Returns the number of messages sent.
+    """
+    if not queued:
+        return 0
+    mailer = mailer or queue_mailer
+    sent_total = retry_total = failed_total = lost = 0
+    remaining = list(queued)
+    while remaining:
+        chunk, remaining = remaining[:renew_every], remaining[renew_every:]
+        emails = [
+            mailer.build_message(message.email_id, SCHEDULED_MESSAGE_SUBJECT, message.message_des, content_type='html')
+            for message in chunk
+        ]
+        results = mailer.send_concurrently(emails, concurrency)
+        sent, retrying, recorded = record_deliveries(chunk, results)
+        sent_total += sent
+        retry_total += retrying
+        failed_total += len(chunk) - sent - retrying
+        lost += len(chunk) - recorded
+        
+        remaining_ids = [message.s_no for message in remaining]
+        if renew_lease(MessageQueue, MessageQueue.s_no, remaining_ids, datetime.now(),
+                       MESSAGE_QUEUE_LEASE_SECONDS) < len(remaining_ids):
+            held = {row.s_no for row in MessageQueue.query.with_entities(MessageQueue.s_no).filter(
+                MessageQueue.s_no.in_(remaining_ids), lease_held(MessageQueue, datetime.now())
+            )}
+            lost += len(remaining) - len(held)
+            remaining = [message for message in remaining if message.s_no in held]
+    db.session.commit()
+    
+    print(f"Delivered message batch: {sent_total} sent, {retry_total} to retry, {failed_total} failed")
+    if lost:
+        print(f"⚠️ Lease on {lost} messages ran out while sending, left to their new owner")
+    return sent_total
+
+@event.listens_for(Session, 'before_flush')
+def _note_scheduled_messages(session, flush_context, instances):
+    priorities = {
+        MessageQueue.PRIORITY_BULK if obj.priority is None else obj.priority
+        for obj in session.new if isinstance(obj, (MessageQueue, MessageSchedule))
+    }
+    if priorities:
+        session.info.setdefault('message_lanes', set()).update(priorities)
+
+@event.listens_for(Session, 'after_commit')
+def _wake_message_worker(session):
+    for priority in session.info.pop('message_lanes', ()):
+        lane = LANES_BY_PRIORITY.get(priority)
+        if lane is not None:
+            lane.wakeup.set()
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_scheduled_messages(session):
+    session.info.pop('message_lanes', None)
+
+def due_messages_query(now, priority, groups=False):
+    """Scheduled messages of one lane due at or before now, oldest first.
+
+    Messages to a single recipient, or with groups=True the group messages
+    still to be fanned out.
+    """
+    today = now.date()
+    return MessageQueue.query.with_entities(
+        MessageQueue.s_no, MessageQueue.email_id, MessageQueue.message_des
+    ).filter(
+        MessageQueue.status == "Scheduled",
+        MessageQueue.priority == priority,
+        # Range on the (status, priority, date) index prefix, time only matters today
+        MessageQueue.date <= today,
+        or_(MessageQueue.date < today, and_(MessageQueue.date == today, MessageQueue.time <= now.time())),
+        MessageQueue.group_id.isnot(None) if groups else MessageQueue.group_id.is_(None)
+    ).order_by(MessageQueue.date, MessageQueue.time)
+
+def due_retries_query(now, priority):
+    """Failed messages of one lane whose next attempt is due, oldest first"""
+    return MessageQueue.query.with_entities(MessageQueue.s_no).filter(
+        MessageQueue.status == "Retry",
+        MessageQueue.priority == priority,
+        MessageQueue.next_attempt_at <= now
+    ).order_by(MessageQueue.next_attempt_at)
+
+def claim_due_messages(due_before, priority, limit=MESSAGE_QUEUE_BATCH_SIZE, rate=MAIL_RATE_LIMIT):
+    """Lease up to limit messages of one lane due at or before due_before to this process.
+
+    Scheduled messages come first, then retries whose backoff has passed.
+    Candidates are locked with SELECT ... FOR UPDATE SKIP LOCKED on MySQL so
+    concurrent workers pick different rows. The UPDATE repeats the lease
+    condition, so a row is only taken once even without SKIP LOCKED, and the
+    claim is committed before anything is sent. rate is the lane's sending
+    rate (messages per second, 0 for none); the batch is capped to what can
+    be sent at that rate well within the lease. Returns the claimed rows.
+    """
+    claimer = worker_id()
+    limit = lease_batch_size(limit, rate, MESSAGE_QUEUE_LEASE_SECONDS)
+    while True:
+        now = datetime.now()
+        candidate_ids = [row.s_no for row in due_messages_query(due_before, priority).with_entities(MessageQueue.s_no).filter(
+            lease_available(MessageQueue, now)
+        ).limit(limit).with_for_update(skip_locked=True).all()]
+        if len(candidate_ids) < limit:
+            candidate_ids += [row.s_no for row in due_retries_query(now, priority).filter(
+                lease_available(MessageQueue, now)
+            ).limit(limit - len(candidate_ids)).with_for_update(skip_locked=True).all()]
+        if not candidate_ids:
+            db.session.commit()  # Release the locks
+            return []
+
+        MessageQueue.query.filter(
+            MessageQueue.s_no.in_(candidate_ids),
+            MessageQueue.status.in_(QUEUED_STATUSES),
+            lease_available(MessageQueue, now)
+        ).update({
+            'claimed_by': claimer,
+            'lease_until': now + timedelta(seconds=MESSAGE_QUEUE_LEASE_SECONDS)
+        }, synchronize_session=False)
+        db.session.commit()
+
+        claimed = MessageQueue.query.with_entities(
+            MessageQueue.s_no, MessageQueue.email_id, MessageQueue.message_des, MessageQueue.attempts
+        ).filter(
+            MessageQueue.s_no.in_(candidate_ids),
+            lease_held(MessageQueue, now, claimer),
+            MessageQueue.status.in_(QUEUED_STATUSES)
+        ).order_by(MessageQueue.s_no).all()
+        if claimed:
+            return claimed
+        # Another worker claimed the same rows first, look for the next ones
+
+def due_schedules_query(now, priority):
+    """Recurring messages of one lane whose next occurrence is due, oldest first"""
+    today = now.date()
+    return MessageSchedule.query.filter(
+        MessageSchedule.status == "Active",
+        MessageSchedule.priority == priority,
+        # Range on the (status, priority, next_date) index prefix, time only matters today
+        MessageSchedule.next_date <= today,
+        or_(MessageSchedule.next_date < today,
+            and_(MessageSchedule.next_date == today, MessageSchedule.time <= now.time()))
+    ).order_by(MessageSchedule.next_date, MessageSchedule.time)
+
+def following_occurrences(schedules):
+    """Column values that move each schedule past the occurrence being queued.
+
+    The next dates of the whole batch come from one vectorized
+    occurrence_dates call.
+    """
+    next_dates = occurrence_dates(
+        [schedule.anchor_date for schedule in schedules],
+        [schedule.frequency or 0 for schedule in schedules],
+        [schedule.occurrences + 1 for schedule in schedules]
+    ).tolist()
+    following = []
+    for schedule, next_date in zip(schedules, next_dates):
+        occurrences = schedule.occurrences + 1
+        if (not schedule.frequency
+                or (schedule.max_occurrences is not None and occurrences >= schedule.max_occurrences)
+                or (schedule.end_date is not None and next_date > schedule.end_date)):
+            next_date = None
+        following.append({
+            'occurrences': occurrences,
+            'next_date': next_date,
+            'status': "Active" if next_date else "Completed"
+        })
+    return following
+
+def expand_due_schedules(now, priority, batch_size=MESSAGE_SCHEDULE_BATCH_SIZE):
+    """Queue the due occurrence of every recurring message of one lane.
+
+    Only that occurrence is written to message_queue; for a group it is a
+    single group message, fanned out by expand_due_group_messages. The schedule is moved to its next occurrence with an UPDATE that
+    repeats the occurrence count it was read with, in the same transaction
+    as the queued rows, so concurrent workers queue each occurrence once.
+    Returns the number of messages queued.
+    """
+    queued = 0
+    while True:
+        schedules = due_schedules_query(now, priority).limit(batch_size).all()
+        if not schedules:
+            break
+        for schedule, following in zip(schedules, following_occurrences(schedules)):
+            advanced = MessageSchedule.query.filter(
+                MessageSchedule.schedule_id == schedule.schedule_id,
+                MessageSchedule.status == "Active",
+                MessageSchedule.occurrences == schedule.occurrences
+            ).update(following, synchronize_session=False)
+            if not advanced:
+                continue  # Queued by another worker
+            if schedule.group_id:
+                queue_group_message(schedule.message_des, schedule.next_date, schedule.time, schedule.group_id)
+            else:
+                schedule_messages(schedule.message_des, [schedule.next_date], schedule.time, [schedule.email_id],
+                                  priority=schedule.priority)
+            queued += 1
+        db.session.commit()
+        if len(schedules) < batch_size:
+            break
+    if queued:
+        print(f"Queued {queued} messages for recurring schedules")
+    return queued
+
+def expand_due_group_messages(now, priority, batch_size=MESSAGE_SCHEDULE_BATCH_SIZE):
+    """Fan out the due group messages of one lane into one message per current member.
+
+    Members are read when the message is sent, so customers who joined or
+    left the group since it was scheduled are taken into account. A group
+    message is marked Expanded with a conditional UPDATE, in the same
+    transaction as its members' rows, so concurrent workers fan it out once.
+    Returns the number of messages queued.
+    """
+    queued = 0
+    while True:
+        group_messages = due_messages_query(now, priority, groups=True).with_entities(
+            MessageQueue.s_no, MessageQueue.group_id, MessageQueue.message_des, MessageQueue.date, MessageQueue.time
+        ).limit(batch_size).all()
+        if not group_messages:
+            break
+        for message in group_messages:
+            taken = MessageQueue.query.filter(
+                MessageQueue.s_no == message.s_no,
+                MessageQueue.status == "Scheduled"
+            ).update({'status': 'Expanded'}, synchronize_session=False)
+            if not taken:
+                continue  # Fanned out by another worker
+            count = 0
+            for recipients in stream_group_recipients(message.group_id):
+                count += schedule_messages(message.message_des, [message.date], message.time, recipients,
+                                           priority=priority)
+            db.session.commit()
+            print(f"Group message {message.s_no} fanned out to {count} customers of group {message.group_id}")
+            queued += count
+        if len(group_messages) < batch_size:
+            break
+    return queued
+
+def next_message_due(priority):
+    """When a lane's worker should look at the queue again, None when nothing is queued.
+
+    That is the lane's earliest scheduled message, retry nobody holds or
+    recurring message occurrence, or the moment the first lease held by
+    another worker runs out.
+    """
+    now = datetime.now()
+    candidates = []
+    # Reads the first entries of the (status, priority, date, time) index
+    first = MessageQueue.query.with_entities(MessageQueue.date, MessageQueue.time).filter(
+        MessageQueue.status == "Scheduled",
+        MessageQueue.priority == priority,
+        MessageQueue.date.isnot(None),
+        MessageQueue.time.isnot(None),
+        lease_available(MessageQueue, now)
+    ).order_by(MessageQueue.date, MessageQueue.time).first()
+    if first:
+        candidates.append(datetime.combine(first.date, first.time))
+
+    # And of the (status, priority, next_attempt_at) index
+    retry = MessageQueue.query.with_entities(MessageQueue.next_attempt_at).filter(
+        MessageQueue.status == "Retry",
+        MessageQueue.priority == priority,
+        MessageQueue.next_attempt_at.isnot(None),
+        lease_available(MessageQueue, now)
+    ).order_by(MessageQueue.next_attempt_at).first()
+    if retry:
+        candidates.append(retry.next_attempt_at)
+
+    # And of the message_schedules (status, priority, next_date, time) index
+    schedule = MessageSchedule.query.with_entities(MessageSchedule.next_date, MessageSchedule.time).filter(
+        MessageSchedule.status == "Active",
+        MessageSchedule.priority == priority,
+        MessageSchedule.next_date.isnot(None)
+    ).order_by(MessageSchedule.next_date, MessageSchedule.time).first()
+    if schedule:
+        candidates.append(datetime.combine(schedule.next_date, schedule.time))
+
+    lease_expiry = MessageQueue.query.with_entities(func.min(MessageQueue.lease_until)).filter(
+        MessageQueue.status.in_(QUEUED_STATUSES),
+        MessageQueue.lease_until >= now,
+        MessageQueue.priority == priority
+    ).scalar()
+    if lease_expiry is not None:
+        candidates.append(lease_expiry)
+    return min(candidates, default=None)
+
+def process_message_queue(app, lane):
+    """Send the messages of one lane as they fall due.
+
+    After delivering everything that is due the worker sleeps until the next
+    scheduled message, or until a commit schedules new messages, so an idle
+    queue costs one indexed lookup per wakeup instead of a scan every 30 seconds.
+    Every process runs a worker per lane; messages are leased before they are
+    sent (claim_due_messages) so the workers share the queue without double sends.
+    """
     with app.app_context():  # Create application context for the thread
-        print("Email processing thread started within app context")
+        print(f"Email processing thread for the {lane.name} lane started within app context")
         while email_thread_running:
+            # Cleared before reading the queue so a commit made meanwhile is not missed
+            lane.wakeup.clear()
             try:
-
                 db.session.remove()  # Close the session to clear any old state
-                db.session.commit()
-                # Get current date and time
                 now = datetime.now()
-                current_date = now.date()
-                current_time = now.time()
-
-                # print(current_date,current_time)
+                expand_due_schedules(now, lane.priority)
+                expand_due_group_messages(now, lane.priority)
                 
-                # print(f"Checking for messages at {now.strftime('%Y-%m-%d %H:%M:%S')}")
-
-                
-                # Find messages that are scheduled for now or earlier
-                messages_to_send = MessageQueue.query.filter(
-                    MessageQueue.time <= current_time,
-                    MessageQueue.date <= current_date,
-                    MessageQueue.status == "Scheduled"
+                # Deliver messages scheduled for now or earlier, one batch at a time
+                while True:
+                    messages_to_send = claim_due_messages(now, lane.priority, lane.batch_size, lane.rate)
                     
-                ).all()
-
-                # groups = Group.query.all()
-                # print(messages_to_send)
+                    if not messages_to_send:
+                        break
+                    print(f"Found {len(messages_to_send)} messages to process in the {lane.name} lane")
+                    deliver_queued_messages(messages_to_send, lane.mailer, lane.concurrency)
                 
-                if messages_to_send:
-                    print(f"Found {len(messages_to_send)} messages to process")
-                
-                for message in messages_to_send:
-                    # Check if the time has passed for today's messages
-                    if message.date == current_date and message.time > current_time:
-                        print(f"Message {message.s_no} scheduled for later today at {message.time}")
-                        continue
-                    
-                    # Send the email
-                    print(f"Sending email to {message.email_id}")
-                    subject = "Scheduled Message"
-                    success = send_email(message.email_id, subject, message.message_des)
-                    
-                    # Update the message status
-                    if success:
-                        message.status = "Sent"
-                        print(f"Email sent successfully to {message.email_id}")
-                    else:
-                        message.status = "Failed"
-                        print(f"Failed to send email to {message.email_id}")
-                    
-                    db.session.commit()
-                
-                # Sleep for 5 seconds before checking again
-                time.sleep(30)
+                next_due = next_message_due(lane.priority)
+                db.session.remove()  # Do not hold a connection while sleeping
+                if next_due is None:
+                    sleep_for = MESSAGE_QUEUE_MAX_SLEEP
+                else:
+                    sleep_for = min(max((next_due - datetime.now()).total_seconds(), 0), MESSAGE_QUEUE_MAX_SLEEP)
             except Exception as e:
-                print(f"Error processing message queue: {e}")
-                time.sleep(30)  # Still sleep on error to avoid tight loop
+                print(f"Error processing message queue ({lane.name} lane): {e}")
+                db.session.rollback()
+                sleep_for = MESSAGE_QUEUE_RETRY_DELAY  # Avoid a tight loop on errors
+            lane.wakeup.wait(sleep_for)
 
 def start_email_thread(app=None):
-    """Start the background thread for email processing"""
-    global email_thread_running, email_thread, thread_started
+    """Start the background threads for email processing, one per lane"""
+    global email_thread_running, thread_started
     
     if email_thread_running:
         print("Email thread is already running")
@@ -126,10 +481,12 @@ def start_email_thread(app=None):
     
     email_thread_running = True
     thread_started = True
-    email_thread = threading.Thread(target=process_message_queue, args=(app,))
-    email_thread.daemon = True  # Thread will exit when main thread exits
-    email_thread.start()
-    print("Email processing thread started")
+    for lane in MESSAGE_LANES:
+        email_thread = threading.Thread(target=process_message_queue, args=(app, lane))
+        email_thread.daemon = True  # Thread will exit when main thread exits
+        email_thread.start()
+        email_threads.append(email_thread)
+    print("Email processing threads started")
 
 # Register a function to start the email thread when the app is ready
 def init_app(app: Flask):
@@ -174,98 +531,189 @@ def get_customer_count_in_group(group_id):
         print(f"Error counting customers: {e}")
         return 0
 
-def schedule_message_to_queue(message_des, date, time_str, email_id, status):
-    """Schedule a message in the message queue"""
-    if not time_str:
-        raise ValueError("Time is required")
-   
-    try:
-        new_message = MessageQueue(
-            message_des=message_des,
-            date=date,
-            time=time_str,
-            email_id=email_id,
-            status=status
-        )
-        db.session.add(new_message)
-        db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        print(f"Error scheduling message: {e}")
-        raise
-
 def is_valid_email(email):
     """Validate email format"""
     pattern = r'^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$'
     return re.match(pattern, email)
 
-def send_custom_messages_to_group(group_id, message_description, date, time_str, email_id, status, group_name):
-    """Send custom messages to all members of a group"""
+def parse_time(value):
+    """Time of day of a form value ('HH:MM' or 'HH:MM:SS'), a TIME column read from MySQL (a timedelta) or a time"""
+    if isinstance(value, str):
+        return datetime.strptime(value[:5], '%H:%M').time()
+    if isinstance(value, timedelta):
+        return (datetime.min + value).time()
+    return value
+
+def message_key(message_des, recipient, date, time_value):
+    """Idempotency key of a queued message; recipient is an email address or group:<id>"""
+    if isinstance(date, str):
+        date = datetime.strptime(date, '%Y-%m-%d').date()
+    return idempotency_key(message_des, recipient, date, parse_time(time_value).strftime('%H:%M'))
+
+def save_custom_message(message_description, group_name, frequency, date, email_id, time_str):
+    """Store a custom message in the messages table unless the same one was already saved.
+
+    A retried or double-clicked request therefore adds one row, like the
+    messages it schedules.
+    """
+    date = datetime.strptime(date, '%Y-%m-%d').date() if date else None
+    message = {
+        'message_description': message_description,
+        'group_name': group_name,
+        'frequency': str(frequency),
+        'date': date,
+        'email_id': email_id,
+        'time': time_str,
+        'status': 'A',
+        'idempotency_key': idempotency_key(message_description, group_name, frequency, date, email_id,
+                                           parse_time(time_str).strftime('%H:%M') if time_str else None)
+    }
+    db.session.execute(insert_ignoring_duplicates(Message), [message])
+
+def insert_queue_rows(model, rows, priority):
+    """Insert message_queue or message_schedules rows, skipping those already there.
+
+    Returns the number of rows added. Core inserts bypass before_flush, so
+    the lane to wake on commit is noted here.
+    """
+    added = db.session.execute(insert_ignoring_duplicates(model), rows).rowcount
+    if added:
+        db.session.info.setdefault('message_lanes', set()).add(priority)
+    return added
+
+def schedule_messages(message_des, dates, time_str, recipients, status="Scheduled",
+                      priority=MessageQueue.PRIORITY_BULK, chunk_size=MESSAGE_QUEUE_INSERT_CHUNK):
+    """Queue a message for every recipient on every date in the current transaction.
+
+    The rows are written with multi-row INSERTs of chunk_size rows instead of
+    one ORM object and commit per row; the caller commits. A message already
+    queued for the same recipient, date and time is skipped. Returns the
+    number of rows queued.
+    """
+    if not time_str:
+        raise ValueError("Time is required")
+    # Time columns only take time objects on SQLite
+    time_value = parse_time(time_str)
+
+    rows = (
+        {'message_des': message_des, 'date': date, 'time': time_value, 'email_id': email_id,
+         'status': status, 'priority': priority,
+         'idempotency_key': message_key(message_des, email_id, date, time_value)}
+        for email_id in recipients for date in dates
+    )
+    count = 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        count += insert_queue_rows(MessageQueue, chunk, priority)
+    return count
+
+def create_message_schedule(message_des, anchor_date, time_str, frequency, group_id=None, email_id=None,
+                            max_occurrences=MESSAGE_SCHEDULE_OCCURRENCES, end_date=None):
+    """Add a recurring message for a group or a single recipient to the current transaction.
+
+    Nothing is queued yet: the email worker queues each occurrence when it
+    falls due (expand_due_schedules). The same schedule submitted twice is
+    only stored once. Returns True when it was added.
+    """
+    if not time_str:
+        raise ValueError("Time is required")
+    anchor_date = datetime.strptime(anchor_date, '%Y-%m-%d').date() if isinstance(anchor_date, str) else anchor_date
+    time_str = parse_time(time_str)
+    occurrence_date(anchor_date, frequency, 1)  # Rejects an unsupported frequency now rather than in the worker
+
+    audience = f"group:{group_id}" if group_id else email_id
+    priority = MessageQueue.PRIORITY_BULK if group_id else MessageQueue.PRIORITY_HIGH
+    schedule = {
+        'message_des': message_des,
+        'group_id': group_id,
+        'email_id': None if group_id else email_id,
+        'frequency': frequency,
+        'anchor_date': anchor_date,
+        'time': time_str,
+        'end_date': end_date,
+        'max_occurrences': max_occurrences,
+        'occurrences': 0,
+        'next_date': anchor_date,
+        'priority': priority,
+        'status': "Active",
+        'idempotency_key': idempotency_key(message_des, audience, frequency, anchor_date,
+                                           time_str.strftime('%H:%M'), end_date, max_occurrences)
+    }
+    return insert_queue_rows(MessageSchedule, [schedule], priority) > 0
+
+def queue_group_message(message_des, date, time_str, group_id):
+    """Queue one message for a whole group in the current transaction; it is fanned out when due.
+
+    Returns True when it was added, False when it was already queued.
+    """
+    if not time_str:
+        raise ValueError("Time is required")
+    time_value = parse_time(time_str)
+    message = {
+        'message_des': message_des,
+        'date': date,
+        'time': time_value,
+        'group_id': group_id,
+        'status': "Scheduled",
+        'priority': MessageQueue.PRIORITY_BULK,
+        'idempotency_key': message_key(message_des, f"group:{group_id}", date, time_value)
+    }
+    return insert_queue_rows(MessageQueue, [message], MessageQueue.PRIORITY_BULK) > 0
+
+def count_group_recipients(group_id):
+    return Customer.query.filter(Customer.group_id == group_id, Customer.status == "A").count()
+
+def stream_group_recipients(group_id, batch_size=MESSAGE_FANOUT_BATCH_SIZE):
+    """Yield the email addresses of a group's active customers, batch_size at a time.
+
+    They are read through a server-side cursor on a connection of its own,
+    so memory stays flat for any group size and the session can insert
+    while the cursor is open. SQLite cannot write while another connection
+    reads, and its cursors fetch lazily anyway, so there the session's
+    connection is used.
+    """
+    query = select(Customer.email_id).where(Customer.group_id == group_id, Customer.status == "A")
+    if db.engine.dialect.name == 'sqlite':
+        result = db.session.execute(query, execution_options={'yield_per': batch_size})
+        for partition in result.partitions():
+            yield [email_id for (email_id,) in partition]
+        return
+
+    with db.engine.connect() as connection:
+        result = connection.execution_options(yield_per=batch_size).execute(query)
+        for partition in result.partitions():
+            yield [email_id for (email_id,) in partition]
+
+def schedule_message_for(message_des, base_date, time_str, frequency, group_id=None, email_id=None):
+    """Schedule a message for a group or a single recipient in the current transaction.
+
+    A one-time message is queued right away, as a single row for a group. A
+    recurring one is stored as a single MessageSchedule row, whatever the
+    size of the audience and the number of occurrences. Returns the number
+    of recipients.
+    """
+    if frequency:
+        create_message_schedule(message_des, base_date, time_str, frequency, group_id=group_id, email_id=email_id)
+    else:
+        base_date = datetime.strptime(base_date, '%Y-%m-%d').date() if isinstance(base_date, str) else base_date
+        if group_id:
+            queue_group_message(message_des, base_date, time_str, group_id)
+        else:
+            schedule_messages(message_des, [base_date], time_str, [email_id], priority=MessageQueue.PRIORITY_HIGH)
+    return count_group_recipients(group_id) if group_id else 1
+
+def send_custom_messages_to_group(group_id, message_description, date, time_str, frequency=0):
+    """Schedule a message for all members of a group, returns the number of recipients"""
     try:
-        customer_details = fetch_customer_details(group_id)
-        for customer_name, customer_email in customer_details:
-            schedule_message_to_queue(message_description, date, time_str, customer_email, status)
-            print(f"Message scheduled successfully for {customer_name} ({customer_email})!")
+        count = schedule_message_for(message_description, date, time_str, frequency, group_id=group_id)
+        print(f"Message scheduled for {count} customers of group {group_id}")
+        return count
     except Exception as e:
         print(f"Error sending messages to group: {e}")
         raise
 
-def calculate_future_dates(base_date, frequency, count=12):
-    """Calculate future dates based on frequency"""
-    dates = []
-    try:
-        base_date = datetime.strptime(base_date, '%Y-%m-%d').date() if isinstance(base_date, str) else base_date
-        
-        if frequency == 0:  # One-time
-            return [base_date]
-        
-        for i in range(count):
-            if frequency == 1:  # Yearly
-                future_date = base_date.replace(year=base_date.year + i)
-            elif frequency == 12:  # Monthly
-                future_month = base_date.month + i
-                future_year = base_date.year + (future_month - 1) // 12
-                future_month = ((future_month - 1) % 12) + 1
-                # Handle month with fewer days
-                future_day = min(base_date.day, [31, 29 if future_year % 4 == 0 and (future_year % 100 != 0 or future_year % 400 == 0) else 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31][future_month - 1])
-                future_date = base_date.replace(year=future_year, month=future_month, day=future_day)
-            elif frequency == 4:  # Quarterly
-                months_to_add = i * 3
-                future_month = base_date.month + months_to_add
-                future_year = base_date.year + (future_month - 1) // 12
-                future_month = ((future_month - 1) % 12) + 1
-                future_day = min(base_date.day, [31, 29 if future_year % 4 == 0 and (future_year % 100 != 0 or future_year % 400 == 0) else 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31][future_month - 1])
-                future_date = base_date.replace(year=future_year, month=future_month, day=future_day)
-            elif frequency == 26:  # Fortnightly
-                future_date = base_date + timedelta(days=14 * i)
-            elif frequency == 52:  # Weekly
-                future_date = base_date + timedelta(days=7 * i)
-            elif frequency == 365:  # Daily
-                future_date = base_date + timedelta(days=i)
-            elif frequency == 3:  # Every 4 months
-                months_to_add = i * 4
-                future_month = base_date.month + months_to_add
-                future_year = base_date.year + (future_month - 1) // 12
-                future_month = ((future_month - 1) % 12) + 1
-                future_day = min(base_date.day, [31, 29 if future_year % 4 == 0 and (future_year % 100 != 0 or future_year % 400 == 0) else 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31][future_month - 1])
-                future_date = base_date.replace(year=future_year, month=future_month, day=future_day)
-            elif frequency == 6:  # Every 2 months
-                months_to_add = i * 2
-                future_month = base_date.month + months_to_add
-                future_year = base_date.year + (future_month - 1) // 12
-                future_month = ((future_month - 1) % 12) + 1
-                future_day = min(base_date.day, [31, 29 if future_year % 4 == 0 and (future_year % 100 != 0 or future_year % 400 == 0) else 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31][future_month - 1])
-                future_date = base_date.replace(year=future_year, month=future_month, day=future_day)
-            else:
-                raise ValueError(f"Unsupported frequency: {frequency}")
-            
-            dates.append(future_date)
-        
-        return dates
-    except Exception as e:
-        print(f"Error calculating future dates: {e}")
-        return [base_date]  # Return just the base date in case of error
-
 @messages_bp.route('/add_message', methods=['POST'])
 def add_message():
     """Add a new message to the messages table"""
@@ -397,14 +845,10 @@ def schedule_message_route():
         if not time and message.time:
             time = message.time
         
-        # Calculate future dates based on frequency
-        future_dates = calculate_future_dates(date, frequency)
-        
         if email_id:
             # Schedule for individual email
-            for future_date in future_dates:
-                status = "Scheduled"
-                schedule_message_to_queue(message_description, future_date, time, email_id, status)
+            schedule_message_for(message_description, date, time, frequency, email_id=email_id)
+            db.session.commit()
             
             return jsonify({"message": f"Message scheduled successfully for {email_id}"}), 200
         elif group_name_list:
@@ -413,8 +857,8 @@ def schedule_message_route():
                 group_id = group_id_from_group_table(group_name)
                 if group_id:
                     customer_count = get_customer_count_in_group(group_id)
-                    for future_date in future_dates:
-                        send_custom_messages_to_group(group_id, message_description, future_date, time, email_id, "Scheduled", group_name)
+                    send_custom_messages_to_group(group_id, message_description, date, time, frequency)
+                    db.session.commit()
                     
                     return jsonify({"message": f"Message scheduled successfully for group {group_name} with {customer_count} customers"}), 200
                 else:
@@ -422,6 +866,7 @@ def schedule_message_route():
         else:
             return jsonify({"error": "Either email or group must be provided"}), 400
     except Exception as e:
+        db.session.rollback()
         print(f"Error scheduling message: {e}")
         return jsonify({"error": str(e)}), 500
 
@@ -440,27 +885,13 @@ def custom_message_route():
         # Convert group_name to string if it's a list
         group_name = ','.join(group_name_list) if group_name_list else None
         
-        new_message = Message(
-            message_description=message_description,
-            group_name=group_name,
-            frequency=str(frequency),
-            date=datetime.strptime(date, '%Y-%m-%d').date() if date else None,
-            email_id=email_id,
-            time=time,
-            status='A'
-        )
-        
-        db.session.add(new_message)
+        save_custom_message(message_description, group_name, frequency, date, email_id, time)
         db.session.commit()
         
-        # Calculate future dates based on frequency
-        future_dates = calculate_future_dates(date, frequency)
-        
         if email_id:
             # Schedule for individual email
-            for future_date in future_dates:
-                status = "Scheduled"
-                schedule_message_to_queue(message_description, future_date, time, email_id, status)
+            schedule_message_for(message_description, date, time, frequency, email_id=email_id)
+            db.session.commit()
             
             return jsonify({"message": f"Custom message scheduled successfully for {email_id}"}), 200
         elif group_name_list:
@@ -468,9 +899,8 @@ def custom_message_route():
             for group_name in group_name_list:
                 group_id = group_id_from_group_table(group_name)
                 if group_id:
-                    customer_count = get_customer_count_in_group(group_id)
-                    for future_date in future_dates:
-                        send_custom_messages_to_group(group_id, message_description, future_date, time, email_id, "Scheduled", group_name)
+                    send_custom_messages_to_group(group_id, message_description, date, time, frequency)
+            db.session.commit()
             
             return jsonify({"message": f"Custom message scheduled successfully for {len(group_name_list)} groups"}), 200
         else:
@@ -513,12 +943,60 @@ def get_recent_messages():
         # Return an empty array on error
         return jsonify([]), 500
 
+@messages_bp.route('/message_schedules', methods=['GET'])
+def get_message_schedules():
+    """Recurring messages, Active ones unless another status is asked for"""
+    try:
+        status = request.args.get('status', 'Active')
+        schedules = MessageSchedule.query.filter_by(status=status)\
+            .order_by(MessageSchedule.next_date, MessageSchedule.time)\
+            .all()
+        
+        result = []
+        for schedule in schedules:
+            result.append({
+                'schedule_id': schedule.schedule_id,
+                'message_des': schedule.message_des,
+                'group_id': schedule.group_id,
+                'email_id': schedule.email_id,
+                'frequency': schedule.frequency,
+                'next_date': schedule.next_date.isoformat() if schedule.next_date else None,
+                'time': schedule.time.isoformat() if schedule.time else None,
+                'occurrences': schedule.occurrences,
+                'max_occurrences': schedule.max_occurrences,
+                'end_date': schedule.end_date.isoformat() if schedule.end_date else None,
+                'status': schedule.status
+            })
+        return jsonify(result)
+    
+    except Exception as e:
+        print(f"Error fetching message schedules: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@messages_bp.route('/message_schedules/<int:schedule_id>/cancel', methods=['POST'])
+def cancel_message_schedule(schedule_id):
+    """Stop a recurring message; occurrences already queued are still sent"""
+    try:
+        cancelled = MessageSchedule.query.filter_by(schedule_id=schedule_id, status='Active')\
+            .update({'status': 'Cancelled', 'next_date': None}, synchronize_session=False)
+        db.session.commit()
+        if not cancelled:
+            return jsonify({"error": "Active schedule not found"}), 404
+        return jsonify({"message": f"Schedule {schedule_id} cancelled"}), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error cancelling message schedule: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 
 @messages_bp.route('/stop_email_thread', methods=['POST'])
 def stop_email_thread():
     """API endpoint to stop the email processing thread"""
     global email_thread_running
     email_thread_running = False
+    for lane in MESSAGE_LANES:
+        lane.wakeup.set()
     return jsonify({"message": "Email processing thread stopped"}), 200
 
 @messages_bp.route('/start_email_thread', methods=['POST'])
@@ -536,29 +1014,20 @@ def send_pending_emails():
         now = datetime.now()
         current_date = now.date()
         
-        # Find messages that are scheduled for today or earlier
-        messages_to_send = MessageQueue.query.filter(
-            MessageQueue.date <= current_date,
-            MessageQueue.status == "Scheduled"
-        ).all()
-        
-        sent_count = 0
-        for message in messages_to_send:
-            # Send the email
-            subject = "Scheduled Message"
-            success = send_email(message.email_id, subject, message.message_des)
-            
-            # Update the message status
-            if success:
-                message.status = "Sent"
-                sent_count += 1
-            else:
-                message.status = "Failed"
-            
-            db.session.commit()
+        # Claim and send messages that are scheduled for today or earlier
+        end_of_today = datetime.combine(current_date, datetime.max.time())
+        processed_count = sent_count = 0
+        for lane in MESSAGE_LANES:
+            expand_due_group_messages(end_of_today, lane.priority)
+            while True:
+                messages_to_send = claim_due_messages(end_of_today, lane.priority, lane.batch_size, lane.rate)
+                if not messages_to_send:
+                    break
+                processed_count += len(messages_to_send)
+                sent_count += deliver_queued_messages(messages_to_send, lane.mailer, lane.concurrency)
         
         return jsonify({
-            "message": f"Processed {len(messages_to_send)} messages, sent {sent_count} emails successfully"
+            "message": f"Processed {processed_count} messages, sent {sent_count} emails successfully"
         }), 200
     except Exception as e:
         print(f"Error sending pending emails: {e}")
@@ -588,21 +1057,9 @@ def schedule_message_api():
         message_description = message.message_description
         frequency = int(message.frequency) if message.frequency else 0
         
-        # Calculate future dates based on frequency
-        future_dates = calculate_future_dates(date, frequency)
-        
         if email_id:
             # Schedule for individual email
-            for future_date in future_dates:
-                new_queue_item = MessageQueue(
-                    message_des=message_description,
-                    date=future_date,
-                    time=time,
-                    email_id=email_id,
-                    status="Scheduled"
-                )
-                db.session.add(new_queue_item)
-            
+            schedule_message_for(message_description, date, time, frequency, email_id=email_id)
             db.session.commit()
             return jsonify({"message": f"Message scheduled successfully for {email_id}"}), 200
             
@@ -614,20 +1071,7 @@ def schedule_message_api():
                 if isinstance(group_name, str):
                     group_id = group_id_from_group_table(group_name)
                     if group_id:
-                        # Get all customers in this group
-                        customers = fetch_customer_details(group_id)
-                        for customer_name, customer_email in customers:
-                            # Schedule for each date
-                            for future_date in future_dates:
-                                new_queue_item = MessageQueue(
-                                    message_des=message_description,
-                                    date=future_date,
-                                    time=time,
-                                    email_id=customer_email,
-                                    status="Scheduled"
-                                )
-                                db.session.add(new_queue_item)
-                                scheduled_count += 1
+                        scheduled_count += send_custom_messages_to_group(group_id, message_description, date, time, frequency)
             
             db.session.commit()
             return jsonify({"message": f"Message scheduled successfully for {scheduled_count} recipients"}), 200
@@ -662,34 +1106,12 @@ def custom_message_api():
         # Convert group_name to string if it's a list
         group_name = ','.join(group_names) if isinstance(group_names, list) else group_names
         
-        new_message = Message(
-            message_description=message_description,
-            group_name=group_name,
-            frequency=str(frequency),
-            date=datetime.strptime(date, '%Y-%m-%d').date() if date else None,
-            email_id=email_id,
-            time=time,
-            status='A'
-        )
-        
-        db.session.add(new_message)
+        save_custom_message(message_description, group_name, frequency, date, email_id, time)
         db.session.commit()
         
-        # Calculate future dates based on frequency
-        future_dates = calculate_future_dates(date, frequency)
-        
         if email_id:
             # Schedule for individual email
-            for future_date in future_dates:
-                new_queue_item = MessageQueue(
-                    message_des=message_description,
-                    date=future_date,
-                    time=time,
-                    email_id=email_id,
-                    status="Scheduled"
-                )
-                db.session.add(new_queue_item)
-            
+            schedule_message_for(message_description, date, time, frequency, email_id=email_id)
             db.session.commit()
             return jsonify({"message": f"Custom message scheduled successfully for {email_id}"}), 200
             
@@ -701,20 +1123,7 @@ def custom_message_api():
                 if isinstance(group_name, str):
                     group_id = group_id_from_group_table(group_name)
                     if group_id:
-                        # Get all customers in this group
-                        customers = fetch_customer_details(group_id)
-                        for customer_name, customer_email in customers:
-                            # Schedule for each date
-                            for future_date in future_dates:
-                                new_queue_item = MessageQueue(
-                                    message_des=message_description,
-                                    date=future_date,
-                                    time=time,
-                                    email_id=customer_email,
-                                    status="Scheduled"
-                                )
-                                db.session.add(new_queue_item)
-                                scheduled_count += 1
+                        scheduled_count += send_custom_messages_to_group(group_id, message_description, date, time, frequency)
             
             db.session.commit()
             return jsonify({"message": f"Custom message scheduled successfully for {scheduled_count} recipients"}), 200
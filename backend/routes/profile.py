@@ -3,10 +3,9 @@ from models import db, Actor, Group, Role
 from datetime import datetime
 from flask_login import current_user, login_required
 import bcrypt
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import os
+from mailer import mailer
+from email_templates import render_email
 
 profile_bp = Blueprint('profile', __name__)
 
@@ -197,60 +196,8 @@ def request_otp():
         
         # Create email content
         subject = "Your Password Reset OTP - ProSync"
-        html_body = f"""
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                .header {{ background-color: #4A76A8; color: white; padding: 10px 20px; text-align: center; }}
-                .content {{ padding: 20px; background-color: #f9f9f9; }}
-                .otp-box {{ background-color: #ffffff; border: 1px solid #ddd; padding: 15px; text-align: center; margin: 20px 0; }}
-                .otp-code {{ font-size: 24px; letter-spacing: 5px; font-weight: bold; color: #4A76A8; }}
-                .footer {{ font-size: 12px; text-align: center; margin-top: 20px; color: #777; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h2>Password Reset Verification</h2>
-                </div>
-                <div class="content">
-                    <p>Hello {actor_name},</p>
-                    <p>You recently requested to reset your password. Use the following One-Time Password (OTP) to complete the process:</p>
-                    
-                    <div class="otp-box">
-                        <div class="otp-code">{otp}</div>
-                    </div>
-                    
-                    <p>This OTP will expire in 15 minutes for security reasons.</p>
-                    <p>If you did not request this password reset, please ignore this email or contact support if you have concerns.</p>
-                    <p>Thank you,<br>The ProSync Team</p>
-                </div>
-                <div class="footer">
-                    <p>This is an automated message. Please do not reply to this email.</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        text_body = f"""
-        Password Reset Verification
-        
-        Hello {actor_name},
-        
-        You recently requested to reset your password. Use the following One-Time Password (OTP) to complete the process:
-        
-        {otp}
-        
-        This OTP will expire in 15 minutes for security reasons.
-        
-        If you did not request this password reset, please ignore this email or contact support if you have concerns.
-        
-        Thank you,
-        The ProSync Team
-        """
+        html_body = render_email('password_reset_otp.html', actor_name=actor_name, otp=otp)
+        text_body = render_email('password_reset_otp.txt', actor_name=actor_name, otp=otp)
         
         # Try to send the email
         try:
@@ -377,34 +324,16 @@ def reset_password():
 
 # Add this function to handle email sending
 def send_email(to_email, subject, text_body, html_body=None):
-    """Send an email using SMTP"""
-    # Email configuration - update with your actual email settings
-    smtp_server = "smtp.gmail.com"  # e.g., smtp.gmail.com
-    smtp_port = 587  # typically 587 for TLS
-    smtp_username = "loukyarao68@gmail.com"  # Your email address
-    smtp_password = "vafx kqve dwmj mvjv"  # Your email password or app password
-    
-    # Create message
-    msg = MIMEMultipart('alternative')
-    msg['Subject'] = subject
-    msg['From'] = f"ProSync <{smtp_username}>"
-    msg['To'] = to_email
-    
-    # Add text body
-    msg.attach(MIMEText(text_body, 'plain'))
-    
-    # Add HTML body if provided
-    if html_body:
-        msg.attach(MIMEText(html_body, 'html'))
+    """Send an email through the shared mailer (see mailer.py)"""
+    msg = mailer.build_message(to_email, subject, text_body, html_body=html_body)
+    msg.replace_header('From', f"ProSync <{mailer.sender}>")
     
     # Try to send the email
     try:
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(smtp_username, smtp_password)
-            server.sendmail(smtp_username, to_email, msg.as_string())
+        if mailer.send(msg):
             print(f"Email successfully sent to {to_email}")
             return True
+        raise RuntimeError("mail server did not accept the message")
     except Exception as e:
         print(f"Error sending email: {e}")
         # For development, log the email details that would have been sent
@@ -45,7 +45,7 @@ def get_activity_data():
         ).join(
             Actor, Task.employee_id == Actor.actor_id
         ).join(
-            Customer, Task.customer_name == Customer.customer_name
+            Customer, Task.customer_id == Customer.customer_id
         ).join(
             Activity, Task.task_name == Activity.activity_id
         ).filter(
@@ -616,7 +616,7 @@ def get_employee_performance(actor_id):
         ).join(
             Activity, Task.activity_id == Activity.activity_id
         ).join(
-            Customer, Task.customer_name == Customer.customer_name
+            Customer, Task.customer_id == Customer.customer_id
         ).filter(
             Task.actor_id == actor_id,
             Task.status == 'completed'
@@ -653,7 +653,7 @@ def download_employee_performance(actor_id):
         ).join(
             Activity, Task.activity_id == Activity.activity_id
         ).join(
-            Customer, Task.customer_name == Customer.customer_name
+            Customer, Task.customer_id == Customer.customer_id
         ).filter(
             Task.actor_id == actor_id,
             Task.status == 'completed'
@@ -917,7 +917,7 @@ def download_customer_report(customer_id):
         ).join(
             Actor, Task.actor_id == Actor.actor_id
         ).filter(
-            Task.customer_name == customer.customer_name  # Use customer_name instead of customer_id
+            Task.customer_id == customer.customer_id
         ).all()
         
         # Create a PDF file
@@ -1,23 +1,190 @@
-from flask import Blueprint, jsonify, request
-from models import db, Task, ActivityAssignment, Actor, Diary1, Activity, Customer, SubTask
+from flask import Blueprint, jsonify, request, Response
+from models import db, Task, ActivityAssignment, Actor, Diary1, Activity, Customer, SubTask, TaskScopeChange
 from datetime import datetime
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import smtplib
-import logging
 import threading
 import os
 from models import ReminderMail, HolidayMaster
 from flask_cors import cross_origin
+from sqlalchemy import and_, or_
 import traceback
 import json
+import base64
+import queue
+from fieldsets import parse_fields
+from etags import etag_cached, get_table_versions
+from fast_json import compile_row_serializer, isoformat, json_response
+from task_events import broker, change_feed_horizon, public_event
+from outbox import queue_notification
+from email_templates import render_email
+from mailer import mailer
+from idempotency import idempotency_key, insert_ignoring_duplicates
 
 from datetime import datetime, timedelta, time
 
 
 tasks_bp = Blueprint('tasks', __name__)
 
+# Page size bounds for cursor-paginated task listing
+DEFAULT_TASK_PAGE_SIZE = 100
+MAX_TASK_PAGE_SIZE = 500
+
+
+def encode_task_cursor(task):
+    """Build an opaque cursor pointing just after the given task in board order"""
+    timestamp = task.assigned_timestamp.isoformat() if task.assigned_timestamp else None
+    payload = json.dumps([timestamp, task.task_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_task_cursor(cursor):
+    """Decode a cursor created by encode_task_cursor into (assigned_timestamp, task_id)"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, task_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        timestamp = datetime.fromisoformat(timestamp) if timestamp else None
+        return timestamp, int(task_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def apply_task_cursor(query, cursor):
+    """Restrict a task query to rows after the cursor.
+
+    Tasks are listed by (assigned_timestamp DESC, task_id DESC) with NULL
+    timestamps last, so the seek predicate mirrors that ordering and lets the
+    database start from the cursor position instead of skipping rows.
+    """
+    timestamp, task_id = decode_task_cursor(cursor)
+    if timestamp is None:
+        return query.filter(Task.assigned_timestamp.is_(None), Task.task_id < task_id)
+    return query.filter(or_(
+        Task.assigned_timestamp < timestamp,
+        and_(Task.assigned_timestamp == timestamp, Task.task_id < task_id),
+        Task.assigned_timestamp.is_(None)
+    ))
+
+
+# Task board response fields: response key -> (column, formatter)
+TASK_LIST_FIELDS = {
+    'id': (Task.task_id, str),
+    'task_name': (Task.task_name, None),
+    'link': (Task.link, None),
+    'status': (Task.status, None),
+    'criticality': (Task.criticality, None),
+    'assignee': (Task.assigned_to, None),
+    'actor_id': (Task.actor_id, str),
+    'due_date': (Task.duedate, isoformat),
+    'initiator': (Task.initiator, None),
+    'time_taken': (Task.duration, None),
+    'customer_name': (Task.customer_name, None),
+    'customer_id': (Task.customer_id, None),
+    'title': (Task.task_name, None),
+    'remarks': (Task.remarks, None),
+    'reviewer': (Task.reviewer, None),
+    'reviewer_id': (Task.reviewer_id, None),
+    'reviewer_status': (Task.reviewer_status, None),
+    'assigned_timestamp': (Task.assigned_timestamp, isoformat),
+}
+
+
+def task_list_columns(fields):
+    """Columns to select for the requested response fields.
+
+    task_id and assigned_timestamp are always selected because the pagination
+    cursor is built from them.
+    """
+    columns = [Task.task_id, Task.assigned_timestamp]
+    for name in fields:
+        column = TASK_LIST_FIELDS[name][0]
+        if not any(column is selected for selected in columns):
+            columns.append(column)
+    return columns
+
+
+def serialize_task_rows(rows, fields):
+    """Convert rows selected with task_list_columns(fields) into the task board
+    response format. The result must be sent with json_response."""
+    columns = task_list_columns(fields)
+    serializer = compile_row_serializer([
+        (name, next(i for i, column in enumerate(columns) if column is TASK_LIST_FIELDS[name][0]),
+         TASK_LIST_FIELDS[name][1])
+        for name in fields
+    ])
+    return serializer(rows)
+
+
+def filter_visible_tasks(query, current_user, user_id, role_id, review_mode, auditor_id=None, client_id=None):
+    """Restrict a task query to what the requesting user sees on the task board.
+
+    Returns None when the filters can match nothing (a non-admin request
+    without a user).
+    """
+    if review_mode:
+        # In review mode, get tasks where the current user is the reviewer
+        print(f"Filtering review tasks for reviewer: {current_user.actor_name}")
+        return query.filter(Task.reviewer_id == current_user.actor_id)
+
+    # Normal mode - get tasks assigned to the user
+    if auditor_id:
+        print(f"Filtering tasks for auditor_id: {auditor_id}")
+        return query.filter(Task.actor_id == auditor_id)
+    if client_id:
+        print(f"Filtering tasks for client_id: {client_id}")
+        return query.filter(Task.customer_id == client_id)
+    if role_id != "11":  # Not admin
+        if not user_id:
+            return None
+        return query.filter(Task.actor_id == user_id)
+    return query
+
+
+def filter_scope_changes(query, current_user, user_id, role_id, review_mode, auditor_id=None, client_id=None):
+    """Restrict a TaskScopeChange query to tasks the user saw before the change.
+
+    The counterpart of filter_visible_tasks on the previous assignee, reviewer
+    or customer. Returns None when no task can leave the user's view (an
+    unfiltered admin board).
+    """
+    if review_mode:
+        return query.filter(TaskScopeChange.reviewer_id == current_user.actor_id)
+    if auditor_id:
+        return query.filter(TaskScopeChange.actor_id == auditor_id)
+    if client_id:
+        return query.filter(TaskScopeChange.customer_id == client_id)
+    if role_id != "11":
+        if not user_id:
+            return None
+        return query.filter(TaskScopeChange.actor_id == user_id)
+    return None
+
+
+def removed_task_ids(since_seq, since_task_id, until_seq, visibility):
+    """Tasks that left the user's view in the change_seq range of a feed page.
+
+    visibility is (current_user, user_id, role_id, review_mode, auditor_id,
+    client_id). Tasks the user sees again are left out, they come back as
+    updates.
+    """
+    query = db.session.query(TaskScopeChange.task_id).filter(
+        # A page that resumed within a seq also reports that seq's removals
+        TaskScopeChange.change_seq >= since_seq if since_task_id is not None else TaskScopeChange.change_seq > since_seq,
+        TaskScopeChange.change_seq <= until_seq
+    )
+    query = filter_scope_changes(query, *visibility)
+    if query is None:
+        return []
+    task_ids = {row.task_id for row in query.distinct().all()}
+    if not task_ids:
+        return []
+    still_visible = filter_visible_tasks(
+        Task.query.with_entities(Task.task_id).filter(Task.task_id.in_(task_ids)), *visibility
+    )
+    task_ids -= {row.task_id for row in still_visible.all()}
+    return sorted(str(task_id) for task_id in task_ids)
+
+
 @tasks_bp.route('/tasks', methods=['GET'])
+@etag_cached('tasks', 'actors', 'customers')
 def get_tasks():
     try:
         # Get user information from request
@@ -29,6 +196,20 @@ def get_tasks():
         auditor_id = request.args.get('auditor_id')
         client_id = request.args.get('client_id')
         
+        # Pagination is opt-in: passing limit or cursor switches the response
+        # to {"tasks": [...], "next_cursor": ...}
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit', type=int)
+        paginate = cursor is not None or limit is not None
+        if paginate:
+            limit = max(1, min(limit or DEFAULT_TASK_PAGE_SIZE, MAX_TASK_PAGE_SIZE))
+        
+        # Optional sparse fieldset, e.g. fields=id,title,status
+        try:
+            fields = parse_fields(request.args.get('fields'), TASK_LIST_FIELDS) or list(TASK_LIST_FIELDS)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
         print(f"Fetching tasks with filters - User ID: {user_id}, Role ID: {role_id}, "
               f"Auditor ID: {auditor_id}, Client ID: {client_id}, Review Mode: {review_mode}")
         
@@ -36,58 +217,50 @@ def get_tasks():
         current_user = Actor.query.get(user_id)
         if not current_user:
             return jsonify({"error": "User not found"}), 404
+        
+        # Read the change watermark before the tasks so nothing committed in
+        # between can be missed by a later /tasks/changes call
+        watermark = get_table_versions(['tasks'])['tasks']
             
-        # Base query with ordering by assigned_timestamp in descending order
-        query = Task.query.order_by(Task.assigned_timestamp.desc())
+        # Base query with ordering by assigned_timestamp in descending order,
+        # task_id breaks ties so the order is stable across pages. Only the
+        # columns needed for the requested fields are selected.
+        query = Task.query.with_entities(*task_list_columns(fields)).order_by(
+            Task.assigned_timestamp.desc(), Task.task_id.desc()
+        )
         
         # Apply filters based on role and parameters
-        if review_mode:
-            # In review mode, get tasks where the current user's name matches the reviewer field
-            query = query.filter(Task.reviewer == current_user.actor_name)
-            print(f"Filtering review tasks for reviewer: {current_user.actor_name}")
+        query = filter_visible_tasks(query, current_user, user_id, role_id, review_mode, auditor_id, client_id)
+        if query is None:
+            return json_response({"tasks": [], "next_cursor": None} if paginate else [])
+        
+        next_cursor = None
+        if paginate:
+            if cursor:
+                try:
+                    query = apply_task_cursor(query, cursor)
+                except ValueError as e:
+                    return jsonify({"error": str(e)}), 400
+            
+            # Fetch one extra row to know whether another page exists
+            tasks = query.limit(limit + 1).all()
+            if len(tasks) > limit:
+                tasks = tasks[:limit]
+                next_cursor = encode_task_cursor(tasks[-1])
         else:
-            # Normal mode - get tasks assigned to the user
-            if auditor_id:
-                print(f"Filtering tasks for auditor_id: {auditor_id}")
-                query = query.filter(Task.actor_id == auditor_id)
-            elif client_id:
-                print(f"Filtering tasks for client_id: {client_id}")
-                customer = Customer.query.filter_by(customer_id=client_id).first()
-                if customer:
-                    query = query.filter(Task.customer_name == customer.customer_name)
-                else:
-                    return jsonify([])
-            elif role_id != "11":  # Not admin
-                if user_id:
-                    query = query.filter(Task.actor_id == user_id)
-                else:
-                    return jsonify([])
-        
-        # Execute query and get all tasks
-        tasks = query.all()
+            # Execute query and get all tasks
+            tasks = query.all()
         print(f"Found {len(tasks)} tasks for the given filters")
         
         # Convert tasks to response format
-        tasks_response = [{
-            'id': str(task.task_id),
-            'task_name': task.task_name,
-            'link': task.link,
-            'status': task.status,
-            'criticality': task.criticality,
-            'assignee': task.assigned_to,
-            'actor_id': str(task.actor_id),
-            'due_date': task.duedate.isoformat() if task.duedate else None,
-            'initiator': task.initiator,
-            'time_taken': task.duration,
-            'customer_name': task.customer_name,
-            'title': task.task_name,
-            'remarks': task.remarks,
-            'reviewer': task.reviewer,  # Add reviewer field to response
-            'reviewer_status': task.reviewer_status,  # Add reviewer_status field to response
-            'assigned_timestamp': task.assigned_timestamp.isoformat() if task.assigned_timestamp else None
-        } for task in tasks]
-        
-        return jsonify(tasks_response)
+        tasks_response = serialize_task_rows(tasks, fields)
+        
+        if paginate:
+            response = json_response({"tasks": tasks_response, "next_cursor": next_cursor})
+        else:
+            response = json_response(tasks_response)
+        response.headers['X-Task-Watermark'] = str(watermark)
+        return response
         
     except Exception as e:
         print("Error fetching tasks:", e)
@@ -96,6 +269,160 @@ def get_tasks():
         return jsonify({'error': 'Failed to fetch tasks'}), 500
     
 
+# Page size bound for the incremental change feed
+MAX_TASK_CHANGES = 1000
+
+
+def parse_task_watermark(watermark):
+    """Parse a change feed watermark: "<seq>" or "<seq>-<task_id>" mid-sequence"""
+    try:
+        seq, _, task_id = watermark.partition('-')
+        return int(seq), int(task_id) if task_id else None
+    except ValueError:
+        raise ValueError("since must be a watermark returned by the server")
+
+
+@tasks_bp.route('/tasks/changes', methods=['GET'])
+def get_task_changes():
+    """Tasks created or updated since a watermark.
+
+    The watermark comes from the X-Task-Watermark header of GET /tasks or from
+    a previous call to this endpoint. Tasks that were soft-removed (for example
+    marked Pending when their assignee or customer was deactivated) come back
+    as updates with their new status. Tasks the user no longer sees, because
+    they were given to another assignee, reviewer or customer, are listed by
+    id under "removed". When has_more is true, call again with the returned
+    watermark to get the rest. A watermark older than the change feed keeps
+    (see task_events.TASK_CHANGE_FEED_RETENTION) is answered with 410 and
+    "resync": the client must reload GET /tasks.
+    """
+    try:
+        user_id = request.args.get('user_id')
+        role_id = request.args.get('role_id')
+        review_mode = request.args.get('review_mode', 'false').lower() == 'true'
+        auditor_id = request.args.get('auditor_id')
+        client_id = request.args.get('client_id')
+        
+        try:
+            since_seq, since_task_id = parse_task_watermark(request.args.get('since', ''))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        limit = request.args.get('limit', MAX_TASK_CHANGES, type=int)
+        limit = max(1, min(limit, MAX_TASK_CHANGES))
+        
+        try:
+            fields = parse_fields(request.args.get('fields'), TASK_LIST_FIELDS) or list(TASK_LIST_FIELDS)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        current_user = Actor.query.get(user_id)
+        if not current_user:
+            return jsonify({"error": "User not found"}), 404
+        
+        current_watermark = get_table_versions(['tasks'])['tasks']
+        if since_seq < change_feed_horizon(current_watermark):
+            return jsonify({
+                "error": "since is older than the change feed keeps, reload GET /tasks",
+                "resync": True
+            }), 410
+        
+        query = Task.query.with_entities(*task_list_columns(fields), Task.change_seq).order_by(
+            Task.change_seq, Task.task_id
+        )
+        if since_task_id is None:
+            query = query.filter(Task.change_seq > since_seq)
+        else:
+            query = query.filter(or_(
+                Task.change_seq > since_seq,
+                and_(Task.change_seq == since_seq, Task.task_id > since_task_id)
+            ))
+        query = filter_visible_tasks(query, current_user, user_id, role_id, review_mode, auditor_id, client_id)
+        if query is None:
+            return json_response({"tasks": [], "removed": [], "watermark": str(max(current_watermark, since_seq)),
+                                  "has_more": False})
+        
+        # Fetch one extra row to know whether another page exists
+        tasks = query.limit(limit + 1).all()
+        has_more = len(tasks) > limit
+        if has_more:
+            # One transaction can stamp many tasks with the same change_seq,
+            # so a partial page resumes from the last task within that seq
+            tasks = tasks[:limit]
+            until_seq = tasks[-1].change_seq
+            watermark = f"{tasks[-1].change_seq}-{tasks[-1].task_id}"
+        else:
+            until_seq = max(current_watermark, since_seq)
+            watermark = str(until_seq)
+        
+        removed = removed_task_ids(since_seq, since_task_id, until_seq,
+                                   (current_user, user_id, role_id, review_mode, auditor_id, client_id))
+        
+        print(f"Found {len(tasks)} changed and {len(removed)} removed tasks since {since_seq}")
+        return json_response({
+            "tasks": serialize_task_rows(tasks, fields),
+            "removed": removed,
+            "watermark": watermark,
+            "has_more": has_more
+        })
+    
+    except Exception as e:
+        print("Error fetching task changes:", e)
+        traceback.print_exc()
+        return jsonify({'error': 'Failed to fetch task changes'}), 500
+
+
+# Seconds between keep-alive comments on idle event streams
+TASK_EVENTS_HEARTBEAT = 15
+
+
+@tasks_bp.route('/tasks/events', methods=['GET'])
+def stream_task_events():
+    """Server-Sent Events stream of task changes visible to the user.
+
+    Admins (role 11) receive every change; other users receive changes to
+    tasks they own or review. Event ids are change_seq watermarks, so after a
+    reconnect or a "resync" event the client catches up with
+    GET /tasks/changes?since=<last event id>.
+    """
+    user_id = request.args.get('user_id')
+    role_id = request.args.get('role_id')
+    
+    current_user = Actor.query.get(user_id) if user_id else None
+    if not current_user:
+        return jsonify({"error": "User not found"}), 404
+    actor_id = current_user.actor_id
+    
+    # Release the DB connection, the stream itself never touches the database
+    db.session.remove()
+    
+    subscriber = broker.subscribe(actor_id, is_admin=role_id == "11")
+    print(f"Task event subscriber connected: actor {actor_id}")
+    
+    def generate():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                if subscriber.overflowed:
+                    yield "event: resync\ndata: {}\n\n"
+                    return
+                try:
+                    task_event = subscriber.events.get(timeout=TASK_EVENTS_HEARTBEAT)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                payload = json.dumps(public_event(task_event))
+                yield f"id: {task_event['change_seq']}\nevent: task\ndata: {payload}\n\n"
+        finally:
+            broker.unsubscribe(subscriber)
+            print(f"Task event subscriber disconnected: actor {actor_id}")
+    
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
 def map_status(status):
     """Map the status from the database to a user-friendly format."""
     status_mapping = {
@@ -106,10 +433,6 @@ def map_status(status):
     return status_mapping.get(status, 'todo')
 
 
-def calculate_new_duedate(start_date, iteration, frequency):
-    """Calculate the new due date based on frequency."""
-    return start_date + timedelta(days=(365 // frequency) * iteration)
-
 def is_weekend_or_holiday(date):
     """Check if the date is a weekend or in the holidays list."""
     return date.weekday() >= 5  # Saturday (5) or Sunday (6)
@@ -132,17 +455,21 @@ def schedule_email_reminder(subject, task, email, reminder_date, email_type='rem
         reminder_time = time(9, 0)  # 9:00 AM
         
         # Create new reminder entry
-        new_reminder = ReminderMail(
-            task_id=task.task_id,
-            message_des=f"{task.task_name} for {task.customer_name}",
-            date=reminder_date,
-            time=reminder_time,
-            email_id=email,
-            status="Pending",
-            email_type=email_type
-        )
-        
-        db.session.add(new_reminder)
+        new_reminder = {
+            'task_id': task.task_id,
+            'message_des': f"{task.task_name} for {task.customer_name}",
+            'date': reminder_date,
+            'time': reminder_time,
+            'email_id': email,
+            'status': "Pending",
+            'subject': subject,
+            'email_type': email_type
+        }
+        new_reminder['idempotency_key'] = idempotency_key(
+            new_reminder['task_id'], new_reminder['email_type'], email, reminder_date, reminder_time)
+        
+        # A reminder that is already scheduled is skipped (see idempotency.py)
+        db.session.execute(insert_ignoring_duplicates(ReminderMail), [new_reminder])
         db.session.commit()
         
         print(f"✅ Reminder scheduled for {reminder_date} at {reminder_time} to {email}")
@@ -179,42 +506,16 @@ def calculate_reminder_date(due_date, duration):
         
     return reminder_date
 
-def send_styled_email(recipient, subject, content):
+def queue_styled_email(recipient, subject, lines):
+    """Queue a notification with one paragraph per line in the current transaction (see outbox.py)"""
+    return queue_notification(recipient, subject, render_email('notification.html', lines=lines),
+                              digest_text="\n".join(lines))
+
+def send_styled_email(recipient, subject, lines):
     try:
-        # Define HTML email template with CSS in a proper Python string
-        html_content = f"""
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                /* Add other CSS styles here with double braces {{ }} for literal braces */
-            </style>
-        </head>
-        <body>
-            {content}
-        </body>
-        </html>
-        """
-        
-        # Email configuration
-        sender_email = "loukyarao68@gmail.com"
-        password = "vafx kqve dwmj mvjv"
-        
-        # Create message container with the correct format for HTML emails
-        msg = MIMEMultipart()
-        msg['Subject'] = subject
-        msg['From'] = sender_email
-        msg['To'] = recipient
-        
-        # Attach HTML content
-        html_part = MIMEText(html_content, 'html')
-        msg.attach(html_part)
-        
-        # Send the email
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()
-            server.login(sender_email, password)
-            server.send_message(msg)
+        # Send through the shared mailer (see mailer.py)
+        if not mailer.send_email(recipient, subject, render_email('notification.html', lines=lines), content_type='html'):
+            raise RuntimeError("mail server did not accept the message")
             
         print(f"✅ Email sent successfully to {recipient}")
         return True
@@ -223,56 +524,11 @@ def send_styled_email(recipient, subject, content):
         traceback.print_exc()
         return False
 
-def send_email_task(subject, to_email, task, email_type='reminder'):
-    """Send an email notification about a task"""
-    try:
-        # Use the styled email function
-        success = send_styled_email(to_email, subject, content)
-        
-        # Log the email status in the database
-        try:
-            if success:
-                db.session.query(ReminderMail).filter_by(
-                    email_id=to_email,
-                    task_id=task.task_id,
-                    status="Pending"
-                ).update({'status': 'Sent'})
-            else:
-                db.session.query(ReminderMail).filter_by(
-                    email_id=to_email,
-                    task_id=task.task_id,
-                    status="Pending"
-                ).update({'status': 'Failed'})
-                
-            db.session.commit()
-        except Exception as update_error:
-            logging.error(f"Error updating reminder status: {update_error}")
-            
-        return success
-    except Exception as e:
-        logging.error(f"Error in send_email_task: {e}")
-        return False
-
 def send_email(subject, recipient, body):
-    """Send an email using SMTP"""
+    """Send an email through the shared mailer (see mailer.py)"""
     try:
-        # Email configuration
-        sender_email = "loukyarao68@gmail.com"  # Replace with your email
-        password = "vafx kqve dwmj mvjv" # Replace with your app-specific password
-        
-        # Create message
-        message = MIMEMultipart()
-        message["From"] = sender_email
-        message["To"] = recipient
-        message["Subject"] = subject
-        
-        # Add body to email
-        message.attach(MIMEText(body, "plain"))
-        
-        # Connect to server and send email
-        with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
-            server.login(sender_email, password)
-            server.sendmail(sender_email, recipient, message.as_string())
+        if not mailer.send_email(recipient, subject, body):
+            raise RuntimeError("mail server did not accept the message")
             
         print(f"✅ Email sent successfully to {recipient}")
         return True
@@ -304,29 +560,183 @@ def adjust_due_date(date, criticality):
         print(f"🚨 ERROR in adjust_due_date: {e}")
         return date  # Return original date if an error occurs
 
+def calculate_times_taken(task_ids):
+    """Total hours logged in diary1 for each task, in a single query.
+
+    Returns a dict keyed by the task id as a string; tasks without diary
+    records map to 0.0.
+    """
+    task_keys = [str(task_id) for task_id in task_ids]
+    totals = dict.fromkeys(task_keys, 0.0)
+    if not task_keys:
+        return totals
+    
+    diary_records = Diary1.query.with_entities(
+        Diary1.task, Diary1.date, Diary1.start_time, Diary1.end_time
+    ).filter(Diary1.task.in_(task_keys)).all()
+    
+    for record in diary_records:
+        if record.start_time and record.end_time:
+            # Convert time strings to datetime objects
+            start = datetime.combine(record.date, record.start_time)
+            end = datetime.combine(record.date, record.end_time)
+            
+            # Calculate difference in hours
+            totals[record.task] += (end - start).total_seconds() / 3600
+    
+    return {task_key: round(total, 2) for task_key, total in totals.items()}
+
 def calculate_time_taken(task_id):
     """Calculate total time taken from diary1 records for a task"""
     try:
-        diary_records = Diary1.query.filter_by(task=str(task_id)).all()
-        total_time = 0.0
-       
-        for record in diary_records:
-            if record.start_time and record.end_time:
-                # Convert time strings to datetime objects
-                start = datetime.combine(record.date, record.start_time)
-                end = datetime.combine(record.date, record.end_time)
-               
-                # Calculate difference in hours
-                time_diff = (end - start).total_seconds() / 3600
-                total_time += time_diff
-       
-        return round(total_time, 2)
+        return calculate_times_taken([task_id])[str(task_id)]
     except Exception as e:
         print(f"Error calculating time taken: {e}")
         return 0.0
 
 
 
+# Largest number of tasks accepted by one bulk update
+MAX_BULK_TASK_UPDATES = 500
+
+# Fields a bulk update may change on each task, the ones update_task accepts
+BULK_UPDATABLE_FIELDS = ('status', 'reviewer_status', 'remarks')
+# Values the task board sets; reviewer_status may also be cleared
+TASK_STATUSES = ('Yet to Start', 'WIP', 'Pending', 'Completed')
+REVIEWER_STATUSES = ('under_review', 'accepted', 'rejected')
+
+
+def invalid_bulk_change(field, value):
+    """Error message for a value a bulk update may not set, None when it is allowed"""
+    if field == 'status' and value not in TASK_STATUSES:
+        return f"status must be one of {', '.join(TASK_STATUSES)}"
+    if field == 'reviewer_status' and value not in REVIEWER_STATUSES + (None, ''):
+        return f"reviewer_status must be one of {', '.join(REVIEWER_STATUSES)} or empty"
+    if field == 'remarks' and value is not None and not isinstance(value, str):
+        return "remarks must be a string"
+    return None
+
+
+@tasks_bp.route('/tasks/bulk', methods=['PATCH'])
+@cross_origin()
+def bulk_update_tasks():
+    """Apply changes to many tasks in one transaction.
+
+    Body: {"updates": [{"id": "123", "status": "Completed", ...}, ...]}
+    Either every update is applied or none is. Notifications are grouped so
+    each assignee gets one email for the whole batch.
+    """
+    try:
+        user_id = request.args.get('user_id')
+        role_id = request.args.get('role_id')
+        
+        if not user_id or not role_id:
+            return jsonify({
+                "success": False,
+                "error": "Authentication required. Please provide user_id and role_id"
+            }), 401
+        
+        updates = (request.json or {}).get('updates')
+        if not isinstance(updates, list) or not updates:
+            return jsonify({"success": False, "error": "updates must be a non-empty list"}), 400
+        if len(updates) > MAX_BULK_TASK_UPDATES:
+            return jsonify({
+                "success": False,
+                "error": f"At most {MAX_BULK_TASK_UPDATES} tasks can be updated at once"
+            }), 400
+        
+        changes_by_id = {}
+        for update in updates:
+            if not isinstance(update, dict) or update.get('id') in (None, ''):
+                return jsonify({"success": False, "error": "Every update needs a task id"}), 400
+            changes = {field: update[field] for field in BULK_UPDATABLE_FIELDS if field in update}
+            for field, value in changes.items():
+                error = invalid_bulk_change(field, value)
+                if error:
+                    return jsonify({"success": False, "error": error, "task_ids": [str(update['id'])]}), 400
+            changes_by_id.setdefault(str(update['id']), {}).update(changes)
+        
+        # Load every task and check permissions with one query
+        tasks = Task.query.filter(Task.task_id.in_(list(changes_by_id))).all()
+        tasks_by_id = {str(task.task_id): task for task in tasks}
+        
+        missing = [task_id for task_id in changes_by_id if task_id not in tasks_by_id]
+        if missing:
+            return jsonify({"success": False, "error": "Tasks not found", "task_ids": missing}), 404
+        
+        if role_id != "11":
+            forbidden = [task_id for task_id, task in tasks_by_id.items() if str(task.actor_id) != str(user_id)]
+            if forbidden:
+                return jsonify({
+                    "success": False,
+                    "error": "You don't have permission to update these tasks",
+                    "task_ids": forbidden
+                }), 403
+        
+        # Diary totals for every task being completed, in one query
+        completing = [
+            task_id for task_id, changes in changes_by_id.items()
+            if changes.get('status') == 'Completed' and tasks_by_id[task_id].status != 'Completed'
+        ]
+        times_taken = calculate_times_taken(completing)
+        
+        notifications = {}
+        today = datetime.now().date()
+        for task_id, changes in changes_by_id.items():
+            task = tasks_by_id[task_id]
+            original_status = task.status
+            original_reviewer_status = task.reviewer_status
+            
+            for field, value in changes.items():
+                setattr(task, field, value)
+            
+            if task_id in times_taken:
+                task.time_taken = times_taken[task_id]
+                task.actual_date = today
+            
+            if task.status != original_status:
+                notifications.setdefault(task.actor_id, []).append(
+                    f"The status of your task '{task.task_name}' has been updated to '{task.status}'."
+                )
+            if task.reviewer_status != original_reviewer_status and task.reviewer_status is not None:
+                notifications.setdefault(task.actor_id, []).append(
+                    f"The review status of your task '{task.task_name}' has been updated to '{task.reviewer_status}'."
+                )
+        
+        # One email per assignee, queued in the same transaction as the updates
+        notifications_queued = 0
+        recipients = Actor.query.with_entities(Actor.actor_id, Actor.email_id).filter(
+            Actor.actor_id.in_([actor_id for actor_id in notifications if actor_id is not None])
+        ).all()
+        for recipient in recipients:
+            if not recipient.email_id:
+                continue
+            lines = notifications[recipient.actor_id]
+            subject = "Task Status Updated" if len(lines) == 1 else f"{len(lines)} Task Updates"
+            queue_styled_email(recipient.email_id, subject, lines)
+            notifications_queued += 1
+        
+        db.session.commit()
+        print(f"✅ Bulk updated {len(tasks_by_id)} tasks")
+        
+        return jsonify({
+            "success": True,
+            "message": f"{len(tasks_by_id)} tasks updated successfully",
+            "notifications_queued": notifications_queued,
+            "tasks": [{
+                "id": task.task_id,
+                "status": task.status,
+                "reviewer_status": task.reviewer_status,
+                "remarks": task.remarks
+            } for task in tasks_by_id.values()]
+        }), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        print(f"🚨 ERROR in bulk_update_tasks: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
 @tasks_bp.route('/tasks/<task_id>', methods=['PATCH'])
 @cross_origin()
 def update_task(task_id):
@@ -388,27 +798,23 @@ def update_task(task_id):
         if 'remarks' in data:
             task.remarks = data['remarks']
         
+        # Queue notifications in the same transaction as the update
+        assigned_actor = Actor.query.filter_by(actor_id=task.actor_id).first()
+        if assigned_actor and assigned_actor.email_id:
+            # Status update notification
+            if original_status != task.status:
+                subject = f"Task Status Updated: {task.task_name}"
+                queue_styled_email(assigned_actor.email_id, subject, [f"The status of your task '{task.task_name}' has been updated to '{task.status}'."])
+            
+            # Reviewer status update notification
+            if original_reviewer_status != task.reviewer_status and task.reviewer_status is not None:
+                subject = f"Task Review Status Updated: {task.task_name}"
+                queue_styled_email(assigned_actor.email_id, subject, [f"The review status of your task '{task.task_name}' has been updated to '{task.reviewer_status}'."])
+        
         # Save changes
         db.session.commit()
         print(f"✅ Successfully updated task {task_id}")
         
-        # Handle notifications (wrapped in try-except to prevent notification errors from failing the update)
-        try:
-            assigned_actor = Actor.query.filter_by(actor_id=task.actor_id).first()
-            if assigned_actor and assigned_actor.email_id:
-                # Send status update notification
-                if original_status != task.status:
-                    subject = f"Task Status Updated: {task.task_name}"
-                    send_styled_email(assigned_actor.email_id, subject, f"The status of your task '{task.task_name}' has been updated to '{task.status}'.")
-                
-                # Send reviewer status update notification
-                if original_reviewer_status != task.reviewer_status and task.reviewer_status is not None:
-                    subject = f"Task Review Status Updated: {task.task_name}"
-                    send_styled_email(assigned_actor.email_id, subject, f"The review status of your task '{task.task_name}' has been updated to '{task.reviewer_status}'.")
-        except Exception as e:
-            print(f"Warning: Failed to send notification: {e}")
-            # Continue execution even if notification fails
-        
         return jsonify({
             "success": True, 
             "message": "Task updated successfully",
@@ -450,6 +856,15 @@ def create_task():
             initiator=data.get('initiator', 'Admin')
         )
         
+        # Link the customer by id, looking it up by name for older clients
+        if data.get('customer_id'):
+            new_task.customer_id = data['customer_id']
+        elif data.get('customer_name'):
+            customer = Customer.query.with_entities(Customer.customer_id).filter_by(
+                customer_name=data['customer_name']
+            ).order_by(Customer.customer_id).first()
+            new_task.customer_id = customer.customer_id if customer else None
+        
         # If an assignee is provided, get the assignee name
         assignee_email = None
         if data.get('assignee'):
@@ -458,16 +873,15 @@ def create_task():
                 new_task.assigned_to = assignee.actor_name
                 assignee_email = assignee.email_id
         
-        # Add the task to the database
+        # Add the task to the database, with the assignment email in the same transaction
         db.session.add(new_task)
+        if assignee_email:
+            subject = f"ProSync - New Task Assignment: {new_task.task_name}"
+            queue_styled_email(assignee_email, subject, [f"A new task '{new_task.task_name}' has been assigned to you for customer '{new_task.customer_name}'."])
         db.session.commit()
         
-        # Send assignment email if there's an assignee
+        # Schedule reminders if there's an assignee
         if assignee_email:
-            subject = f"ProSync - New Task Assignment: {new_task.task_name}"
-            send_styled_email(assignee_email, subject, f"A new task '{new_task.task_name}' has been assigned to you for customer '{new_task.customer_name}'.")
-            
-            # Also schedule reminder emails
             if new_task.duedate:
                 # Calculate reminder date
                 reminder_date = calculate_reminder_date(new_task.duedate, new_task.duration)
@@ -781,7 +1195,7 @@ def update_review_status(task_id):
             return jsonify({"success": False, "error": "Task not found"}), 404
         
         # Get the reviewer
-        reviewer = Actor.query.filter_by(actor_name=task.reviewer).first()
+        reviewer = Actor.query.get(task.reviewer_id) if task.reviewer_id else None
         if not reviewer:
             return jsonify({"success": False, "error": "Reviewer not found for this task"}), 404
         
@@ -820,47 +1234,35 @@ def update_review_status(task_id):
             task.status = 'Yet to Start'
             print(f"Task status updated from {previous_status} to Yet to Start for reassignment")
         
+        # Notify the task owner in the same transaction as the review
+        task_owner = Actor.query.filter_by(actor_id=task.actor_id).first()
+        if task_owner and task_owner.email_id:
+            subject = f"Task Review Update: {task.task_name}"
+            status_message = ""
+            if new_status == 'approved':
+                status_message = "The task has been approved and marked as completed."
+            elif new_status == 'rejected':
+                status_message = "The task has been rejected and requires reassignment."
+            elif new_status == 'changes_requested':
+                status_message = "Changes have been requested for the task."
+            
+            email_content = render_email(
+                'review_status_updated.txt',
+                owner_name=task_owner.actor_name,
+                task=task,
+                new_status=new_status,
+                status_message=status_message,
+                review_comments=review_comments
+            )
+
+            queue_notification(task_owner.email_id, subject, email_content, content_type='plain',
+                               digest_text=email_content)
+
         # Save changes
         db.session.commit()
         
         print(f"✅ Successfully updated review status to {new_status} for task {task_id}")
         
-        # Notify the task owner by email
-        try:
-            task_owner = Actor.query.filter_by(actor_id=task.actor_id).first()
-            if task_owner and task_owner.email_id:
-                subject = f"Task Review Update: {task.task_name}"
-                status_message = ""
-                if new_status == 'approved':
-                    status_message = "The task has been approved and marked as completed."
-                elif new_status == 'rejected':
-                    status_message = "The task has been rejected and requires reassignment."
-                elif new_status == 'changes_requested':
-                    status_message = "Changes have been requested for the task."
-                
-                email_content = f"""Dear {task_owner.actor_name},
-
-The review status for task '{task.task_name}' has been updated to '{new_status}'.
-{status_message}
-
-REVIEW DETAILS:
-- Reviewer: {task.reviewer}
-- Status: {new_status}
-- Comments: {review_comments}
-
-Please log into the ProSync system to view the complete details.
-
-You can view the task at: http://localhost:3000/tasks
-
-Best regards,
-ProSync Team"""
-
-                send_email(subject, task_owner.email_id, email_content)
-                print(f"✅ Review status update notification sent to {task_owner.actor_name}")
-        except Exception as e:
-            print(f"Warning: Failed to send review status notification: {e}")
-            # Continue execution even if notification fails
-        
         return jsonify({
             "success": True, 
             "message": "Review status updated successfully",
@@ -880,6 +1282,7 @@ ProSync Team"""
         return jsonify({"success": False, "error": str(e)}), 500
 
 @tasks_bp.route('/reviewers', methods=['GET'])
+@etag_cached('actors')
 def get_reviewers():
     try:
         # Get query parameters
@@ -949,42 +1352,22 @@ def assign_reviewer(task_id):
         
         # Update the task with the reviewer
         task.reviewer = reviewer.actor_name
+        task.reviewer_id = reviewer.actor_id
         task.reviewer_status = 'under_review'  # Set initial status
         
+        # Notify the reviewer in the same transaction as the assignment
+        if reviewer.email_id:
+            subject = f"Task Review Request: {task.task_name}"
+            email_content = render_email('review_requested.txt', reviewer_name=reviewer.actor_name, task=task)
+
+            queue_notification(reviewer.email_id, subject, email_content, content_type='plain',
+                               digest_text=email_content)
+
         # Save changes
         db.session.commit()
         
         print(f"✅ Successfully assigned reviewer {reviewer.actor_name} to task {task_id}")
         
-        # Notify the reviewer by email
-        try:
-            if reviewer.email_id:
-                subject = f"Task Review Request: {task.task_name}"
-                email_content = f"""Dear {reviewer.actor_name},
-
-You have been assigned to review the task '{task.task_name}' for customer '{task.customer_name}'.
-
-TASK DETAILS:
-- Task Name: {task.task_name}
-- Task ID: {task.task_id}
-- Criticality: {task.criticality}
-- Due Date: {task.duedate.strftime('%Y-%m-%d') if task.duedate else 'Not specified'}
-- Assignee: {task.assigned_to}
-- Status: {task.status}
-
-Please review this task and provide your feedback by logging into the ProSync system.
-
-You can review the task at: http://localhost:3000/tasks
-
-Best regards,
-ProSync Team"""
-
-                send_email(subject, reviewer.email_id, email_content)
-                print(f"✅ Review request notification sent to {reviewer.actor_name}")
-        except Exception as e:
-            print(f"Warning: Failed to send review request notification: {e}")
-            # Continue execution even if notification fails
-        
         return jsonify({
             "success": True, 
             "message": "Reviewer assigned successfully",
@@ -0,0 +1,178 @@
+"""
+In-process fan-out of task change events for the Server-Sent Events stream.
+
+Task rows written through the ORM are captured after each flush and published
+to subscribers once the transaction commits (nothing is published on
+rollback). Each subscriber is a bounded queue owned by one open
+GET /tasks/events response; no database connection is held while streaming.
+
+Events only reach subscribers in the same process. Clients that reconnect, or
+that were served by another worker, catch up through GET /tasks/changes using
+the last event id as the watermark.
+
+Whenever a task's assignee, reviewer or customer changes, the previous values
+are also written to task_scope_changes in the same flush, so that feed can
+tell users who lost sight of a task to remove it. Those rows are only kept
+for the last ``TASK_CHANGE_FEED_RETENTION`` task change sequence numbers:
+the outbox dispatcher prunes older ones (``prune_scope_changes``) and the
+feed asks clients with an older watermark to resync.
+"""
+
+import os
+import queue
+import threading
+
+from sqlalchemy import event, inspect, insert
+from sqlalchemy.orm import Session
+
+from etags import get_table_versions
+from models import db, Task, TaskScopeChange
+
+# Events buffered per subscriber before it is considered too slow
+SUBSCRIBER_QUEUE_SIZE = 200
+# Task change sequence numbers (one per committed task write) a change feed
+# watermark stays valid for
+TASK_CHANGE_FEED_RETENTION = int(os.environ.get('TASK_CHANGE_FEED_RETENTION', 100000))
+
+
+class Subscriber:
+    """One connected client and the tasks it is allowed to see"""
+
+    def __init__(self, actor_id, is_admin):
+        self.actor_id = str(actor_id)
+        self.is_admin = is_admin
+        self.events = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        # Set when events were dropped; the client must resync via /tasks/changes
+        self.overflowed = False
+
+    def wants(self, task_event):
+        if self.is_admin:
+            return True
+        return self.actor_id in task_event['actor_ids'] or self.actor_id in task_event['reviewer_ids']
+
+
+class TaskEventBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def subscribe(self, actor_id, is_admin):
+        subscriber = Subscriber(actor_id, is_admin)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, task_events):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            for task_event in task_events:
+                if not subscriber.wants(task_event):
+                    continue
+                try:
+                    subscriber.events.put_nowait(task_event)
+                except queue.Full:
+                    subscriber.overflowed = True
+
+
+broker = TaskEventBroker()
+
+
+def _values_before_and_after(state, attribute):
+    history = state.attrs[attribute].history
+    values = list(history.added) + list(history.unchanged) + list(history.deleted)
+    return {str(value) for value in values if value is not None}
+
+
+def _snapshot(task, created):
+    state = inspect(task)
+    return {
+        'type': 'created' if created else 'updated',
+        'task_id': str(task.task_id),
+        'change_seq': task.change_seq,
+        'status': task.status,
+        'reviewer_status': task.reviewer_status,
+        'reviewer': task.reviewer,
+        'reviewer_id': str(task.reviewer_id) if task.reviewer_id is not None else None,
+        'actor_id': str(task.actor_id) if task.actor_id is not None else None,
+        # Previous owner and reviewer also hear about the change
+        'actor_ids': _values_before_and_after(state, 'actor_id'),
+        'reviewer_ids': _values_before_and_after(state, 'reviewer_id'),
+    }
+
+
+# Columns that decide who sees a task (see routes/tasks.filter_visible_tasks)
+SCOPE_ATTRIBUTES = ('actor_id', 'reviewer_id', 'customer_id')
+
+
+def _value_before(state, attribute):
+    history = state.attrs[attribute].history
+    values = list(history.deleted) or list(history.unchanged) or list(history.added)
+    return values[0] if values else None
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_scope_changes(session, flush_context):
+    rows = []
+    for obj in session.dirty:
+        if not isinstance(obj, Task):
+            continue
+        state = inspect(obj)
+        if any(state.attrs[attribute].history.deleted for attribute in SCOPE_ATTRIBUTES):
+            rows.append(dict(
+                {attribute: _value_before(state, attribute) for attribute in SCOPE_ATTRIBUTES},
+                task_id=obj.task_id, change_seq=obj.change_seq
+            ))
+    if rows:
+        session.connection().execute(insert(TaskScopeChange.__table__), rows)
+
+
+def change_feed_horizon(current_seq, retention=TASK_CHANGE_FEED_RETENTION):
+    """Oldest change_seq whose scope changes are kept; older watermarks must resync"""
+    return max(0, current_seq - retention)
+
+
+def prune_scope_changes(retention=TASK_CHANGE_FEED_RETENTION):
+    """Delete scope changes below the change feed horizon and commit, returns how many"""
+    horizon = change_feed_horizon(get_table_versions(['tasks'])['tasks'], retention)
+    deleted = TaskScopeChange.query.filter(TaskScopeChange.change_seq < horizon).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+@event.listens_for(Session, 'after_flush')
+def _capture_task_changes(session, flush_context):
+    if not broker.subscriber_count():
+        return
+    pending = session.info.setdefault('task_events', [])
+    for obj in session.new:
+        if isinstance(obj, Task):
+            pending.append(_snapshot(obj, created=True))
+    for obj in session.dirty:
+        if isinstance(obj, Task) and session.is_modified(obj, include_collections=False):
+            pending.append(_snapshot(obj, created=False))
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_task_changes(session):
+    pending = session.info.pop('task_events', None)
+    if pending:
+        broker.publish(pending)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_task_changes(session):
+    session.info.pop('task_events', None)
+
+
+def public_event(task_event):
+    """Event payload sent to clients, without the internal routing sets"""
+    return {key: value for key, value in task_event.items() if key not in ('actor_ids', 'reviewer_ids')}